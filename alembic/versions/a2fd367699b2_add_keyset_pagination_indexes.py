@@ -0,0 +1,31 @@
+"""add keyset pagination indexes
+
+Revision ID: a2fd367699b2
+Revises: f0e6a34333ab
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2fd367699b2'
+down_revision: Union[str, Sequence[str], None] = 'f0e6a34333ab'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ORDER BY (branch_id, id) / (name, id) + WHERE (..) > (..) ใช้ index พวกนี้แทนการสแกนแถวที่ข้าม
+    op.create_index('ix_products_branch_id_id', 'products', ['branch_id', 'id'], unique=False)
+    op.create_index('ix_products_name_id', 'products', ['name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_name_id', table_name='products')
+    op.drop_index('ix_products_branch_id_id', table_name='products')
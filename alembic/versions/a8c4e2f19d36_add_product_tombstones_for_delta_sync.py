@@ -0,0 +1,46 @@
+"""add product_tombstones and change index for delta sync
+
+Revision ID: a8c4e2f19d36
+Revises: f3b6c81e2d94
+Create Date: 2026-10-18 13:02:17.415208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8c4e2f19d36'
+down_revision: Union[str, Sequence[str], None] = 'f3b6c81e2d94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'product_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('branch_id', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['branch_id'], ['branches.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_product_tombstones_branch_deleted', 'product_tombstones',
+        ['branch_id', 'deleted_at', 'id'], unique=False,
+    )
+    op.create_index(
+        'ix_products_branch_changed', 'products',
+        ['branch_id', sa.text('coalesce(updated_at, created_at)'), 'id'], unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_branch_changed', table_name='products')
+    op.drop_index('ix_product_tombstones_branch_deleted', table_name='product_tombstones')
+    op.drop_table('product_tombstones')
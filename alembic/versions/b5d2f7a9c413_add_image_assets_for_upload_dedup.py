@@ -0,0 +1,38 @@
+"""add image_assets for content-addressed upload dedup
+
+Revision ID: b5d2f7a9c413
+Revises: a8c4e2f19d36
+Create Date: 2026-10-18 13:41:06.582931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d2f7a9c413'
+down_revision: Union[str, Sequence[str], None] = 'a8c4e2f19d36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'image_assets',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('image_url', sa.String(length=512), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=True),
+        sa.Column('size_bytes', sa.Integer(), nullable=False),
+        sa.Column('hit_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('last_hit_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('sha256'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('image_assets')
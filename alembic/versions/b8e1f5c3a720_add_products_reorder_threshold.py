@@ -0,0 +1,40 @@
+"""add products.reorder_threshold + partial low-stock index
+
+Revision ID: b8e1f5c3a720
+Revises: e4a7c2d9b163
+Create Date: 2026-10-18 17:05:12.734019
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e1f5c3a720'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c2d9b163'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# เท่ากับ LOW_STOCK_THRESHOLD เดิม → low_stock_count ใน inventory_summary ไม่ต้องคำนวณใหม่
+DEFAULT_THRESHOLD = 5
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column(
+        'reorder_threshold', sa.Integer(), nullable=False, server_default=str(DEFAULT_THRESHOLD),
+    ))
+    # index มีเฉพาะแถวที่ใกล้หมด → GET /products/low-stock ไม่ต้อง scan ทั้งตาราง
+    op.create_index(
+        'ix_products_low_stock', 'products', ['branch_id', 'quantity', 'id'],
+        postgresql_where=sa.text('quantity <= reorder_threshold'),
+        sqlite_where=sa.text('quantity <= reorder_threshold'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_low_stock', table_name='products')
+    op.drop_column('products', 'reorder_threshold')
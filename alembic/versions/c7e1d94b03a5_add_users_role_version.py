@@ -0,0 +1,28 @@
+"""add users.role_version
+
+Revision ID: c7e1d94b03a5
+Revises: a2fd367699b2
+Create Date: 2026-10-18 10:02:11.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e1d94b03a5'
+down_revision: Union[str, Sequence[str], None] = 'a2fd367699b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('role_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'role_version')
@@ -0,0 +1,53 @@
+"""add inventory_summary aggregate table
+
+Revision ID: c9a3d5e71b28
+Revises: b5d2f7a9c413
+Create Date: 2026-10-18 14:20:44.107356
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9a3d5e71b28'
+down_revision: Union[str, Sequence[str], None] = 'b5d2f7a9c413'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'inventory_summary',
+        sa.Column('branch_id', sa.Integer(), nullable=False),
+        sa.Column('category', sa.String(length=100), nullable=False),
+        sa.Column('product_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('total_quantity', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('total_value', sa.Float(), server_default='0', nullable=False),
+        sa.Column('low_stock_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('out_of_stock_count', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['branch_id'], ['branches.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('branch_id', 'category'),
+    )
+    # เติมค่าเริ่มต้นจากข้อมูลที่มีอยู่ (threshold สต็อกต่ำ = 5 เท่ากับ notification_dispatcher.LOW_STOCK_THRESHOLD)
+    op.execute("""
+        INSERT INTO inventory_summary
+            (branch_id, category, product_count, total_quantity, total_value, low_stock_count, out_of_stock_count)
+        SELECT branch_id,
+               coalesce(category, ''),
+               count(*),
+               coalesce(sum(quantity), 0),
+               coalesce(sum(price * quantity), 0),
+               sum(CASE WHEN quantity <= 5 THEN 1 ELSE 0 END),
+               sum(CASE WHEN quantity = 0 THEN 1 ELSE 0 END)
+        FROM products
+        GROUP BY branch_id, coalesce(category, '')
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('inventory_summary')
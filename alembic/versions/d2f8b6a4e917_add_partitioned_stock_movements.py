@@ -0,0 +1,86 @@
+"""add stock_movements ledger (range-partitioned by month)
+
+Revision ID: d2f8b6a4e917
+Revises: c9a3d5e71b28
+Create Date: 2026-10-18 15:03:29.660418
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f8b6a4e917'
+down_revision: Union[str, Sequence[str], None] = 'c9a3d5e71b28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# partition ที่สร้างตอน migrate (เดือนปัจจุบัน + ล่วงหน้า) — เดือนถัด ๆ ไปแอปสร้างเองตอน start
+MONTHS_AHEAD = 3
+
+
+def _month_start(day: date, months: int = 0) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        # ฐานข้อมูลอื่น (เช่น SQLite) แบ่ง partition ไม่ได้ → ตารางธรรมดา ตรงกับ models.StockMovement
+        op.create_table(
+            'stock_movements',
+            sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('branch_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('delta', sa.Integer(), nullable=False),
+            sa.Column('quantity_after', sa.Integer(), nullable=False),
+            sa.Column('reason', sa.String(length=32), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        )
+        op.create_index('ix_stock_movements_product_created', 'stock_movements', ['product_id', 'created_at'])
+        return
+
+    # PK ต้องมีคีย์ partition (created_at) ด้วย
+    op.execute("""
+        CREATE TABLE stock_movements (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+            product_id INTEGER NOT NULL,
+            branch_id INTEGER NOT NULL,
+            user_id INTEGER,
+            delta INTEGER NOT NULL,
+            quantity_after INTEGER NOT NULL,
+            reason VARCHAR(32) NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    # กันไม่ให้ insert ล้มถ้าเดือนนั้นยังไม่มี partition
+    op.execute("CREATE TABLE stock_movements_default PARTITION OF stock_movements DEFAULT")
+
+    today = date.today()
+    for i in range(MONTHS_AHEAD + 1):
+        start, end = _month_start(today, i), _month_start(today, i + 1)
+        op.execute(
+            f"CREATE TABLE stock_movements_y{start:%Y}m{start:%m} PARTITION OF stock_movements "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+    # index บนตารางแม่ → ถูกสร้างในทุก partition (รวมที่สร้างทีหลัง) อัตโนมัติ
+    op.create_index('ix_stock_movements_created_brin', 'stock_movements', ['created_at'], postgresql_using='brin')
+    op.create_index('ix_stock_movements_product_created', 'stock_movements', ['product_id', 'created_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        op.drop_index('ix_stock_movements_product_created', table_name='stock_movements')
+        op.drop_table('stock_movements')
+        return
+    op.execute("DROP TABLE stock_movements")   # partition ทั้งหมดถูกลบไปด้วย
@@ -0,0 +1,40 @@
+"""add unique natural key (name, branch_id) on products
+
+Revision ID: d41b8a2e6f17
+Revises: c7e1d94b03a5
+Create Date: 2026-10-18 10:48:37.204561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41b8a2e6f17'
+down_revision: Union[str, Sequence[str], None] = 'c7e1d94b03a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+
+    # ไม่ลบข้อมูลเอง — ถ้ามีชื่อสินค้าซ้ำในสาขาเดียวกันให้รวม/แก้ก่อนแล้วค่อยรันใหม่
+    dup = conn.execute(sa.text("""
+        SELECT name, branch_id, COUNT(*) FROM products
+        GROUP BY name, branch_id HAVING COUNT(*) > 1
+        LIMIT 5
+    """)).fetchall()
+    if dup:
+        raise RuntimeError(f"Duplicate (name, branch_id) in products, resolve before upgrading: {dup}")
+
+    # ใช้เป็น conflict target ของ bulk upsert (INSERT ... ON CONFLICT (name, branch_id))
+    op.create_index('uq_products_name_branch', 'products', ['name', 'branch_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_products_name_branch', table_name='products')
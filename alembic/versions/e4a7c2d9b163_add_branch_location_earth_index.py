@@ -0,0 +1,43 @@
+"""add earthdistance GiST index on branch locations
+
+Revision ID: e4a7c2d9b163
+Revises: d2f8b6a4e917
+Create Date: 2026-10-18 16:12:47.208395
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c2d9b163'
+down_revision: Union[str, Sequence[str], None] = 'd2f8b6a4e917'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        return   # ฐานข้อมูลอื่นใช้ geo_index (KD-tree ในหน่วยความจำ) แทน
+
+    conn.execute(sa.text("CREATE EXTENSION IF NOT EXISTS cube;"))
+    conn.execute(sa.text("CREATE EXTENSION IF NOT EXISTS earthdistance;"))
+    # สาขาที่ยังไม่ได้ตั้งพิกัดไม่อยู่ใน index
+    conn.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_branches_location_earth ON branches "
+        "USING gist (ll_to_earth(latitude, longitude)) "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL;"
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        return
+
+    conn.execute(sa.text("DROP INDEX IF EXISTS ix_branches_location_earth;"))
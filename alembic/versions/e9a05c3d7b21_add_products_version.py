@@ -0,0 +1,28 @@
+"""add products.version for optimistic stock adjustments
+
+Revision ID: e9a05c3d7b21
+Revises: d41b8a2e6f17
+Create Date: 2026-10-18 11:35:52.880143
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9a05c3d7b21'
+down_revision: Union[str, Sequence[str], None] = 'd41b8a2e6f17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('products', 'version')
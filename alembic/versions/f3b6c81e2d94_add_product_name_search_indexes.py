@@ -0,0 +1,45 @@
+"""add pg_trgm search indexes on products.name
+
+Revision ID: f3b6c81e2d94
+Revises: e9a05c3d7b21
+Create Date: 2026-10-18 13:20:05.611482
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b6c81e2d94'
+down_revision: Union[str, Sequence[str], None] = 'e9a05c3d7b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        return   # ฐานข้อมูลอื่นใช้ search_index ในหน่วยความจำแทน
+
+    conn.execute(sa.text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+    # ILIKE '%...%' และ word similarity (<%) ใช้ GIN trigram index ได้ — ไม่ต้อง seq scan ทั้งตาราง
+    conn.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops);"
+    ))
+    # autocomplete: lower(name) LIKE 'abc%'
+    conn.execute(sa.text(
+        "CREATE INDEX IF NOT EXISTS ix_products_name_lower_prefix ON products (lower(name) text_pattern_ops);"
+    ))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    conn = op.get_bind()
+    if conn.dialect.name != "postgresql":
+        return
+
+    conn.execute(sa.text("DROP INDEX IF EXISTS ix_products_name_lower_prefix;"))
+    conn.execute(sa.text("DROP INDEX IF EXISTS ix_products_name_trgm;"))
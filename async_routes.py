@@ -0,0 +1,255 @@
+# async_routes.py
+"""
+Handler แบบ async ของ endpoint สินค้า/สาขา (ใช้ AsyncSession) — เปิดด้วย DB_ASYNC=1
+
+install(app) จะแทนที่ route แบบ sync ที่ path + method เดียวกันใน main.py
+โดยคงตำแหน่งเดิมไว้ (ลำดับการ match ของ route อื่นไม่เปลี่ยน)
+"""
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal
+
+import schemas, crud, crud_async, response_cache
+from crud import StockAdjustError
+from database import get_async_db
+from models import BranchRoleEnum as BranchRole
+from notification_dispatcher import notify_stock_level
+from permissions import AuthContext, get_auth_context_async, get_claims_context_async, restrict_patch
+
+router = APIRouter()
+
+
+async def require_owner_async(user: AuthContext = Depends(get_auth_context_async)) -> AuthContext:
+    if not user.is_owner:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Owner only access")
+    return user
+
+
+# ---------- Branches ----------
+@router.get("/branches/", response_model=List[schemas.Branch])
+async def read_branches(
+    db: AsyncSession = Depends(get_async_db),
+    mine: bool = Query(False),
+    user: AuthContext = Depends(get_claims_context_async),
+):
+    return await crud_async.get_branches(db, member_user_id=user.id if mine and not user.is_owner else None)
+
+@router.post("/branches/", response_model=schemas.Branch, status_code=201)
+async def create_branch(
+    branch: schemas.BranchCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(require_owner_async),
+):
+    return await crud_async.create_branch(db, branch)
+
+@router.put("/branches/{branch_id}", response_model=schemas.Branch)
+async def update_branch(
+    branch_id: int,
+    data: schemas.BranchUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(require_owner_async),
+):
+    obj = await crud_async.update_branch(db, branch_id, data)
+    if not obj:
+        raise HTTPException(status_code=404, detail="Branch not found")
+    return obj
+
+@router.delete("/branches/{branch_id}", status_code=204)
+async def delete_branch(
+    branch_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(require_owner_async),
+):
+    ok = await crud_async.delete_branch(db, branch_id)
+    if not ok:
+        raise HTTPException(status_code=404, detail="Branch not found")
+    return
+
+
+# ---------- Products ----------
+@router.post("/products/", response_model=schemas.Product)
+async def create_product(
+    product: schemas.ProductCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(get_auth_context_async),
+):
+    user.require_branch(product.branch_id, min_role=BranchRole.MANAGER)
+    try:
+        return await crud_async.create_product(db, product, user_id=user.id)
+    except crud.DuplicateProductError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.get("/products/")
+async def read_products(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, gt=0, le=1000),
+    name: str | None = None,
+    category: str | None = None,
+    min_price: float | None = Query(None, ge=0),
+    max_price: float | None = Query(None, ge=0),
+    branch_id: int | None = Query(None),
+    paginate: Literal["offset", "cursor"] = Query("offset"),
+    order_by: Literal["id", "branch", "name"] | None = Query(None),
+    cursor: str | None = Query(None),
+    fields: str | None = Query(None),
+    mine: bool = Query(False),
+    user: AuthContext = Depends(get_claims_context_async),
+):
+    member_user_id = user.id if mine and not user.is_owner else None
+    if not user.is_owner:
+        if branch_id is None and member_user_id is None:
+            raise HTTPException(400, "branch_id is required for non-owner (or use mine=true)")
+        if branch_id is not None:
+            user.require_branch(branch_id)
+    order_by = order_by or ("branch" if mine else "id")
+
+    try:
+        fields = crud.parse_product_fields(fields)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    filters = dict(
+        name=name,
+        category=category,
+        min_price=min_price,
+        max_price=max_price,
+        branch_id=branch_id,
+        member_user_id=member_user_id,
+    )
+
+    if member_user_id is not None and branch_id is None:
+        scope = response_cache.scopes_of(user.branch_roles)
+    else:
+        scope = response_cache.scope_of(branch_id)
+    key = response_cache.cache_key(
+        scope,
+        skip=skip, limit=limit, paginate=paginate, order_by=order_by, cursor=cursor, fields=fields, **filters,
+    )
+    entry = response_cache.lookup(key)
+    if entry is not None:
+        return response_cache.respond(request, entry, hit=True)
+
+    columns = crud.product_columns(fields, order_by)
+    if paginate == "cursor" or cursor is not None:
+        try:
+            data = await crud_async.get_products_page(db, limit=limit, order_by=order_by, cursor=cursor, columns=columns, **filters)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    else:
+        data = await crud_async.get_product_rows(db, skip=skip, limit=limit, order_by=order_by, columns=columns, **filters)
+    return response_cache.respond(request, response_cache.store(key, data, fields), hit=False)
+
+@router.post("/products/adjust", response_model=List[schemas.StockLevel])
+async def adjust_stock_batch(
+    items: List[schemas.StockAdjustmentItem],
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(get_auth_context_async),
+):
+    branch_ids = None if user.is_owner else list(user.branch_roles)
+    try:
+        rows = await crud_async.adjust_stock_batch(db, items, branch_ids=branch_ids, user_id=user.id)
+    except StockAdjustError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    for row in rows:
+        notify_stock_level(row)
+    return rows
+
+@router.get("/products/batch", response_model=schemas.ProductBatch)
+async def read_products_batch(
+    ids: str = Query(...),
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(get_claims_context_async),
+):
+    try:
+        ids = crud.parse_product_ids(ids)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    found = await crud_async.get_products_by_ids(db, ids)
+    allowed = user.member_branches({p.branch_id for p in found.values()})
+    return {
+        "items": [found[i] for i in ids if i in found and found[i].branch_id in allowed],
+        "missing": [i for i in ids if i not in found],
+        "forbidden": [i for i in ids if i in found and found[i].branch_id not in allowed],
+    }
+
+@router.get("/products/{product_id}", response_model=schemas.Product)
+async def read_product(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(get_claims_context_async),
+):
+    obj = await crud_async.get_product(db, product_id)
+    if not obj:
+        raise HTTPException(status_code=404, detail="Product not found")
+    user.require_branch(obj.branch_id)
+    return obj
+
+@router.put("/products/{product_id}", response_model=schemas.Product)
+async def update_product(
+    product_id: int,
+    patch: schemas.ProductUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(get_auth_context_async),
+):
+    current = await crud_async.get_product(db, product_id)
+    if not current:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    role = user.require_branch(current.branch_id)
+    try:
+        updated = await crud_async.update_product(db, product_id, restrict_patch(user, role, patch), user_id=user.id)
+    except crud.DuplicateProductError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    if patch.quantity is not None or patch.reorder_threshold is not None:
+        notify_stock_level(updated)
+    return updated
+
+@router.post("/products/{product_id}/adjust", response_model=schemas.StockLevel)
+async def adjust_stock(
+    product_id: int,
+    adj: schemas.StockAdjustment,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(get_auth_context_async),
+):
+    branch_ids = None if user.is_owner else list(user.branch_roles)
+    try:
+        row = await crud_async.adjust_stock(
+            db, product_id, adj.delta, adj.expected_version,
+            branch_ids=branch_ids, user_id=user.id, reason=adj.reason,
+        )
+    except StockAdjustError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    notify_stock_level(row)
+    return row
+
+@router.delete("/products/{product_id}")
+async def delete_product(
+    product_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    user: AuthContext = Depends(get_auth_context_async),
+):
+    obj = await crud_async.get_product(db, product_id)
+    if not obj:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    user.require_branch(obj.branch_id, min_role=BranchRole.MANAGER)
+    ok = await crud_async.delete_product(db, product_id, user_id=user.id)
+    return {"deleted": ok, "id": product_id}
+
+
+def install(app: FastAPI) -> None:
+    """
+    แทนที่ route sync ด้วยเวอร์ชัน async (path + method ต้องตรงกัน)
+    """
+    replacements = {(r.path, frozenset(r.methods)): r for r in router.routes}
+    for i, route in enumerate(app.router.routes):
+        key = (getattr(route, "path", None), frozenset(getattr(route, "methods", None) or ()))
+        if key in replacements:
+            app.router.routes[i] = replacements.pop(key)
+    if replacements:
+        raise RuntimeError(f"No sync route to replace for: {sorted(replacements)}")
@@ -1,15 +1,17 @@
 # auth.py
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from database import get_db
 from models import User, UserBranchRole, Branch, BranchRoleEnum, UserGlobalRole
-from passlib.hash import pbkdf2_sha256
 from pydantic import BaseModel
 import jwt, os
 from datetime import datetime, timedelta, timezone
 from schemas import RegisterRequest, LoginRequest
 from typing import Optional
+from cache import invalidate_user_roles
+import passwords
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
@@ -29,11 +31,15 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
 # -------- helpers --------
+# hash ใน process pool ของ passwords แบบ sync — สำหรับสคริปต์ (endpoint ใช้ passwords.*_async)
 def hash_password(raw: str) -> str:
-    return pbkdf2_sha256.hash(raw)
+    return passwords.hash_password(raw)
 
 def verify_password(raw: str, hashed: str) -> bool:
-    return pbkdf2_sha256.verify(raw, hashed)
+    return passwords.verify_and_update(raw, hashed)[0]
+
+def _password_error(e: passwords.PasswordHashError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": "1"})
 
 def create_access_token(data: dict, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES) -> str:
     to_encode = data.copy()
@@ -49,23 +55,29 @@ class TokenResponse(BaseModel):
 
 
 # -------- current user --------
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
+def decode_token(token: str) -> dict:
+    """
+    ตรวจลายเซ็น/วันหมดอายุของ JWT แล้วคืน payload (ต้องมี sub)
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if not username:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-        return user
-
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+    if not payload.get("sub"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    return payload
+
+
+def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> User:
+    payload = decode_token(token)
+    user = db.query(User).filter(User.username == payload["sub"]).first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    return user
+
 
 def require_owner(user: User = Depends(get_current_user)) -> User:
     if user.global_role != UserGlobalRole.OWNER:
@@ -74,23 +86,18 @@ def require_owner(user: User = Depends(get_current_user)) -> User:
 
 
 # -------- REGISTER --------
-@router.post("/register")
-def register_user(data: RegisterRequest, db: Session = Depends(get_db)):
-    # ป้องกันซ้ำ
-    if db.query(User).filter(User.username == data.username).first():
-        raise HTTPException(status_code=400, detail="Username already exists")
-
-    # ✅ แปลง role เป็นตัวเล็ก แล้ว map เป็น enum
-    normalized_role = (data.global_role or "").strip().lower()
-
-    try:
-        role_enum = UserGlobalRole(normalized_role)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid role")
-
+# register / login เป็น async: hash รอบน event loop (passwords.*_async) ไม่ยึด thread ระหว่างรอคิว
+# งาน DB ยังเป็น Session แบบ sync → รันใน threadpool ทีละช่วงสั้น ๆ และคืน connection ให้ pool ก่อนรอ hash
+# (ไม่งั้น login ที่รอคิวถือ connection ไว้หมด request อื่นรอ pool จน timeout)
+def _username_taken(db: Session, username: str) -> bool:
+    taken = db.query(User).filter(User.username == username).first() is not None
+    db.rollback()
+    return taken
+
+def _create_user(db: Session, data: RegisterRequest, role_enum: UserGlobalRole, password_hash: str) -> dict:
     new_user = User(
         username=data.username,
-        password_hash=hash_password(data.password),
+        password_hash=password_hash,
         global_role=role_enum,
         default_branch_id=data.default_branch_id,
     )
@@ -111,27 +118,72 @@ def register_user(data: RegisterRequest, db: Session = Depends(get_db)):
         link = UserBranchRole(user_id=new_user.id, branch_id=branch.id, role=branch_role)
         db.add(link)
         db.commit()
+        invalidate_user_roles(new_user.id)
 
     return {"message": "User registered successfully", "user_id": new_user.id}
 
+@router.post("/register")
+async def register_user(data: RegisterRequest, db: Session = Depends(get_db)):
+    # ป้องกันซ้ำ
+    if await run_in_threadpool(_username_taken, db, data.username):
+        raise HTTPException(status_code=400, detail="Username already exists")
+
+    # ✅ แปลง role เป็นตัวเล็ก แล้ว map เป็น enum
+    normalized_role = (data.global_role or "").strip().lower()
+
+    try:
+        role_enum = UserGlobalRole(normalized_role)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid role")
+
+    try:
+        password_hash = await passwords.hash_password_async(data.password)
+    except passwords.PasswordHashError as e:
+        raise _password_error(e)
+
+    return await run_in_threadpool(_create_user, db, data, role_enum, password_hash)
+
 
 # -------- LOGIN --------
-@router.post("/login", response_model=TokenResponse)
-def login_user(data: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == data.username).first()
-    if not user or not verify_password(data.password, user.password_hash):
-        raise HTTPException(status_code=401, detail="Invalid username or password")
+def _find_user(db: Session, username: str) -> tuple[Optional[User], Optional[str]]:
+    user = db.query(User).filter(User.username == username).first()
+    password_hash = user.password_hash if user else None
+    db.rollback()       # คืน connection (user ถูก expire → _issue_token โหลดใหม่ใน threadpool)
+    return user, password_hash
+
+def _issue_token(db: Session, user: User, new_hash: Optional[str]) -> dict:
+    if new_hash:
+        # hash เดิมเป็น bcrypt / cost ไม่ตรง PASSWORD_HASH_* ปัจจุบัน → เขียนทับด้วย hash ใหม่
+        user.password_hash = new_hash
+        db.commit()
+
+    # role ทุกสาขา → ใส่ไว้ใน token ให้ endpoint อ่านอย่างเดียวตรวจสิทธิ์ได้โดยไม่ต้องถาม DB
+    roles = db.query(UserBranchRole).filter(UserBranchRole.user_id == user.id).order_by(UserBranchRole.id).all()
 
     # ใช้ default_branch_id ถ้ามี, ไม่งั้นดึงจาก user_branch_roles
     branch_id = user.default_branch_id
     if branch_id is None:
-        ur = db.query(UserBranchRole).filter(UserBranchRole.user_id == user.id).first()
-        branch_id = ur.branch_id if ur else None
+        branch_id = roles[0].branch_id if roles else None
 
     token = create_access_token({
         "sub": user.username,
         "uid": user.id,
         "global_role": user.global_role.value,
         "branch_id": branch_id,
+        "roles": {str(r.branch_id): r.role.value for r in roles},
+        "rv": user.role_version,
     })
     return {"access_token": token, "token_type": "bearer"}
+
+@router.post("/login", response_model=TokenResponse)
+async def login_user(data: LoginRequest, db: Session = Depends(get_db)):
+    user, password_hash = await run_in_threadpool(_find_user, db, data.username)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    try:
+        valid, new_hash = await passwords.verify_and_update_async(data.password, password_hash)
+    except passwords.PasswordHashError as e:
+        raise _password_error(e)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    return await run_in_threadpool(_issue_token, db, user, new_hash)
@@ -0,0 +1,258 @@
+"""
+Benchmark ทั้ง API ตามสถานการณ์ใช้งานจริง: client พร้อมกันหลายตัวยิงผสม list / search / update / login
+รายงาน req/s, p50/p95/p99 และจำนวน query ต่อ request (จาก header Server-Timing) แยกตามสถานการณ์
+บันทึกผลเป็น baseline (JSON) แล้วรอบถัดไปเทียบกับ baseline ได้
+
+    python benchmarks/seed.py --branches 50 --products 1000000        # ครั้งเดียว
+    python benchmarks/bench_api.py --save-baseline baseline.json       # รัน uvicorn ให้เองบนฐานข้อมูลที่ seed ไว้
+    ... แก้โค้ด ...
+    python benchmarks/bench_api.py --baseline baseline.json --fail-on-regression
+
+    # server ที่รันอยู่แล้ว (เช่นเทียบ DB_ASYNC=1 / pool config):
+    python benchmarks/bench_api.py --url http://127.0.0.1:8000 --label async
+
+ต้องติดตั้ง httpx (pip install httpx)
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+from bench_load import percentile
+from seed import BENCH_DATABASE_URL, PASSWORD, manager_name, staff_name
+from bench_search import QUERIES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "list=50,search=20,update=20,login=10"
+_QUERY_COUNT = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+# ---------- Virtual user ----------
+class VirtualUser:
+    """client หนึ่งตัว = user หนึ่งคนในสาขาหนึ่ง (manager หรือ staff สลับกัน)"""
+    def __init__(self, client: httpx.AsyncClient, username: str, branch_id: int, rng: random.Random):
+        self.client = client
+        self.username = username
+        self.branch_id = branch_id
+        self.rng = rng
+        self.headers: dict = {}
+        self.product_ids: list[int] = []
+
+    async def login(self) -> httpx.Response:
+        r = await self.client.post("/auth/login", json={"username": self.username, "password": PASSWORD})
+        if r.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        return r
+
+    async def setup(self) -> None:
+        r = await self.login()
+        r.raise_for_status()
+        r = await self.client.get(f"/products/?branch_id={self.branch_id}&limit=1000&fields=id", headers=self.headers)
+        r.raise_for_status()
+        self.product_ids = [p["id"] for p in r.json()]
+
+    async def list(self) -> httpx.Response:
+        skip = self.rng.randrange(0, 10) * 100
+        return await self.client.get(f"/products/?branch_id={self.branch_id}&limit=100&skip={skip}", headers=self.headers)
+
+    async def search(self) -> httpx.Response:
+        q = self.rng.choice(QUERIES)
+        return await self.client.get("/products/search", params={"q": q, "branch_id": self.branch_id}, headers=self.headers)
+
+    async def update(self) -> httpx.Response:
+        product_id = self.rng.choice(self.product_ids)
+        return await self.client.put(f"/products/{product_id}", json={"quantity": self.rng.randrange(0, 200)}, headers=self.headers)
+
+
+SCENARIOS = {
+    "list": VirtualUser.list,
+    "search": VirtualUser.search,
+    "update": VirtualUser.update,
+    "login": VirtualUser.login,
+}
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario: {name} (choose from {', '.join(SCENARIOS)})")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+# ---------- Run ----------
+async def run(client: httpx.AsyncClient, users: list[VirtualUser], mix: dict[str, int], duration: float, warmup: float) -> dict:
+    names, weights = list(mix), list(mix.values())
+    latencies: dict[str, list[float]] = defaultdict(list)
+    queries: dict[str, list[int]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    start = time.perf_counter()
+    measure_from, deadline = start + warmup, start + warmup + duration
+
+    async def worker(user: VirtualUser):
+        while (now := time.perf_counter()) < deadline:
+            scenario = user.rng.choices(names, weights)[0]
+            try:
+                r = await SCENARIOS[scenario](user)
+                ok = r.status_code < 400
+            except httpx.HTTPError:
+                r, ok = None, False
+            if now < measure_from:
+                continue
+            if not ok:
+                errors[scenario] += 1
+                continue
+            latencies[scenario].append(time.perf_counter() - now)
+            if match := _QUERY_COUNT.search(r.headers.get("server-timing", "")):
+                queries[scenario].append(int(match[1]))
+
+    await asyncio.gather(*(worker(u) for u in users))
+    results = {}
+    for scenario in names:
+        samples = latencies[scenario]
+        results[scenario] = {
+            "requests": len(samples),
+            "rps": len(samples) / duration,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "queries_per_request": sum(queries[scenario]) / len(queries[scenario]) if queries[scenario] else None,
+            "errors": errors[scenario],
+        }
+    return results
+
+
+async def make_users(client: httpx.AsyncClient, count: int, branches: int, staff_per_branch: int, seed: int) -> list[VirtualUser]:
+    users = []
+    for i in range(count):
+        branch_id = 1 + i % branches
+        n = (i // branches) % (staff_per_branch + 1)      # 0 = manager, 1.. = staff
+        username = manager_name(branch_id) if n == 0 else staff_name(branch_id, n)
+        users.append(VirtualUser(client, username, branch_id, random.Random(seed + i)))
+    for start in range(0, len(users), 20):
+        await asyncio.gather(*(u.setup() for u in users[start:start + 20]))
+    return users
+
+
+# ---------- Server ----------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(workers: int) -> tuple[subprocess.Popen, str]:
+    """รัน uvicorn main:app บนฐานข้อมูล benchmark (env อื่น เช่น DB_ASYNC / DB_POOL_SIZE ส่งต่อไปด้วย)"""
+    port = _free_port()
+    # METRICS_PUBLIC: รอ server พร้อมด้วย /metrics/pool โดยไม่ต้อง login
+    env = {**os.environ, "DATABASE_URL": BENCH_DATABASE_URL, "METRICS_PUBLIC": "1"}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            if httpx.get(f"{url}/metrics/pool").status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise SystemExit("server exited during startup")
+        time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit("server did not start within 30s")
+
+
+# ---------- Report / baseline ----------
+def print_results(results: dict, label: str) -> None:
+    print(f"{'scenario':>10} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'errors':>7}  {label}")
+    for scenario, r in results.items():
+        q = f"{r['queries_per_request']:.1f}" if r["queries_per_request"] is not None else "-"
+        print(f"{scenario:>10} {r['rps']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {q:>8} {r['errors']:>7}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """คืนรายการ regression: req/s ลดลง หรือ p95 เพิ่มขึ้น เกิน tolerance (%)"""
+    regressions = []
+    print(f"\n{'scenario':>10} {'req/s Δ%':>10} {'p95 Δ%':>10}  vs baseline {baseline['meta'].get('label') or ''}")
+    for scenario, r in results.items():
+        base = baseline["results"].get(scenario)
+        if not base or not base["rps"]:
+            continue
+        rps_change = (r["rps"] - base["rps"]) / base["rps"] * 100
+        p95_change = (r["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+        flag = ""
+        if rps_change < -tolerance or p95_change > tolerance:
+            flag = "  REGRESSION"
+            regressions.append(scenario)
+        print(f"{scenario:>10} {rps_change:>+10.1f} {p95_change:>+10.1f}{flag}")
+    return regressions
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="server ที่รันอยู่แล้ว (ไม่ส่ง = รัน uvicorn ให้เอง)")
+    parser.add_argument("--workers", type=int, default=1, help="จำนวน uvicorn worker ตอนรันให้เอง")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"น้ำหนักของแต่ละสถานการณ์ (ค่าเริ่มต้น {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="วินาทีที่วัดผล")
+    parser.add_argument("--warmup", type=float, default=5.0, help="วินาทีแรกที่ยิงแต่ไม่นับ")
+    parser.add_argument("--branches", type=int, default=50, help="ต้องตรงกับตอน seed")
+    parser.add_argument("--staff-per-branch", type=int, default=2, help="ต้องตรงกับตอน seed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="เทียบกับผลที่บันทึกไว้")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="%% ที่ยอมให้แย่ลงก่อนนับเป็น regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 ถ้ามี regression")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    proc, url = (None, args.url) if args.url else spawn_server(args.workers)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            users = await make_users(client, args.concurrency, args.branches, args.staff_per_branch, args.seed)
+            results = await run(client, users, mix, args.duration, args.warmup)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    print_results(results, args.label)
+    meta = {
+        "label": args.label,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "database": BENCH_DATABASE_URL.split("://")[0] if not args.url else url,
+        "python": platform.python_version(),
+        **{k: getattr(args, k) for k in ("mix", "concurrency", "duration", "workers")},
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"\nbaseline saved: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,71 @@
+"""
+Benchmark: export ทั้งสาขาแบบเดิม (ดึง GET /products/ ทีละ 1000 แถวเป็น ORM แล้วต่อ JSON ทั้งก้อน)
+เทียบกับ /products/export (stream ทีละ batch จาก server-side cursor) — วัดเวลาและหน่วยความจำสูงสุด
+
+    python benchmarks/bench_export.py --size 200000
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_export.py --size 1000000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from bench_pagination import seed  # ตั้ง DATABASE_URL ให้แล้ว
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+import crud  # noqa: E402
+import main  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+
+PAGE = 1000
+
+
+def paged_json() -> int:
+    size, after, chunks = 0, None, []
+    with SessionLocal() as db:
+        while True:
+            rows = crud.get_products(db, limit=PAGE, order_by="id", after=after)
+            if not rows:
+                break
+            chunks.append(json.dumps(jsonable_encoder(rows)))
+            after = [rows[-1].id]
+        # client เก็บทุกหน้าไว้จนจบ (แบบที่ทำกันอยู่ตอนนี้)
+        size = sum(len(c) for c in chunks)
+    return size
+
+
+def streamed(format: str) -> int:
+    chunks = main._csv_chunks if format == "csv" else main._ndjson_chunks
+    return sum(len(c) for c in chunks(crud.iter_product_rows(engine)))
+
+
+def measure(fn, *args) -> tuple[float, float, int]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024 / 1024, size
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200_000)
+    args = parser.parse_args()
+
+    seed(args.size)
+    print(f"database: {engine.url}  products: {args.size}")
+    print(f"{'path':>16} {'ms':>10} {'peak MiB':>10} {'MiB out':>10}")
+    for label, fn, fn_args in (
+        ("paged ORM json", paged_json, ()),
+        ("stream csv", streamed, ("csv",)),
+        ("stream ndjson", streamed, ("ndjson",)),
+    ):
+        ms, peak, size = measure(fn, *fn_args)
+        print(f"{label:>16} {ms:>10.0f} {peak:>10.1f} {size / 1024 / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main_()
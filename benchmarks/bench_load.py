@@ -0,0 +1,85 @@
+"""
+Load benchmark: requests/sec และ p50/p99 ของ API ที่กำลังรันอยู่ ที่ระดับ concurrency ต่าง ๆ
+ใช้เทียบ sync (ค่าเริ่มต้น) กับ async (DB_ASYNC=1) — รัน server ทีละโหมดแล้วรันสคริปต์นี้ซ้ำ
+
+    uvicorn main:app --port 8000                      # sync
+    DB_ASYNC=1 uvicorn main:app --port 8001           # async
+    python benchmarks/bench_load.py --url http://127.0.0.1:8000 --label sync
+    python benchmarks/bench_load.py --url http://127.0.0.1:8001 --label async
+
+ต้องติดตั้ง httpx (pip install httpx)
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+def percentile(samples: list[float], p: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> dict:
+    r = await client.post("/auth/login", json={"username": username, "password": password})
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def run_level(client: httpx.AsyncClient, headers: dict, path: str, concurrency: int, duration: float) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            try:
+                r = await client.get(path, headers=headers)
+                ok = r.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--username", default="owner")
+    parser.add_argument("--password", default="1234")
+    parser.add_argument("--path", default="/products/?branch_id=1&limit=100")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 200, 500])
+    parser.add_argument("--duration", type=float, default=10.0, help="วินาทีต่อระดับ")
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        headers = await login(client, args.username, args.password)
+        await client.get(args.path, headers=headers)   # warm-up
+
+        print(f"{'label':>8} {'clients':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>8}")
+        for concurrency in args.concurrency:
+            res = await run_level(client, headers, args.path, concurrency, args.duration)
+            print(f"{args.label:>8} {concurrency:>8} {res['rps']:>10.1f} {res['p50']:>10.1f} {res['p99']:>10.1f} {res['errors']:>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
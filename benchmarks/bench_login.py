@@ -0,0 +1,122 @@
+"""
+Benchmark: login พร้อมกันจำนวนมาก (ช่วงเปลี่ยนกะ) กระทบ request อื่นแค่ไหน
+
+แต่ละ config ของ PASSWORD_HASH_WORKERS รัน uvicorn ใหม่บนฐานข้อมูลจาก seed.py แล้ววัด 2 ช่วง:
+- quiet: มีแต่ client อ่านรายการสินค้า (GET /products/) → latency ปกติ
+- storm: client อ่านเท่าเดิม + client ที่ login วนไม่หยุด → login/s, latency ของ login และของ request อื่น
+
+    python benchmarks/seed.py --branches 50 --products 100000        # ครั้งเดียว
+    python benchmarks/bench_login.py --hash-workers 0,4               # 0 = hash ใน threadpool แบบเดิม
+    PASSWORD_HASH_ROUNDS=100000 python benchmarks/bench_login.py      # cost สูงขึ้น (login แรกของแต่ละ user จะ rehash)
+
+ต้องติดตั้ง httpx (pip install httpx)
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+from bench_api import spawn_server
+from bench_load import percentile
+from seed import PASSWORD, manager_name, staff_name
+
+
+async def _loop(deadline: float, call, latencies: list, errors: list) -> None:
+    while (t0 := time.perf_counter()) < deadline:
+        try:
+            r = await call()
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - t0)
+        else:
+            errors.append(1)
+
+
+async def phase(url: str, headers: list[dict], logins: list[dict], branches: int, duration: float) -> dict:
+    """readers อ่านรายการสินค้า + (ถ้ามี) loginers login วน จนครบ duration วินาที"""
+    limits = httpx.Limits(max_connections=len(headers) + len(logins) + 10)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        read_ms, read_errors, login_ms, login_errors = [], [], [], []
+        deadline = time.perf_counter() + duration
+        tasks = [
+            _loop(deadline, lambda h=h, b=1 + i % branches: client.get(f"/products/?branch_id={b}&limit=20", headers=h), read_ms, read_errors)
+            for i, h in enumerate(headers)
+        ] + [
+            _loop(deadline, lambda body=body: client.post("/auth/login", json=body), login_ms, login_errors)
+            for body in logins
+        ]
+        await asyncio.gather(*tasks)
+
+    def stats(samples: list, errors: list) -> dict:
+        return {
+            "rps": len(samples) / duration,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "errors": len(errors),
+        }
+    return {"read": stats(read_ms, read_errors), "login": stats(login_ms, login_errors) if logins else None}
+
+
+async def login_all(url: str, usernames: list[str]) -> list[dict]:
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        headers = []
+        for username in usernames:
+            r = await client.post("/auth/login", json={"username": username, "password": PASSWORD})
+            r.raise_for_status()
+            headers.append({"Authorization": f"Bearer {r.json()['access_token']}"})
+        return headers
+
+
+def run_config(workers: int, args) -> dict:
+    os.environ["PASSWORD_HASH_WORKERS"] = str(workers)
+    proc, url = spawn_server(args.server_workers)
+    try:
+        readers = [manager_name(1 + i % args.branches) for i in range(args.readers)]
+        loginers = [
+            {"username": staff_name(1 + i % args.branches, 1 + (i // args.branches) % args.staff_per_branch), "password": PASSWORD}
+            for i in range(args.logins)
+        ]
+        # login ทุก user ครั้งหนึ่งก่อน (rehash ถ้า PASSWORD_HASH_* ต่างจากตอน seed) ไม่ให้นับในผล
+        headers = asyncio.run(login_all(url, readers + sorted({b["username"] for b in loginers})))[:args.readers]
+        return {
+            "quiet": asyncio.run(phase(url, headers, [], args.branches, args.duration)),
+            "storm": asyncio.run(phase(url, headers, loginers, args.branches, args.duration)),
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hash-workers", default="0,4", help="ค่า PASSWORD_HASH_WORKERS ที่จะเทียบ คั่นด้วยจุลภาค")
+    parser.add_argument("--server-workers", type=int, default=1, help="จำนวน uvicorn worker")
+    parser.add_argument("--readers", type=int, default=20, help="client ที่อ่านรายการสินค้า")
+    parser.add_argument("--logins", type=int, default=50, help="client ที่ login วนพร้อมกัน")
+    parser.add_argument("--duration", type=float, default=15.0, help="วินาทีต่อช่วง")
+    parser.add_argument("--branches", type=int, default=50, help="ต้องตรงกับตอน seed")
+    parser.add_argument("--staff-per-branch", type=int, default=2, help="ต้องตรงกับตอน seed")
+    args = parser.parse_args()
+
+    print(f"{'hash workers':>12} {'phase':>6} {'login/s':>8} {'login p50':>10} {'login p99':>10} {'errors':>6}"
+          f" {'read/s':>8} {'read p50':>9} {'read p95':>9} {'read p99':>9}")
+    for workers in [int(w) for w in args.hash_workers.split(",")]:
+        results = run_config(workers, args)
+        for name, r in results.items():
+            login, read = r["login"], r["read"]
+            login_cols = (
+                f"{login['rps']:>8.1f} {login['p50_ms']:>10.1f} {login['p99_ms']:>10.1f} {login['errors']:>6}"
+                if login else f"{'-':>8} {'-':>10} {'-':>10} {'-':>6}"
+            )
+            print(f"{workers:>12} {name:>6} {login_cols} {read['rps']:>8.1f} {read['p50_ms']:>9.1f} {read['p95_ms']:>9.1f} {read['p99_ms']:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
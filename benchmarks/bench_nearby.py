@@ -0,0 +1,121 @@
+"""
+Benchmark: สาขาใกล้สุดที่มีของ — คำนวณระยะทุกสาขาแล้วเรียง (แบบไม่มี index) เทียบกับ crud.nearby_stock
+
+บน PostgreSQL ต้องมี extension cube + earthdistance (migration e4a7c2d9b163) สคริปต์จะสร้างให้ถ้ายังไม่มี
+บน SQLite nearby_stock ใช้ geo_index (KD-tree ในหน่วยความจำ — รวมเวลาสร้างครั้งแรกแยกไว้)
+
+    python benchmarks/bench_nearby.py --branches 5000
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_nearby.py --branches 20000
+"""
+import argparse
+import heapq
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.gettempdir(), "inventory_bench.sqlite")
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+from sqlalchemy import insert, select, text  # noqa: E402
+
+import crud, geo_index, models  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from schema import reset_tables  # noqa: E402
+
+INSERT_CHUNK = 10_000
+ITEMS = ["Cola", "Green Tea", "Milk", "Yogurt", "Noodles", "Chips", "Water", "Soda", "Coffee", "Juice"]
+PRODUCTS_PER_BRANCH = 5
+LATITUDE = (5.6, 20.5)       # กรอบประเทศไทย
+LONGITUDE = (97.3, 105.6)
+ORIGINS = [(13.7563, 100.5018), (18.7883, 98.9853), (7.8804, 98.3923), (14.9799, 102.0978)]
+
+
+def seed(branches: int) -> None:
+    rng = random.Random(42)
+    tables = [models.Product.__table__, models.Branch.__table__]
+    reset_tables(tables)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Branch), [
+            {"id": b, "name": f"branch-{b}", "latitude": rng.uniform(*LATITUDE), "longitude": rng.uniform(*LONGITUDE)}
+            for b in range(1, branches + 1)
+        ])
+        rows = [
+            {
+                "name": item,
+                "price": 10.0,
+                "quantity": rng.choice([0, 0, 3, 12, 40]),      # บางสาขาของหมด
+                "category": "drinks",
+                "branch_id": b,
+            }
+            for b in range(1, branches + 1)
+            for item in rng.sample(ITEMS, PRODUCTS_PER_BRANCH)
+        ]
+        for start in range(0, len(rows), INSERT_CHUNK):
+            conn.execute(insert(models.Product), rows[start:start + INSERT_CHUNK])
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE"))
+
+
+def scan_nearest(db, lat: float, lng: float, name: str, k: int) -> list[int]:
+    """แบบเดิม: ดึงทุกสาขาที่มีของ แล้วคำนวณระยะทีละสาขา"""
+    B = models.Branch
+    stock = crud.branch_stock_statement(name).subquery()
+    rows = db.execute(select(B.id, B.latitude, B.longitude).join(stock, stock.c.branch_id == B.id)).all()
+    here = geo_index.to_point(lat, lng)
+    return [
+        branch_id for _, branch_id in heapq.nsmallest(
+            k, ((math.dist(here, geo_index.to_point(la, ln)), branch_id) for branch_id, la, ln in rows)
+        )
+    ]
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--branches", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--radius-km", type=float, default=25.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"database: {engine.url.render_as_string(hide_password=True)}  branches: {args.branches}")
+    seed(args.branches)
+
+    db = SessionLocal()
+    try:
+        if engine.dialect.name != "postgresql":
+            t0 = time.perf_counter()
+            geo_index.get_index(db)
+            print(f"in-memory index build: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        print(f"{'origin':>18} {'scan ms':>9} {'k-nearest ms':>13} {'radius ms':>10} {'in radius':>10} {'same':>5}")
+        for lat, lng in ORIGINS:
+            name = ITEMS[0]
+            scan_ms = timed(lambda: scan_nearest(db, lat, lng, name, args.k), args.repeat)
+            knn_ms = timed(lambda: crud.nearby_stock(db, lat, lng, name=name, k=args.k), args.repeat)
+            radius_ms = timed(lambda: crud.nearby_stock(db, lat, lng, name=name, radius_m=args.radius_km * 1000, k=100), args.repeat)
+            in_radius = len(crud.nearby_stock(db, lat, lng, name=name, radius_m=args.radius_km * 1000, k=100))
+            same = scan_nearest(db, lat, lng, name, args.k) == [b.id for b, *_ in crud.nearby_stock(db, lat, lng, name=name, k=args.k)]
+            db.expunge_all()
+            print(f"{f'{lat:.3f},{lng:.3f}':>18} {scan_ms:>9.2f} {knn_ms:>13.2f} {radius_ms:>10.2f} {in_radius:>10} {str(same):>5}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
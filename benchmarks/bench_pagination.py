@@ -0,0 +1,93 @@
+"""
+Benchmark: offset vs keyset (cursor) pagination ของ crud.get_products
+
+ใช้ฐานข้อมูลทดสอบเท่านั้น (สคริปต์จะ drop/create ตาราง products + branches ใหม่ทุกขนาด)
+
+    python benchmarks/bench_pagination.py                       # SQLite ชั่วคราว
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_pagination.py --sizes 1000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.gettempdir(), "inventory_bench.sqlite")
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+from sqlalchemy import insert  # noqa: E402
+
+import crud, models  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from schema import reset_tables  # noqa: E402
+
+BRANCHES = 50
+INSERT_CHUNK = 10_000
+
+
+def seed(n: int) -> None:
+    tables = [models.Product.__table__, models.Branch.__table__]
+    reset_tables(tables)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Branch), [{"id": i, "name": f"branch-{i}"} for i in range(1, BRANCHES + 1)])
+        for start in range(0, n, INSERT_CHUNK):
+            conn.execute(insert(models.Product), [
+                {
+                    "name": f"product-{i:07d}",
+                    "price": float(i % 997),
+                    "quantity": i % 50,
+                    "category": f"cat-{i % 20}",
+                    "branch_id": 1 + i % BRANCHES,
+                }
+                for i in range(start, min(start + INSERT_CHUNK, n))
+            ])
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return median(samples) * 1000
+
+
+def run(n: int, page: int, order_by: str, repeat: int) -> None:
+    seed(n)
+    db = SessionLocal()
+    try:
+        for depth in sorted({0, n // 2, max(n - page, 0)}):
+            # หา cursor ของตำแหน่งนี้ไว้ก่อน (ไม่นับเวลา) — เท่ากับ client ที่ไล่หน้ามาถึงตรงนี้
+            after = None
+            if depth:
+                prev = crud.get_products(db, skip=depth - 1, limit=1, order_by=order_by)[0]
+                after = crud.decode_cursor(crud.encode_cursor(order_by, prev), order_by)
+
+            offset_ms = timed(lambda: crud.get_products(db, skip=depth, limit=page, order_by=order_by), repeat)
+            cursor_ms = timed(lambda: crud.get_products(db, limit=page, order_by=order_by, after=after), repeat)
+            db.expunge_all()
+            print(f"{n:>9} {order_by:>7} {depth:>9} {offset_ms:>11.2f} {cursor_ms:>11.2f}")
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--order-by", choices=sorted(crud.PRODUCT_ORDERINGS), default="branch")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"database: {engine.url.render_as_string(hide_password=True)}")
+    print(f"{'products':>9} {'order':>7} {'offset':>9} {'offset ms':>11} {'cursor ms':>11}")
+    for n in args.sizes:
+        run(n, args.page, args.order_by, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: ค้นหาชื่อสินค้า — ILIKE '%q%' (แบบเดิม) เทียบกับ ranked search และ autocomplete
+
+บน PostgreSQL ต้อง migrate ถึง f3b6c81e2d94 (pg_trgm) ก่อน สคริปต์จะสร้าง index ให้ถ้ายังไม่มี
+บน SQLite ranked search / autocomplete ใช้ search_index ในหน่วยความจำ (รวมเวลาสร้าง index ครั้งแรกแยกไว้)
+
+    python benchmarks/bench_search.py --size 100000
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_search.py --size 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from statistics import median
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.gettempdir(), "inventory_bench.sqlite")
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+from sqlalchemy import insert, text  # noqa: E402
+
+import crud, models, search_index  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from schema import reset_tables  # noqa: E402
+
+BRANCHES = 50
+INSERT_CHUNK = 10_000
+BRANDS = ["Coca", "Pepsi", "Nestle", "Lays", "Oishi", "Meiji", "Dutch Mill", "Mama", "Yum Yum", "Singha", "Chang", "Leo"]
+ITEMS = ["Cola", "Green Tea", "Milk", "Yogurt", "Noodles", "Chips", "Water", "Soda", "Coffee", "Juice", "Biscuit", "Rice"]
+SIZES = ["100ml", "330ml", "500ml", "1L", "small", "large", "pack 6", "pack 12"]
+QUERIES = ["cola", "green tea", "nodles", "yogurt 500ml", "singha soda", "cofee"]
+PREFIXES = ["co", "gre", "mil", "pe", "yum"]
+
+
+def product_name(rng: random.Random, i: int) -> str:
+    return f"{rng.choice(BRANDS)} {rng.choice(ITEMS)} {rng.choice(SIZES)} #{i}"
+
+
+def seed(n: int) -> None:
+    rng = random.Random(42)
+    tables = [models.Product.__table__, models.Branch.__table__]
+    reset_tables(tables)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Branch), [{"id": i, "name": f"branch-{i}"} for i in range(1, BRANCHES + 1)])
+        for start in range(0, n, INSERT_CHUNK):
+            conn.execute(insert(models.Product), [
+                {
+                    "name": product_name(rng, i),
+                    "price": float(i % 997),
+                    "quantity": i % 50,
+                    "category": f"cat-{i % 20}",
+                    "branch_id": 1 + i % BRANCHES,
+                }
+                for i in range(start, min(start + INSERT_CHUNK, n))
+            ])
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("ANALYZE products"))
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--branch-id", type=int, default=None, help="จำกัดการค้นหาเฉพาะสาขา")
+    args = parser.parse_args()
+
+    print(f"database: {engine.url.render_as_string(hide_password=True)}  products: {args.size}")
+    seed(args.size)
+    branch_ids = [args.branch_id] if args.branch_id else None
+
+    db = SessionLocal()
+    try:
+        if engine.dialect.name != "postgresql":
+            t0 = time.perf_counter()
+            search_index.get_index(db)
+            print(f"in-memory index build: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        print(f"{'query':>14} {'ILIKE ms':>10} {'search ms':>10} {'hits':>6}")
+        for q in QUERIES:
+            ilike_ms = timed(lambda: crud.get_products(db, name=q, limit=20, branch_id=args.branch_id), args.repeat)
+            search_ms = timed(lambda: crud.search_products(db, q, branch_ids=branch_ids, limit=20), args.repeat)
+            hits = len(crud.search_products(db, q, branch_ids=branch_ids, limit=20))
+            db.expunge_all()
+            print(f"{q:>14} {ilike_ms:>10.2f} {search_ms:>10.2f} {hits:>6}")
+
+        print(f"{'prefix':>14} {'autocomplete ms':>16}")
+        for prefix in PREFIXES:
+            ms = timed(lambda: crud.autocomplete_products(db, prefix, branch_ids=branch_ids), args.repeat)
+            print(f"{prefix:>14} {ms:>16.2f}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
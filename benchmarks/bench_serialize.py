@@ -0,0 +1,56 @@
+"""
+Benchmark: serialize หน้า list สินค้า (GET /products/) — ทางเดิมเทียบกับทาง lean
+
+- orm+pydantic : SELECT Product (ORM object) → schemas.Product.model_validate → jsonable_encoder → JSONResponse
+- lean         : SELECT เฉพาะคอลัมน์ (row tuple) → response_cache.lean_items → orjson
+- lean fields  : แบบ lean แต่ขอแค่ fields=id,name,quantity
+
+วัดเวลาตั้งแต่ query จนได้ bytes ของ body (ไม่ผ่าน HTTP / cache)
+
+    python benchmarks/bench_serialize.py --pages 100 1000
+"""
+import argparse
+
+from bench_pagination import seed, timed  # ตั้ง DATABASE_URL ให้แล้ว
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import crud, response_cache, schemas  # noqa: E402
+from database import SessionLocal  # noqa: E402
+
+
+def orm_pydantic(db, page: int) -> bytes:
+    rows = crud.get_products(db, limit=page)
+    body = JSONResponse(jsonable_encoder([schemas.Product.model_validate(row) for row in rows])).body
+    db.expunge_all()    # เหมือน session ใหม่ทุก request (ไม่ได้ object จาก identity map ซ้ำ)
+    return body
+
+
+def lean(db, page: int, fields: tuple[str, ...]) -> bytes:
+    rows = crud.get_product_rows(db, limit=page, columns=crud.product_columns(fields))
+    return response_cache.dumps(response_cache.lean_items(rows, fields))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    seed(max(args.pages))
+    narrow = crud.parse_product_fields("id,name,quantity")
+    encoder = "orjson" if response_cache.orjson is not None else "json (orjson not installed)"
+    print(f"encoder: {encoder}")
+    print(f"{'page':>6} {'orm+pydantic ms':>16} {'lean ms':>10} {'lean fields ms':>15} {'speedup':>8}")
+    with SessionLocal() as db:
+        for page in args.pages:
+            assert orm_pydantic(db, page) == lean(db, page, crud.PRODUCT_FIELDS), "lean output differs"
+            base = timed(lambda: orm_pydantic(db, page), args.repeat)
+            full = timed(lambda: lean(db, page, crud.PRODUCT_FIELDS), args.repeat)
+            few = timed(lambda: lean(db, page, narrow), args.repeat)
+            print(f"{page:>6} {base:>16.2f} {full:>10.2f} {few:>15.2f} {base / full:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
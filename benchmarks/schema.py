@@ -0,0 +1,22 @@
+"""
+สร้างตารางใหม่สำหรับ benchmark (ใช้ฐานข้อมูลทดสอบเท่านั้น — drop ก่อนเสมอ)
+
+บน PostgreSQL index บางตัวต้องมี extension ก่อน create_all:
+pg_trgm (ค้นชื่อสินค้า) และ cube + earthdistance (สาขาใกล้สุด) — migration สร้างให้ แต่ create_all ไม่สร้าง
+import หลังตั้ง DATABASE_URL แล้วเท่านั้น (เหมือน database.py)
+"""
+from sqlalchemy import text
+
+from database import Base, engine
+
+EXTENSIONS = ("pg_trgm", "cube", "earthdistance")
+
+
+def reset_tables(tables=None) -> None:
+    """drop แล้ว create ตาราง (None = ทุกตาราง)"""
+    Base.metadata.drop_all(bind=engine, tables=tables)
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for name in EXTENSIONS:
+                conn.execute(text(f"CREATE EXTENSION IF NOT EXISTS {name}"))
+    Base.metadata.create_all(bind=engine, tables=tables)
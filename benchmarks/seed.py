@@ -0,0 +1,116 @@
+"""
+Seed ชุดข้อมูลสำหรับ bench_api.py — ใช้ฐานข้อมูลทดสอบเท่านั้น (drop/create ทุกตารางใหม่)
+
+- branches (สุ่มพิกัดในกรอบประเทศไทย)
+- users: bench-owner (Owner) + ต่อสาขา bench-manager-<id> (MANAGER) และ bench-staff-<id>-<n> (STAFF)
+  ทุกคนใช้รหัสผ่านเดียวกัน (hash ครั้งเดียว ไม่ bcrypt ทีละคนแบบ seed_roles.py)
+- products หลักล้านแถวด้วย multi-row INSERT ทีละ chunk แล้วคำนวณ inventory_summary ทีเดียว
+
+    python benchmarks/seed.py --branches 50 --products 1000000
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/seed.py --products 5000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.gettempdir(), "inventory_bench.sqlite")
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+from sqlalchemy import insert, text  # noqa: E402
+
+import crud, models  # noqa: E402
+from auth import hash_password  # noqa: E402
+from bench_search import product_name  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+from schema import reset_tables  # noqa: E402
+
+INSERT_CHUNK = 10_000
+PASSWORD = "bench"
+OWNER = "bench-owner"
+# พิกัดสาขาสุ่มในกรอบประเทศไทย (สำหรับ /products/nearby)
+LATITUDE = (5.6, 20.5)
+LONGITUDE = (97.3, 105.6)
+
+
+def manager_name(branch_id: int) -> str:
+    return f"bench-manager-{branch_id}"
+
+
+def staff_name(branch_id: int, n: int) -> str:
+    return f"bench-staff-{branch_id}-{n}"
+
+
+def _seed_users(conn, branches: int, staff_per_branch: int) -> int:
+    password_hash = hash_password(PASSWORD)
+    users = [{"username": OWNER, "password_hash": password_hash, "global_role": models.UserGlobalRole.OWNER}]
+    for b in range(1, branches + 1):
+        users.append({"username": manager_name(b), "password_hash": password_hash, "global_role": models.UserGlobalRole.MANAGER})
+        users += [
+            {"username": staff_name(b, n), "password_hash": password_hash, "global_role": models.UserGlobalRole.EMPLOYEE}
+            for n in range(1, staff_per_branch + 1)
+        ]
+    conn.execute(insert(models.User), users)
+
+    ids = dict(conn.execute(text("SELECT username, id FROM users")).all())
+    roles = []
+    for b in range(1, branches + 1):
+        roles.append({"user_id": ids[manager_name(b)], "branch_id": b, "role": models.BranchRoleEnum.MANAGER})
+        roles += [
+            {"user_id": ids[staff_name(b, n)], "branch_id": b, "role": models.BranchRoleEnum.STAFF}
+            for n in range(1, staff_per_branch + 1)
+        ]
+    conn.execute(insert(models.UserBranchRole), roles)
+    return len(users)
+
+
+def seed_dataset(branches: int, products: int, staff_per_branch: int = 2, seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    reset_tables()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Branch), [
+            {"id": b, "name": f"branch-{b}", "latitude": rng.uniform(*LATITUDE), "longitude": rng.uniform(*LONGITUDE)}
+            for b in range(1, branches + 1)
+        ])
+        users = _seed_users(conn, branches, staff_per_branch)
+        for start in range(0, products, INSERT_CHUNK):
+            conn.execute(insert(models.Product), [
+                {
+                    "name": product_name(rng, i),
+                    "price": float(1 + i % 997),
+                    "quantity": rng.randrange(0, 200),
+                    "category": f"cat-{i % 20}",
+                    "branch_id": 1 + i % branches,
+                }
+                for i in range(start, min(start + INSERT_CHUNK, products))
+            ])
+
+    with SessionLocal() as db:
+        crud.refresh_inventory_summary(db)
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE"))
+    return {"branches": branches, "users": users, "products": products}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--branches", type=int, default=50)
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--staff-per-branch", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    counts = seed_dataset(args.branches, args.products, args.staff_per_branch, args.seed)
+    print(f"database: {engine.url}")
+    print(f"seeded {counts} in {time.perf_counter() - t0:.1f}s (password: {PASSWORD})")
+
+
+if __name__ == "__main__":
+    main()
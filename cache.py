@@ -0,0 +1,92 @@
+# cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Cache ในโปรเซสแบบจำกัดจำนวน (LRU) + หมดอายุตามเวลา, ใช้ได้จากหลาย thread
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# ===== Authorization context ต่อ user (user + branch roles ทั้งหมด) =====
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_USERS = int(os.getenv("AUTH_CACHE_MAX_USERS", "10000"))
+
+auth_contexts = TTLCache(maxsize=AUTH_CACHE_MAX_USERS, ttl=AUTH_CACHE_TTL_SECONDS)
+
+# ===== ตาราง role_version ล่าสุดต่อ user (ใช้ตรวจ JWT claims โดยไม่ต้องถาม DB) =====
+# โปรเซสอื่นที่ bump version จะเห็นผลในโปรเซสนี้ช้าสุดไม่เกิน TTL นี้
+ROLE_VERSION_TTL_SECONDS = float(os.getenv("ROLE_VERSION_TTL_SECONDS", "300"))
+
+role_versions = TTLCache(maxsize=AUTH_CACHE_MAX_USERS, ttl=ROLE_VERSION_TTL_SECONDS)
+
+
+def invalidate_user_roles(user_id: int, role_version: Optional[int] = None) -> None:
+    """เรียกทุกครั้งที่ role ของ user เปลี่ยน (ส่ง role_version ใหม่มาด้วยถ้ารู้)"""
+    auth_contexts.invalidate(user_id)
+    if role_version is None:
+        role_versions.invalidate(user_id)
+    else:
+        role_versions.set(user_id, role_version)
+
+
+def invalidate_all_roles() -> None:
+    """เช่น ตอนลบสาขา (user_branch_roles ถูก cascade ไปหลายคน)"""
+    auth_contexts.clear()
+    role_versions.clear()
+
+
+# ===== แจ้งเมื่อข้อมูลสินค้าเปลี่ยน (ให้ index / cache ที่อ้างอิง products ล้างตัวเอง) =====
+_product_listeners: list = []
+
+
+def on_products_changed(fn):
+    """ลงทะเบียน fn(branch_ids: set[int]) — ใช้เป็น decorator ได้"""
+    _product_listeners.append(fn)
+    return fn
+
+
+def products_changed(branch_ids) -> None:
+    """crud เรียกหลัง commit ทุกครั้งที่ insert / update / delete สินค้า"""
+    branch_ids = {b for b in branch_ids if b is not None}
+    for fn in _product_listeners:
+        fn(branch_ids)
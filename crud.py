@@ -1,11 +1,23 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select, and_
-from typing import List, Optional
+from sqlalchemy import select, insert, update, delete, and_, or_, tuple_, func, literal, case, text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from typing import List, NamedTuple, Optional
+import base64, json, os
+from datetime import date, datetime, timedelta
 import models, schemas
+from cache import invalidate_all_roles, products_changed
 
 # ---------- Branch ----------
-def get_branches(db: Session) -> List[models.Branch]:
-    return db.execute(select(models.Branch).order_by(models.Branch.name.asc())).scalars().all()
+def branches_statement(member_user_id: int | None = None):
+    q = select(models.Branch).order_by(models.Branch.name.asc())
+    if member_user_id is not None:
+        # เฉพาะสาขาที่ user เป็นสมาชิก
+        UBR = models.UserBranchRole
+        q = q.join(UBR, and_(UBR.branch_id == models.Branch.id, UBR.user_id == member_user_id))
+    return q
+
+def get_branches(db: Session, member_user_id: int | None = None) -> List[models.Branch]:
+    return db.execute(branches_statement(member_user_id)).scalars().all()
 
 def create_branch(db: Session, data: schemas.BranchCreate) -> models.Branch:
     obj = models.Branch(id=data.id, name=data.name, location=data.location)
@@ -26,28 +38,262 @@ def update_branch(db: Session, branch_id: int, data: schemas.BranchUpdate) -> Op
     db.refresh(obj)
     return obj
 
+def bump_member_role_versions_statement(branch_id: int):
+    # user_branch_roles ของสาขานี้ถูก cascade ไปด้วย → token ของสมาชิกต้องไม่ใช้ roles เดิมอีก
+    members = select(models.UserBranchRole.user_id).where(models.UserBranchRole.branch_id == branch_id)
+    return (
+        update(models.User)
+        .where(models.User.id.in_(members))
+        .values(role_version=models.User.role_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
 def delete_branch(db: Session, branch_id: int) -> bool:
     obj = db.get(models.Branch, branch_id)
     if not obj:
         return False
+    db.execute(bump_member_role_versions_statement(branch_id))
+    db.execute(delete_branch_summary_statement(branch_id))
     db.delete(obj)
     db.commit()
+    invalidate_all_roles()
+    products_changed({branch_id})
     return True
 
 # ------- Product ---------
-def get_products(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Product).offset(skip).limit(limit).all()
+class DuplicateProductError(Exception):
+    """ชื่อซ้ำกับสินค้าอื่นในสาขาเดียวกัน (uq_products_name_branch)"""
+    status_code = 409
+    detail = "Product with this name already exists in branch"
 
-def create_product(db: Session, product: schemas.ProductCreate):
+def is_duplicate_product(e: IntegrityError) -> bool:
+    # PostgreSQL บอกชื่อ constraint / SQLite บอกคอลัมน์ — IntegrityError อื่น (FK, id ซ้ำ) ไม่นับ
+    message = str(e.orig)
+    return "uq_products_name_branch" in message or "products.name, products.branch_id" in message
+
+def create_product(db: Session, product: schemas.ProductCreate, user_id: int | None = None):
     db_product = models.Product(**product.dict(exclude_unset=True))
     db.add(db_product)
-    db.commit()
+    try:
+        db.flush()      # ต้องรู้ id ก่อนเขียน stock_movements
+        changes = ChangeSet(user_id)
+        changes.created(db_product)
+        for stmt in changes.statements(db):
+            db.execute(stmt)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_duplicate_product(e):
+            raise DuplicateProductError() from e
+        raise
     db.refresh(db_product)
+    products_changed({db_product.branch_id})
     return db_product
 
+# ---------- Bulk upsert ----------
+BULK_UPSERT_CHUNK_SIZE = int(os.getenv("BULK_UPSERT_CHUNK_SIZE", "1000"))
+BULK_UPSERT_COLUMNS = ("price", "quantity", "category", "image_url", "unit", "reorder_threshold")
+
+def _insert(db: Session):
+    """
+    insert() ของ dialect ที่รองรับ ON CONFLICT (PostgreSQL / SQLite)
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"ON CONFLICT is not supported for {dialect}")
+    return insert
+
+def _upsert_statement(db: Session, rows: list[dict]):
+    """
+    rows ต้องมีชุดคีย์เดียวกัน (multi-row VALUES) — แถวเดิมที่ชนถูกแก้เฉพาะคอลัมน์ที่ส่งมา
+    คอลัมน์ที่ไม่ได้ส่งคงค่าเดิม (เหมือนช่องว่างใน CSV import) ส่วนแถวใหม่ได้ค่า default ของ model
+    """
+    insert = _insert(db)
+    P = models.Product
+    stmt = insert(P).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[P.name, P.branch_id],
+        set_={
+            **{col: stmt.excluded[col] for col in BULK_UPSERT_COLUMNS if col in rows[0]},
+            "version": P.version + 1,       # ให้ PUT ที่ส่ง expected_version เก่ามาได้ 409 เหมือนแก้ทีละตัว
+            "updated_at": func.now(),
+        },
+    ).returning(P.id, P.name, P.branch_id, P.category, P.price, P.quantity, P.reorder_threshold)
+
+def _stock_level_changed(old, row) -> bool:
+    return old is None or (old.quantity, old.reorder_threshold) != (row.quantity, row.reorder_threshold)
+
+def _upsert_rows(db: Session, rows: list[dict], user_id: int | None) -> list:
+    """
+    upsert + inventory_summary + stock_movements: ล็อกแถวเดิมตามลำดับ id ก่อน
+    (รู้ค่าเดิมแน่นอน → ปรับ summary แบบ delta ได้, ไม่ deadlock กับ batch อื่น)
+    คืนแถวที่ quantity / reorder_threshold เปลี่ยน (รวมแถวใหม่) สำหรับ notify_stock_level หลัง commit
+    """
+    P = models.Product
+    keys = [(data["name"], data["branch_id"]) for data in rows]
+    old = {
+        row.id: ProductSnapshot(row.branch_id, row.category, row.price, row.quantity, row.reorder_threshold)
+        for row in db.execute(
+            select(P.id, P.branch_id, P.category, P.price, P.quantity, P.reorder_threshold)
+            .where(tuple_(P.name, P.branch_id).in_(keys)).order_by(P.id).with_for_update()
+        )
+    }
+
+    # แถวที่ส่งคอลัมน์มาไม่เท่ากัน (model_dump(exclude_unset=True)) → หนึ่ง statement ต่อชุดคอลัมน์
+    groups: dict[tuple, list[dict]] = {}
+    for data in rows:
+        groups.setdefault(tuple(sorted(data)), []).append(data)
+
+    changes = ChangeSet(user_id)
+    stock = []
+    for group in groups.values():
+        for row in db.execute(_upsert_statement(db, group)).all():
+            changes.upserted(old.get(row.id), row)
+            if _stock_level_changed(old.get(row.id), row):
+                stock.append(row)
+    for stmt in changes.statements(db):
+        db.execute(stmt)
+    return stock
+
+def _db_error_message(e: DBAPIError) -> str:
+    return str(e.orig).strip().splitlines()[0]
+
+def bulk_upsert_products(db: Session, rows: list[tuple[int, dict]], user_id: int | None = None) -> tuple[int, list[tuple[int, str]], list]:
+    """
+    upsert ตาม natural key (name, branch_id) ด้วย multi-row INSERT ... ON CONFLICT ทีละ chunk
+    rows = [(index, ProductCreate.model_dump(exclude_unset=True)), ...] ที่ validate/ตรวจสิทธิ์มาแล้ว
+    ถ้า chunk ไหนพัง (เช่น branch ไม่มีอยู่จริง) จะลองทีละแถวเพื่อรายงาน error เฉพาะแถวนั้น
+    คืน (จำนวนแถวที่ upsert สำเร็จ, [(index, error), ...], แถวที่ commit แล้วและระดับสต็อกเปลี่ยน)
+    """
+    upserted = 0
+    errors: list[tuple[int, str]] = []
+    stock: list = []
+
+    for start in range(0, len(rows), BULK_UPSERT_CHUNK_SIZE):
+        # key ซ้ำใน chunk เดียวกัน ON CONFLICT ทำไม่ได้ → ใช้แถวหลังสุด
+        chunk = {}
+        for index, data in rows[start:start + BULK_UPSERT_CHUNK_SIZE]:
+            data = {k: v for k, v in data.items() if k != "id"}
+            chunk[(data["name"], data["branch_id"])] = (index, data)
+
+        changed = []
+        try:
+            with db.begin_nested():
+                changed = _upsert_rows(db, [data for _, data in chunk.values()], user_id)
+            upserted += len(chunk)
+        except DBAPIError:
+            for index, data in chunk.values():
+                try:
+                    with db.begin_nested():
+                        changed += _upsert_rows(db, [data], user_id)
+                    upserted += 1
+                except DBAPIError as e:
+                    errors.append((index, _db_error_message(e)))
+        db.commit()
+        stock += changed
+        products_changed({data["branch_id"] for _, data in chunk.values()})
+
+    return upserted, errors, stock
+
+# ---------- CSV import (ทีละ chunk) ----------
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+
+def products_by_keys(db: Session, keys) -> dict[tuple[str, int], models.Product]:
+    """
+    หา products ตาม natural key (name, branch_id) ทั้ง chunk ใน query เดียว
+    ล็อกแถวไว้ (เรียงตาม id) จนจบ transaction — ค่าที่ใช้ตัดสินใจยังเป็นค่าล่าสุดตอนเขียน
+    """
+    if not keys:
+        return {}
+    P = models.Product
+    rows = db.scalars(
+        select(P).where(tuple_(P.name, P.branch_id).in_(list(keys))).order_by(P.id).with_for_update()
+    )
+    return {(p.name, p.branch_id): p for p in rows}
+
+class StockLevel(NamedTuple):
+    # ค่าที่ notify_stock_level ใช้ — เก็บก่อน commit (ORM object หมดอายุหลัง commit, อ่านอีกครั้ง = query ทีละแถว)
+    id: int
+    name: str
+    branch_id: int
+    quantity: int
+    reorder_threshold: int
+
+    @classmethod
+    def of(cls, product) -> "StockLevel":
+        return cls(product.id, product.name, product.branch_id, product.quantity, product.reorder_threshold)
+
+def apply_product_import(db: Session, creates: list[dict], updates: list[tuple[models.Product, dict]],
+                         user_id: int | None = None) -> list[StockLevel]:
+    """
+    เขียนผลของหนึ่ง chunk ใน transaction เดียว: insert แถวใหม่ + แก้แถวเดิม (ที่ได้จาก products_by_keys)
+    พร้อม inventory_summary / stock_movements — DBAPIError = ไม่มีอะไรถูกเขียน (rollback ทั้ง chunk)
+    คืนระดับสต็อกของแถวใหม่และแถวที่ quantity / reorder_threshold เปลี่ยน สำหรับ notify_stock_level หลัง commit
+    """
+    changes = ChangeSet(user_id)
+    updated = []
+    for product, data in updates:
+        old = ProductSnapshot.of(product)
+        for k, v in data.items():
+            setattr(product, k, v)
+        product.version = models.Product.version + 1
+        changes.updated(old, product)
+        if _stock_level_changed(old, product):
+            updated.append(product)
+    new = [models.Product(**data) for data in creates]
+    db.add_all(new)
+    branch_ids = {data["branch_id"] for data in creates} | {p.branch_id for p, _ in updates}
+    try:
+        db.flush()
+        for product in new:
+            changes.created(product)
+        stock = [StockLevel.of(product) for product in updated + new]
+        for stmt in changes.statements(db):
+            db.execute(stmt)
+        db.commit()
+    except DBAPIError:
+        db.rollback()
+        raise
+    products_changed(branch_ids)
+    return stock
+
+# ---------- Keyset (cursor) pagination ----------
+# คีย์เรียงที่รองรับ: ทุกแบบต้องจบด้วย id เพื่อให้ลำดับคงที่ (ไม่ซ้ำ/ไม่ข้ามแถว)
+PRODUCT_ORDERINGS = {
+    "id": (models.Product.id,),
+    "branch": (models.Product.branch_id, models.Product.id),
+    "name": (models.Product.name, models.Product.id),
+}
+
+def encode_cursor(order_by: str, product: models.Product) -> str:
+    """
+    สร้าง cursor แบบ opaque จากแถวสุดท้ายของหน้า (client ไม่ต้องรู้โครงสร้างข้างใน)
+    """
+    keys = [getattr(product, col.key) for col in PRODUCT_ORDERINGS[order_by]]
+    raw = json.dumps({"o": order_by, "k": keys}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, order_by: str) -> list:
+    """
+    แปลง cursor กลับเป็นค่าคีย์ — ถ้า cursor เสียหรือไม่ตรงกับ order_by จะ raise ValueError
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        keys = data["k"]
+        ordering = data["o"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if ordering != order_by or len(keys) != len(PRODUCT_ORDERINGS[order_by]):
+        raise ValueError("Cursor does not match order_by")
+    return keys
+
 # ---------- Read (list + filters) ----------
-def get_products(
-    db: Session,
+def products_statement(
     skip: int = 0,
     limit: int = 100,
     name: str | None = None,
@@ -55,45 +301,759 @@ def get_products(
     min_price: float | None = None,
     max_price: float | None = None,
     branch_id: int | None = None,   # ✅ รับเข้ามา
+    order_by: str = "id",
+    after: list | None = None,      # ค่าคีย์จาก decode_cursor (โหมด cursor)
+    columns=None,                   # เลือกเฉพาะคอลัมน์ (ได้ row tuple แทน ORM object)
+    member_user_id: int | None = None,  # เฉพาะสาขาที่ user คนนี้เป็นสมาชิก (โหมด mine)
 ):
-    q = db.query(models.Product)
+    """
+    สร้าง SELECT ของ list สินค้า (ใช้ร่วมกันทั้ง Session ปกติและ AsyncSession)
+    limit=None = ไม่จำกัด
+    """
+    q = select(*columns) if columns else select(models.Product)
 
     if name:
-        q = q.filter(models.Product.name.ilike(f"%{name}%"))
+        q = q.where(models.Product.name.ilike(f"%{name}%"))
     if category:
-        q = q.filter(models.Product.category == category)
+        q = q.where(models.Product.category == category)
     if min_price is not None:
-        q = q.filter(models.Product.price >= min_price)
+        q = q.where(models.Product.price >= min_price)
     if max_price is not None:
-        q = q.filter(models.Product.price <= max_price)
+        q = q.where(models.Product.price <= max_price)
     if branch_id is not None:       # ✅ ฟิลเตอร์ตามสาขา
-        q = q.filter(models.Product.branch_id == branch_id)
+        q = q.where(models.Product.branch_id == branch_id)
+    if member_user_id is not None:
+        # ทุกสาขาที่เป็นสมาชิกใน query เดียว (= branch_id IN สาขาของ user) แทนการเรียกทีละสาขา
+        UBR = models.UserBranchRole
+        q = q.join(UBR, and_(UBR.branch_id == models.Product.branch_id, UBR.user_id == member_user_id))
+
+    cols = PRODUCT_ORDERINGS[order_by]
+    if after is not None:
+        # keyset: เริ่มต่อจากแถวสุดท้ายของหน้าก่อน ใช้ index ได้ ไม่ต้องสแกนแถวที่ข้าม
+        q = q.where(tuple_(*cols) > tuple_(*after))
+        skip = 0
+
+    return q.order_by(*cols).offset(skip).limit(limit)
+
+def get_products(db: Session, **kwargs):
+    return db.execute(products_statement(**kwargs)).scalars().all()
+
+# ---------- List แบบ lean (row tuple แทน ORM object) ----------
+# field ของ list ตามลำดับเดียวกับ schemas.Product (thumbnail_url คิดจาก image_url ตอน serialize)
+PRODUCT_FIELDS = (
+    "id", "name", "price", "quantity", "category", "image_url",
+    "branch_id", "unit", "reorder_threshold", "version", "created_at", "updated_at", "thumbnail_url",
+)
+
+def parse_product_fields(fields: str | None) -> tuple[str, ...]:
+    """
+    "id,name,quantity" → ("id", "name", "quantity") ตามลำดับใน PRODUCT_FIELDS, None = ทุก field
+    field ที่ไม่รู้จัก → ValueError
+    """
+    if not fields:
+        return PRODUCT_FIELDS
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(PRODUCT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    if not wanted:
+        raise ValueError("fields must not be empty")
+    return tuple(f for f in PRODUCT_FIELDS if f in wanted)
+
+def product_columns(fields: tuple[str, ...], order_by: str = "id") -> list:
+    """
+    คอลัมน์ที่ต้อง SELECT: field ที่ขอ + คีย์เรียง (สร้าง cursor) + image_url (thumbnail_url)
+    + created_at / updated_at (Last-Modified ของ response)
+    """
+    P = models.Product
+    names = [f for f in fields if f != "thumbnail_url"]
+    extra = [c.key for c in PRODUCT_ORDERINGS[order_by]] + ["created_at", "updated_at"]
+    if "thumbnail_url" in fields:
+        extra.append("image_url")
+    names += [n for n in dict.fromkeys(extra) if n not in names]
+    return [getattr(P, n) for n in names]
+
+def get_product_rows(db: Session, **kwargs) -> list:
+    return db.execute(products_statement(**kwargs)).all()
+
+def page_from_rows(rows: list, limit: int, order_by: str) -> dict:
+    """
+    rows ดึงมา limit + 1 แถว: ถ้าเกินแปลว่ายังมีหน้าถัดไป
+    """
+    items = rows[:limit]
+    next_cursor = encode_cursor(order_by, items[-1]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+def get_products_page(db: Session, limit: int = 100, order_by: str = "id", cursor: str | None = None, **filters) -> dict:
+    """
+    โหมด cursor: คืน items + next_cursor (None = หน้าสุดท้าย)
+    """
+    after = decode_cursor(cursor, order_by) if cursor else None
+    fetch = get_product_rows if filters.get("columns") else get_products
+    rows = fetch(db, limit=limit + 1, order_by=order_by, after=after, **filters)
+    return page_from_rows(rows, limit, order_by)
+
+# ---------- Inventory summary (aggregate ต่อสาขา × หมวด) ----------
+SUMMARY_FIELDS = ("product_count", "total_quantity", "total_value", "low_stock_count", "out_of_stock_count")
+
+def summary_contribution(price: float, quantity: int, reorder_threshold: int) -> tuple:
+    # ค่าที่สินค้าหนึ่งแถวนับเข้าไปใน aggregate (เรียงตาม SUMMARY_FIELDS)
+    return (1, quantity, price * quantity, int(quantity <= reorder_threshold), int(quantity == 0))
+
+class SummaryDelta:
+    """
+    สะสมผลต่างของ inventory_summary จากการเขียนใน transaction แล้ว upsert ทีเดียว (col = col + delta)
+    การบวกเพิ่มใน DB ไม่ทับค่าของ transaction อื่นที่เขียนพร้อมกัน
+    """
+    def __init__(self):
+        self.changes: dict[tuple[int, str], list] = {}
+
+    def _apply(self, branch_id: int, category: str | None, price: float, quantity: int, reorder_threshold: int, sign: int) -> None:
+        current = self.changes.setdefault((branch_id, category or ""), [0] * len(SUMMARY_FIELDS))
+        for i, value in enumerate(summary_contribution(price, quantity, reorder_threshold)):
+            current[i] += sign * value
+
+    def add(self, product) -> None:
+        self._apply(product.branch_id, product.category, product.price, product.quantity, product.reorder_threshold, 1)
+
+    def remove(self, product) -> None:
+        self._apply(product.branch_id, product.category, product.price, product.quantity, product.reorder_threshold, -1)
+
+    def adjusted(self, row, delta: int) -> None:
+        # row จาก adjust_stock_statement (ค่าหลังปรับ) → ค่าก่อนปรับ = quantity - delta
+        self._apply(row.branch_id, row.category, row.price, row.quantity - delta, row.reorder_threshold, -1)
+        self._apply(row.branch_id, row.category, row.price, row.quantity, row.reorder_threshold, 1)
+
+    def statement(self, db):
+        """None = ไม่มีอะไรเปลี่ยน"""
+        rows = [
+            {"branch_id": branch_id, "category": category, **dict(zip(SUMMARY_FIELDS, values))}
+            for (branch_id, category), values in self.changes.items()
+            if any(values)
+        ]
+        if not rows:
+            return None
+        S = models.InventorySummary
+        stmt = _insert(db)(S).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[S.branch_id, S.category],
+            set_={field: getattr(S, field) + stmt.excluded[field] for field in SUMMARY_FIELDS},
+        )
+
+def delete_branch_summary_statement(branch_id: int):
+    # SQLite ไม่บังคับ FK ON DELETE CASCADE → ลบเองด้วย
+    return delete(models.InventorySummary).where(models.InventorySummary.branch_id == branch_id)
+
+def refresh_summary_statements(db: Session, branch_ids=None) -> None:
+    """
+    คำนวณ aggregate ใหม่จาก products (ไม่ commit) — branch_ids = None คือทุกสาขา
+    """
+    S, P = models.InventorySummary, models.Product
+    category = func.coalesce(P.category, "")
+    source = select(
+        P.branch_id,
+        category,
+        func.count(),
+        func.coalesce(func.sum(P.quantity), 0),
+        func.coalesce(func.sum(P.price * P.quantity), 0),
+        func.sum(case((P.quantity <= P.reorder_threshold, 1), else_=0)),
+        func.sum(case((P.quantity == 0, 1), else_=0)),
+    ).group_by(P.branch_id, category)
+    clear = delete(S)
+    if branch_ids is not None:
+        source = source.where(P.branch_id.in_(branch_ids))
+        clear = clear.where(S.branch_id.in_(branch_ids))
+    db.execute(clear)
+    db.execute(_insert(db)(S).from_select(["branch_id", "category", *SUMMARY_FIELDS], source))
+
+def refresh_inventory_summary(db: Session, branch_ids=None) -> None:
+    refresh_summary_statements(db, branch_ids)
+    db.commit()
+
+def inventory_summary_statement(branch_ids=None, group_by: str | None = None):
+    """
+    อ่านจาก inventory_summary (แถวละสาขา × หมวด) — ขนาดไม่ขึ้นกับจำนวนสินค้า
+    group_by: None = รวมทั้งหมด / "branch" / "category"
+    """
+    S = models.InventorySummary
+    totals = [func.coalesce(func.sum(getattr(S, field)), 0).label(field) for field in SUMMARY_FIELDS]
+    if group_by is None:
+        stmt = select(*totals)
+    else:
+        if group_by == "branch":
+            stmt = (
+                select(S.branch_id, models.Branch.name.label("branch_name"), *totals)
+                .join(models.Branch, models.Branch.id == S.branch_id)
+                .group_by(S.branch_id, models.Branch.name)
+                .order_by(S.branch_id)
+            )
+        else:
+            stmt = select(S.category, *totals).group_by(S.category).order_by(S.category)
+        # แถวที่สินค้าย้าย/ถูกลบออกหมดแล้วเหลือค่า 0 ค้างอยู่ — ไม่ต้องแสดง
+        stmt = stmt.having(func.sum(S.product_count) > 0)
+    if branch_ids is not None:
+        stmt = stmt.where(S.branch_id.in_(branch_ids))
+    return stmt
+
+def get_inventory_summary(db: Session, branch_ids=None, group_by: str | None = None) -> list:
+    return db.execute(inventory_summary_statement(branch_ids, group_by)).mappings().all()
+
+# ---------- Low stock (watchlist) ----------
+def low_stock_statement(branch_ids=None, category: str | None = None, skip: int = 0, limit: int = 100):
+    """
+    สินค้าที่ quantity <= reorder_threshold เรียงจากเหลือน้อยสุด
+    เงื่อนไขตรงกับ predicate ของ partial index ix_products_low_stock → อ่านเฉพาะแถวที่ใกล้หมด ไม่ scan ทั้ง catalog
+    """
+    P = models.Product
+    stmt = select(P).where(P.quantity <= P.reorder_threshold)
+    if branch_ids is not None:
+        stmt = stmt.where(P.branch_id.in_(branch_ids))
+    if category is not None:
+        stmt = stmt.where(P.category == category)
+    return stmt.order_by(P.quantity, P.id).offset(skip).limit(limit)
+
+def get_low_stock(db: Session, **kwargs) -> list[models.Product]:
+    return db.execute(low_stock_statement(**kwargs)).scalars().all()
+
+# ---------- Stock movement ledger ----------
+STOCK_MOVEMENT_PARTITIONS_AHEAD = int(os.getenv("STOCK_MOVEMENT_PARTITIONS_AHEAD", "3"))
+# process ที่รันนานกว่าช่วงที่สร้างไว้ตอน start ต้องสร้างเดือนถัดไปเอง (ค่าเริ่มต้น 6 ชั่วโมง)
+STOCK_MOVEMENT_PARTITION_CHECK_SECONDS = float(os.getenv("STOCK_MOVEMENT_PARTITION_CHECK_SECONDS", "21600"))
+
+class ProductSnapshot(NamedTuple):
+    branch_id: int
+    category: str | None
+    price: float
+    quantity: int
+    reorder_threshold: int
+
+    @classmethod
+    def of(cls, product) -> "ProductSnapshot":
+        return cls(product.branch_id, product.category, product.price, product.quantity, product.reorder_threshold)
+
+def stock_movements_statement(movements: list[dict]):
+    # multi-row INSERT ไม่มี RETURNING — ต้นทุนต่อการเขียนหนึ่งครั้งคงที่
+    return insert(models.StockMovement).values(movements) if movements else None
+
+class ChangeSet:
+    """
+    สิ่งที่ต้องเขียนเพิ่มใน transaction เดียวกับการแก้ products: inventory_summary + stock_movements
+    """
+    def __init__(self, user_id: int | None = None):
+        self.user_id = user_id
+        self.summary = SummaryDelta()
+        self.movements: list[dict] = []
+
+    def movement(self, product_id: int, branch_id: int, delta: int, quantity_after: int, reason: str) -> None:
+        if delta:
+            self.movements.append({
+                "product_id": product_id, "branch_id": branch_id, "user_id": self.user_id,
+                "delta": delta, "quantity_after": quantity_after, "reason": reason,
+            })
 
-    return q.offset(skip).limit(limit).all()
+    def created(self, product) -> None:
+        self.summary.add(product)
+        self.movement(product.id, product.branch_id, product.quantity, product.quantity, "create")
+
+    def updated(self, old: ProductSnapshot, product) -> None:
+        self.summary.remove(old)
+        self.summary.add(product)
+        if product.branch_id != old.branch_id:
+            # ย้ายสาขา = ของออกจากสาขาเดิมทั้งหมด แล้วเข้าสาขาใหม่
+            self.movement(product.id, old.branch_id, -old.quantity, 0, "transfer_out")
+            self.movement(product.id, product.branch_id, product.quantity, product.quantity, "transfer_in")
+        else:
+            self.movement(product.id, product.branch_id, product.quantity - old.quantity, product.quantity, "update")
+
+    def upserted(self, old: ProductSnapshot | None, row) -> None:
+        # row จาก RETURNING ของ bulk upsert, old = None คือแถวใหม่
+        if old is not None:
+            self.summary.remove(old)
+        self.summary.add(row)
+        self.movement(row.id, row.branch_id, row.quantity - (old.quantity if old else 0), row.quantity, "bulk")
+
+    def deleted(self, product) -> None:
+        self.summary.remove(product)
+        self.movement(product.id, product.branch_id, -product.quantity, 0, "delete")
+
+    def adjusted(self, row, delta: int, reason: str = "adjust") -> None:
+        self.summary.adjusted(row, delta)
+        self.movement(row.id, row.branch_id, delta, row.quantity, reason)
+
+    def statements(self, db) -> list:
+        return [stmt for stmt in (self.summary.statement(db), stock_movements_statement(self.movements)) if stmt is not None]
+
+def _month_start(day: date, months: int = 0) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def _create_stock_movement_partition(db: Session, name: str, start: date, end: date) -> None:
+    bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    in_range = f"created_at >= '{start.isoformat()}' AND created_at < '{end.isoformat()}'"
+    # ไม่ให้มีแถวใหม่ของช่วงนี้ลง default ระหว่างย้าย (ATTACH ตรวจ default อีกรอบอยู่แล้ว)
+    db.execute(text("LOCK TABLE stock_movements_default IN SHARE ROW EXCLUSIVE MODE"))
+    if not db.execute(text(f"SELECT EXISTS (SELECT 1 FROM stock_movements_default WHERE {in_range})")).scalar():
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF stock_movements {bounds}"))
+        return
+    # default มีแถวของเดือนนี้แล้ว (แอปรันเลยช่วงที่สร้างไว้) — PARTITION OF จะล้ม
+    # → สร้างตารางแยก ย้ายแถวออกจาก default แล้วค่อย ATTACH (index ของตารางแม่ถูกสร้างให้ตอน attach)
+    db.execute(text(f"CREATE TABLE {name} (LIKE stock_movements INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    db.execute(text(
+        f"WITH moved AS (DELETE FROM stock_movements_default WHERE {in_range} RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ))
+    db.execute(text(f"ALTER TABLE stock_movements ATTACH PARTITION {name} {bounds}"))
+
+def ensure_stock_movement_partitions(db: Session, months_ahead: int = STOCK_MOVEMENT_PARTITIONS_AHEAD) -> list[str]:
+    """
+    สร้าง partition รายเดือนล่วงหน้า (PostgreSQL เท่านั้น) — เรียกตอน start แอปและทุก STOCK_MOVEMENT_PARTITION_CHECK_SECONDS
+    insert ที่ไม่มี partition รองรับไม่ล้ม (ลง stock_movements_default) และเดือนนั้นถูกย้ายออกจาก default ตอนสร้างรอบถัดไป
+    แต่ละ partition อยู่ใน savepoint ของตัวเอง: สร้างไม่สำเร็จ (เช่น worker อื่นสร้างพร้อมกัน) ข้ามไปเดือนถัดไป
+    คืนชื่อ partition ที่สร้างในรอบนี้จริง
+    """
+    if not _is_postgres(db):
+        return []
+    created = []
+    today = date.today()
+    for i in range(months_ahead + 1):
+        start, end = _month_start(today, i), _month_start(today, i + 1)
+        name = f"stock_movements_y{start:%Y}m{start:%m}"
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+            continue
+        try:
+            with db.begin_nested():
+                _create_stock_movement_partition(db, name, start, end)
+            created.append(name)
+        except DBAPIError as e:
+            print(f"⚠️ stock_movements partition {name} not created: {_db_error_message(e)}")
+    db.commit()
+    return created
+
+def stock_movements_query(branch_ids=None, product_id: int | None = None,
+                          since: datetime | None = None, until: datetime | None = None, limit: int = 100):
+    """
+    ช่วงเวลา [since, until) — PostgreSQL ตัด partition ที่ไม่เกี่ยวออก และใช้ BRIN ภายใน partition
+    """
+    M = models.StockMovement
+    stmt = select(M).order_by(M.created_at.desc(), M.id.desc()).limit(limit)
+    if branch_ids is not None:
+        stmt = stmt.where(M.branch_id.in_(branch_ids))
+    if product_id is not None:
+        stmt = stmt.where(M.product_id == product_id)
+    if since is not None:
+        stmt = stmt.where(M.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(M.created_at < until)
+    return stmt
+
+def get_stock_movements(db: Session, **kwargs) -> List[models.StockMovement]:
+    return db.execute(stock_movements_query(**kwargs)).scalars().all()
+
+# ---------- Delta sync ----------
+# token ไม่เดินหน้าเกิน now() - lag: transaction ที่เริ่มก่อนแต่ commit ทีหลัง (updated_at เก่ากว่า)
+# จะยังถูกส่งในรอบถัดไป — แลกกับการส่งแถวช่วง lag ซ้ำ (client upsert ทับได้)
+SYNC_SAFETY_LAG_SECONDS = float(os.getenv("SYNC_SAFETY_LAG_SECONDS", "5"))
+
+def encode_sync_token(products_key: tuple, tombstones_key: tuple) -> str:
+    raw = json.dumps({
+        "p": [products_key[0].isoformat(), products_key[1]],
+        "d": [tombstones_key[0].isoformat(), tombstones_key[1]],
+    }, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_sync_token(token: str) -> tuple[tuple, tuple]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return tuple(
+            (datetime.fromisoformat(data[k][0]), int(data[k][1]))
+            for k in ("p", "d")
+        )
+    except (ValueError, KeyError, TypeError, IndexError):
+        raise ValueError("Invalid sync token")
+
+def _sync_time(db: Session, value):
+    # SQLite เก็บเวลาเป็นข้อความ (now() ไม่มีเศษวินาที แต่ค่าที่ bind มี) → เทียบผ่าน datetime() ทั้งสองฝั่ง
+    return func.datetime(value) if db.get_bind().dialect.name == "sqlite" else value
+
+def product_changes_statement(db: Session, branch_ids, after: tuple | None, limit: int):
+    P = models.Product
+    changed_at = func.coalesce(P.updated_at, P.created_at)
+    stmt = select(P, changed_at.label("changed_at")).order_by(changed_at, P.id).limit(limit)
+    if branch_ids is not None:
+        stmt = stmt.where(P.branch_id.in_(branch_ids))
+    if after is not None:
+        stmt = stmt.where(tuple_(_sync_time(db, changed_at), P.id) > tuple_(_sync_time(db, after[0]), after[1]))
+    return stmt
+
+def tombstones_statement(db: Session, branch_ids, after: tuple, limit: int):
+    P, T = models.Product, models.ProductTombstone
+    # สินค้าที่ยังอยู่ในขอบเขตเดียวกัน (ย้ายออกแล้วย้ายกลับ / ย้ายระหว่างสาขาที่ Owner เห็นทั้งคู่) ไม่นับว่าถูกลบ
+    still_visible = select(P.id).where(P.id == T.product_id)
+    if branch_ids is not None:
+        still_visible = still_visible.where(P.branch_id.in_(branch_ids))
+    stmt = (
+        select(T)
+        .where(tuple_(_sync_time(db, T.deleted_at), T.id) > tuple_(_sync_time(db, after[0]), after[1]))
+        .where(~still_visible.exists())
+        .order_by(T.deleted_at, T.id)
+        .limit(limit)
+    )
+    if branch_ids is not None:
+        stmt = stmt.where(T.branch_id.in_(branch_ids))
+    return stmt
+
+def get_product_changes(db: Session, branch_ids=None, since: str | None = None, limit: int = 500) -> dict:
+    """
+    สินค้าที่เพิ่ม/แก้ไข/ลบ หลัง sync token (since) — ไม่ส่ง since = ขอ snapshot ทั้งหมดครั้งแรก
+    client ควรลบตาม deleted ก่อนแล้วค่อย upsert ตาม upserted
+    """
+    products_after, tombstones_after = decode_sync_token(since) if since else (None, None)
+    now = db.execute(select(func.now())).scalar_one()
+    floor = (now - timedelta(seconds=SYNC_SAFETY_LAG_SECONDS), 0)
+
+    rows = db.execute(product_changes_statement(db, branch_ids, products_after, limit + 1)).all()
+    products_more = len(rows) > limit
+    rows = rows[:limit]
+    products_key = (rows[-1].changed_at, rows[-1][0].id) if products_more else floor
+
+    deleted, tombstones_more, tombstones_key = [], False, floor
+    if tombstones_after is not None:
+        tombstones = db.execute(tombstones_statement(db, branch_ids, tombstones_after, limit + 1)).scalars().all()
+        tombstones_more = len(tombstones) > limit
+        tombstones = tombstones[:limit]
+        deleted = list(dict.fromkeys(t.product_id for t in tombstones))
+        if tombstones_more:
+            tombstones_key = (tombstones[-1].deleted_at, tombstones[-1].id)
+
+    return {
+        "upserted": [row[0] for row in rows],
+        "deleted": deleted,
+        "next_token": encode_sync_token(products_key, tombstones_key),
+        "has_more": products_more or tombstones_more,
+    }
+
+# ---------- Export (streaming) ----------
+EXPORT_COLUMNS = (
+    "id", "name", "category", "price", "quantity", "reorder_threshold", "unit",
+    "branch_id", "image_url", "version", "created_at", "updated_at",
+)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+
+def iter_product_rows(bind, order_by: str = "id", **filters):
+    """
+    ดึงสินค้าที่ตรง filter ทีละ batch (list ของ row tuple ตาม EXPORT_COLUMNS) ด้วย server-side cursor
+    ใช้ connection ของตัวเอง: session ของ request ปิดไปก่อนที่ StreamingResponse จะส่งเสร็จ
+    หน่วยความจำคงที่ไม่ว่าจะ export กี่แถว (ถือ connection ไว้ตลอดการ export)
+    """
+    P = models.Product
+    stmt = products_statement(
+        limit=None, order_by=order_by, columns=[getattr(P, c) for c in EXPORT_COLUMNS], **filters,
+    )
+    with bind.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE).execute(stmt)
+        for batch in result.partitions():
+            yield batch
+
+# ---------- Search (ranked) + autocomplete ----------
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_products(
+    db: Session,
+    q: str,
+    branch_ids: list[int] | None = None,
+    category: str | None = None,
+    limit: int = 20,
+) -> list[tuple[models.Product, float]]:
+    """
+    ค้นหาชื่อแบบจัดอันดับ: PostgreSQL ใช้ word_similarity ของ pg_trgm (GIN index ix_products_name_trgm)
+    ฐานข้อมูลอื่นใช้ index ในหน่วยความจำ (search_index) ที่คิดคะแนนแบบเดียวกัน
+    """
+    P = models.Product
+    if _is_postgres(db):
+        score = func.word_similarity(q, P.name).label("score")
+        stmt = select(P, score).where(or_(
+            literal(q).op("<%")(P.name),
+            P.name.ilike(f"%{_escape_like(q)}%", escape="\\"),
+        ))
+        if branch_ids is not None:
+            stmt = stmt.where(P.branch_id.in_(branch_ids))
+        if category:
+            stmt = stmt.where(P.category == category)
+        return [(p, s) for p, s in db.execute(stmt.order_by(score.desc(), P.id).limit(limit)).all()]
+
+    import search_index
+    hits = search_index.get_index(db).search(q, branch_ids=branch_ids, category=category, limit=limit)
+    products = {p.id: p for p in db.execute(select(P).where(P.id.in_([i for i, _ in hits]))).scalars()}
+    return [(products[i], s) for i, s in hits if i in products]
+
+def autocomplete_products(db: Session, prefix: str, branch_ids: list[int] | None = None, limit: int = 10) -> list[str]:
+    """
+    ชื่อสินค้าที่ขึ้นต้นด้วย prefix (ไม่สนตัวพิมพ์) — PostgreSQL ใช้ index lower(name) text_pattern_ops
+    """
+    P = models.Product
+    if _is_postgres(db):
+        lowered = func.lower(P.name)
+        stmt = select(P.name).where(lowered.like(_escape_like(prefix.lower()) + "%", escape="\\"))
+        if branch_ids is not None:
+            stmt = stmt.where(P.branch_id.in_(branch_ids))
+        stmt = stmt.group_by(P.name).order_by(func.min(lowered), P.name).limit(limit)
+        return list(db.execute(stmt).scalars())
+
+    import search_index
+    return search_index.get_index(db).autocomplete(prefix, branch_ids=branch_ids, limit=limit)
+
+# ---------- Nearby stock (สาขาใกล้สุดที่มีของ) ----------
+def branch_stock_statement(name: str | None = None, category: str | None = None):
+    """จำนวนที่มีของ (quantity > 0) ต่อสาขา ของสินค้าชื่อ / หมวดที่ระบุ"""
+    P = models.Product
+    stmt = select(
+        P.branch_id,
+        func.sum(P.quantity).label("quantity"),
+        func.count().label("product_count"),
+    ).where(P.quantity > 0)
+    if name is not None:
+        stmt = stmt.where(P.name == name)
+    if category is not None:
+        stmt = stmt.where(P.category == category)
+    return stmt.group_by(P.branch_id)
+
+def nearby_stock(
+    db: Session,
+    lat: float,
+    lng: float,
+    name: str | None = None,
+    category: str | None = None,
+    radius_m: float | None = None,
+    k: int = 10,
+) -> list[tuple[models.Branch, int, int, float]]:
+    """
+    สาขาที่มีสินค้าในรัศมี radius_m (หรือ k สาขาใกล้สุด) คืน [(branch, quantity, product_count, ระยะเมตร)] เรียงใกล้ → ไกล
+    PostgreSQL ใช้ earthdistance + GiST index ix_branches_location_earth (query เดียว)
+    ฐานข้อมูลอื่นใช้ KD-tree ในหน่วยความจำ (geo_index) ที่คิดระยะแบบเดียวกัน
+    """
+    B = models.Branch
+    if _is_postgres(db):
+        stock = branch_stock_statement(name, category).subquery()
+        here = func.ll_to_earth(float(lat), float(lng))
+        there = func.ll_to_earth(B.latitude, B.longitude)
+        distance = func.earth_distance(here, there)
+        stmt = (
+            select(B, stock.c.quantity, stock.c.product_count, distance)
+            .join(stock, stock.c.branch_id == B.id)
+            .where(B.latitude.isnot(None), B.longitude.isnot(None))
+        )
+        if radius_m is not None:
+            # earth_box เป็นกล่องล้อมรัศมี (ใช้ index) แล้วตัดมุมกล่องด้วยระยะจริง
+            radius_m = float(radius_m)
+            stmt = stmt.where(func.earth_box(here, radius_m).op("@>")(there), distance <= radius_m)
+        # <-> ของ cube = ระยะเส้นตรง 3 มิติ เรียงเหมือน earth_distance และใช้ GiST แบบ KNN ได้
+        stmt = stmt.order_by(there.op("<->")(here)).limit(k)
+        return [(b, int(q), c, float(d)) for b, q, c, d in db.execute(stmt).all()]
+
+    import geo_index
+    stock = {b: (int(q), c) for b, q, c in db.execute(branch_stock_statement(name, category)).all()}
+    hits = geo_index.get_index(db).nearest(lat, lng, k=k, radius_m=radius_m, accept=stock.__contains__)
+    branches = {b.id: b for b in db.execute(select(B).where(B.id.in_([i for i, _ in hits]))).scalars()}
+    return [(branches[i], *stock[i], d) for i, d in hits if i in branches]
 
 # ---------- Read one ----------
 def get_product(db: Session, product_id: int) -> models.Product | None:
     return db.get(models.Product, product_id)
 
+# ---------- Read many (multi-get) ----------
+PRODUCT_BATCH_MAX = 500
+
+def parse_product_ids(ids: str) -> list[int]:
+    """
+    "12,7,12,30" → [12, 7, 30] (ตัดตัวซ้ำ คงลำดับเดิม) — ไม่ใช่ตัวเลข / เกิน PRODUCT_BATCH_MAX → ValueError
+    """
+    parsed: dict[int, None] = {}
+    for part in ids.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit():
+            raise ValueError(f"Invalid product id: {part}")
+        parsed[int(part)] = None
+    if not parsed:
+        raise ValueError("ids must not be empty")
+    if len(parsed) > PRODUCT_BATCH_MAX:
+        raise ValueError(f"At most {PRODUCT_BATCH_MAX} ids per request")
+    return list(parsed)
+
+def products_by_ids_statement(ids: list[int]):
+    return select(models.Product).where(models.Product.id.in_(ids))
+
+def get_products_by_ids(db: Session, ids: list[int]) -> dict[int, models.Product]:
+    """สินค้าหลายตัวใน query เดียว คืน {id: product} เฉพาะที่มีอยู่"""
+    return {p.id: p for p in db.execute(products_by_ids_statement(ids)).scalars()}
+
 # ---------- Update ----------
-def update_product(db: Session, product_id: int, patch: schemas.ProductUpdate):
-    db_obj = db.get(models.Product, product_id)
+def update_product(db: Session, product_id: int, patch: schemas.ProductUpdate, user_id: int | None = None):
+    # ล็อกแถวก่อนอ่านค่าเดิม: summary / ledger คิดจาก new - old ต้องไม่ชนกับการเขียนพร้อมกัน
+    # populate_existing: route โหลดแถวนี้ไว้ใน session แล้ว (ตรวจสิทธิ์) ต้องใช้ค่าที่อ่านตอนล็อก
+    db_obj = db.get(models.Product, product_id, with_for_update=True, populate_existing=True)
     if not db_obj:
         return None
 
+    old = ProductSnapshot.of(db_obj)
+    old_branch_id = db_obj.branch_id
     data = patch.model_dump(exclude_unset=True)
     for k, v in data.items():
         setattr(db_obj, k, v)
+    db_obj.version = models.Product.version + 1
+    changes = ChangeSet(user_id)
+    changes.updated(old, db_obj)
+    if db_obj.branch_id != old_branch_id:
+        # ย้ายสาขา: client ของสาขาเดิมต้องลบออกจากเครื่อง
+        db.add(models.ProductTombstone(product_id=product_id, branch_id=old_branch_id))
 
     db.add(db_obj)
-    db.commit()
+    try:
+        for stmt in changes.statements(db):
+            db.execute(stmt)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if is_duplicate_product(e):
+            raise DuplicateProductError() from e
+        raise
     db.refresh(db_obj)
+    products_changed({old_branch_id, db_obj.branch_id})
     return db_obj
 
 # ---------- Delete ----------
-def delete_product(db: Session, product_id: int) -> bool:
-    db_obj = db.get(models.Product, product_id)
+def delete_product(db: Session, product_id: int, user_id: int | None = None) -> bool:
+    db_obj = db.get(models.Product, product_id, with_for_update=True, populate_existing=True)     # เหมือน update_product
     if not db_obj:
         return False
+    branch_id = db_obj.branch_id
+    changes = ChangeSet(user_id)
+    changes.deleted(db_obj)
     db.delete(db_obj)
+    db.add(models.ProductTombstone(product_id=product_id, branch_id=branch_id))
+    for stmt in changes.statements(db):
+        db.execute(stmt)
+    db.commit()
+    products_changed({branch_id})
+    return True
+
+# ---------- Stock adjustment (delta) ----------
+# reason -> (HTTP status, detail)
+STOCK_ADJUST_ERRORS = {
+    "not_found": (404, "Product not found"),
+    "forbidden": (403, "Not a member of this branch"),
+    "version_conflict": (409, "Version conflict"),
+    "insufficient_stock": (409, "Insufficient stock"),
+}
+
+class StockAdjustError(Exception):
+    """
+    reason: not_found / forbidden / version_conflict / insufficient_stock
+    """
+    def __init__(self, reason: str, product_id: int, index: int | None = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.product_id = product_id
+        self.index = index
+
+    @property
+    def status_code(self) -> int:
+        return STOCK_ADJUST_ERRORS[self.reason][0]
+
+    @property
+    def detail(self):
+        detail = STOCK_ADJUST_ERRORS[self.reason][1]
+        if self.index is not None:
+            return {"detail": detail, "index": self.index, "product_id": self.product_id}
+        return detail
+
+def adjust_stock_statement(product_id: int, delta: int, expected_version: int | None, branch_ids):
+    """
+    UPDATE ... SET quantity = quantity + :delta ... RETURNING ในคำสั่งเดียว (ไม่ต้อง get ก่อน)
+    เงื่อนไขทั้งหมด (สิทธิ์สาขา / version / ห้ามติดลบ) อยู่ใน WHERE — ไม่ได้แถวกลับมา = ไม่ผ่าน
+    """
+    P = models.Product
+    stmt = (
+        update(P)
+        .where(P.id == product_id, P.quantity + delta >= 0)
+        .values(quantity=P.quantity + delta, version=P.version + 1, updated_at=func.now())
+        .returning(P.id, P.name, P.branch_id, P.quantity, P.version, P.price, P.category, P.reorder_threshold)
+        .execution_options(synchronize_session=False)
+    )
+    if expected_version is not None:
+        stmt = stmt.where(P.version == expected_version)
+    if branch_ids is not None:
+        stmt = stmt.where(P.branch_id.in_(branch_ids))
+    return stmt
+
+def adjust_failure_statement(product_id: int):
+    P = models.Product
+    return select(P.branch_id, P.quantity, P.version).where(P.id == product_id)
+
+def adjust_failure_reason(current, expected_version: int | None, branch_ids) -> str:
+    if current is None:
+        return "not_found"
+    if branch_ids is not None and current.branch_id not in branch_ids:
+        return "forbidden"
+    if expected_version is not None and current.version != expected_version:
+        return "version_conflict"
+    return "insufficient_stock"
+
+def _adjust_stock(db: Session, product_id: int, delta: int, expected_version: int | None, branch_ids) -> tuple:
+    row = db.execute(adjust_stock_statement(product_id, delta, expected_version, branch_ids)).first()
+    if row is not None:
+        return row
+
+    # ไม่สำเร็จ → ค่อยอ่านแถวปัจจุบันเพื่อบอกเหตุผล (เกิดเฉพาะกรณีผิดพลาด)
+    current = db.execute(adjust_failure_statement(product_id)).first()
+    raise StockAdjustError(adjust_failure_reason(current, expected_version, branch_ids), product_id)
+
+def adjust_stock(db: Session, product_id: int, delta: int, expected_version: int | None = None, branch_ids=None,
+                 user_id: int | None = None, reason: str = "adjust"):
+    """
+    ปรับสต็อกแบบ delta (atomic) — branch_ids = สาขาที่ user มีสิทธิ์ (None = Owner)
+    """
+    try:
+        row = _adjust_stock(db, product_id, delta, expected_version, branch_ids)
+    except StockAdjustError:
+        db.rollback()
+        raise
+    changes = ChangeSet(user_id)
+    changes.adjusted(row, delta, reason)
+    for stmt in changes.statements(db):
+        db.execute(stmt)
+    db.commit()
+    products_changed({row.branch_id})
+    return row
+
+def adjust_stock_batch(db: Session, items: list[schemas.StockAdjustmentItem], branch_ids=None, user_id: int | None = None) -> list:
+    """
+    ปรับหลายรายการใน transaction เดียว: ผ่านทั้งหมด หรือ rollback ทั้งหมด
+    ทำตามลำดับ product_id เพื่อให้ลำดับการล็อกแถวเหมือนกันทุก request (กัน deadlock)
+    """
+    results = [None] * len(items)
+    order = sorted(range(len(items)), key=lambda i: items[i].product_id)
+    try:
+        for i in order:
+            item = items[i]
+            try:
+                results[i] = _adjust_stock(db, item.product_id, item.delta, item.expected_version, branch_ids)
+            except StockAdjustError as e:
+                e.index = i
+                raise
+        changes = ChangeSet(user_id)
+        for item, row in zip(items, results):
+            changes.adjusted(row, item.delta, item.reason)
+        for stmt in changes.statements(db):
+            db.execute(stmt)
+    except Exception:
+        db.rollback()
+        raise
     db.commit()
+    products_changed({row.branch_id for row in results})
+    return results
@@ -0,0 +1,172 @@
+# crud_async.py — เวอร์ชัน async ของ crud.py (ใช้กับ AsyncSession เมื่อ DB_ASYNC=1)
+# สร้าง statement ด้วยฟังก์ชันเดียวกับ crud.py เพื่อให้ผลลัพธ์ตรงกันทั้งสองทาง
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import models, schemas, crud
+from cache import invalidate_all_roles, products_changed
+
+# ---------- Branch ----------
+async def get_branches(db: AsyncSession, member_user_id: int | None = None) -> List[models.Branch]:
+    return (await db.execute(crud.branches_statement(member_user_id))).scalars().all()
+
+async def create_branch(db: AsyncSession, data: schemas.BranchCreate) -> models.Branch:
+    obj = models.Branch(id=data.id, name=data.name, location=data.location)
+    db.add(obj)
+    await db.commit()
+    await db.refresh(obj)
+    return obj
+
+async def update_branch(db: AsyncSession, branch_id: int, data: schemas.BranchUpdate) -> Optional[models.Branch]:
+    obj = await db.get(models.Branch, branch_id)
+    if not obj:
+        return None
+    if data.name is not None:
+        obj.name = data.name
+    if data.location is not None:
+        obj.location = data.location
+    await db.commit()
+    await db.refresh(obj)
+    return obj
+
+async def delete_branch(db: AsyncSession, branch_id: int) -> bool:
+    obj = await db.get(models.Branch, branch_id)
+    if not obj:
+        return False
+    await db.execute(crud.bump_member_role_versions_statement(branch_id))
+    await db.execute(crud.delete_branch_summary_statement(branch_id))
+    await db.delete(obj)
+    await db.commit()
+    invalidate_all_roles()
+    products_changed({branch_id})
+    return True
+
+# ------- Product ---------
+async def create_product(db: AsyncSession, product: schemas.ProductCreate, user_id: int | None = None):
+    db_product = models.Product(**product.model_dump(exclude_unset=True))
+    db.add(db_product)
+    try:
+        await db.flush()
+        changes = crud.ChangeSet(user_id)
+        changes.created(db_product)
+        for stmt in changes.statements(db):
+            await db.execute(stmt)
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if crud.is_duplicate_product(e):
+            raise crud.DuplicateProductError() from e
+        raise
+    await db.refresh(db_product)
+    products_changed({db_product.branch_id})
+    return db_product
+
+async def get_products(db: AsyncSession, **kwargs):
+    return (await db.execute(crud.products_statement(**kwargs))).scalars().all()
+
+async def get_product_rows(db: AsyncSession, **kwargs) -> list:
+    return (await db.execute(crud.products_statement(**kwargs))).all()
+
+async def get_products_page(db: AsyncSession, limit: int = 100, order_by: str = "id", cursor: str | None = None, **filters) -> dict:
+    after = crud.decode_cursor(cursor, order_by) if cursor else None
+    fetch = get_product_rows if filters.get("columns") else get_products
+    rows = await fetch(db, limit=limit + 1, order_by=order_by, after=after, **filters)
+    return crud.page_from_rows(rows, limit, order_by)
+
+async def get_product(db: AsyncSession, product_id: int) -> models.Product | None:
+    return await db.get(models.Product, product_id)
+
+async def get_products_by_ids(db: AsyncSession, ids: list[int]) -> dict[int, models.Product]:
+    return {p.id: p for p in (await db.execute(crud.products_by_ids_statement(ids))).scalars()}
+
+async def update_product(db: AsyncSession, product_id: int, patch: schemas.ProductUpdate, user_id: int | None = None):
+    # ล็อกแถวก่อนอ่านค่าเดิม (ดู crud.update_product)
+    db_obj = await db.get(models.Product, product_id, with_for_update=True, populate_existing=True)
+    if not db_obj:
+        return None
+
+    old = crud.ProductSnapshot.of(db_obj)
+    old_branch_id = db_obj.branch_id
+    data = patch.model_dump(exclude_unset=True)
+    for k, v in data.items():
+        setattr(db_obj, k, v)
+    db_obj.version = models.Product.version + 1
+    changes = crud.ChangeSet(user_id)
+    changes.updated(old, db_obj)
+    if db_obj.branch_id != old_branch_id:
+        db.add(models.ProductTombstone(product_id=product_id, branch_id=old_branch_id))
+    try:
+        for stmt in changes.statements(db):
+            await db.execute(stmt)
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if crud.is_duplicate_product(e):
+            raise crud.DuplicateProductError() from e
+        raise
+    await db.refresh(db_obj)
+    products_changed({old_branch_id, db_obj.branch_id})
+    return db_obj
+
+async def delete_product(db: AsyncSession, product_id: int, user_id: int | None = None) -> bool:
+    db_obj = await db.get(models.Product, product_id, with_for_update=True, populate_existing=True)
+    if not db_obj:
+        return False
+    branch_id = db_obj.branch_id
+    changes = crud.ChangeSet(user_id)
+    changes.deleted(db_obj)
+    await db.delete(db_obj)
+    db.add(models.ProductTombstone(product_id=product_id, branch_id=branch_id))
+    for stmt in changes.statements(db):
+        await db.execute(stmt)
+    await db.commit()
+    products_changed({branch_id})
+    return True
+
+# ---------- Stock adjustment (delta) ----------
+async def _adjust_stock(db: AsyncSession, product_id: int, delta: int, expected_version: int | None, branch_ids) -> tuple:
+    row = (await db.execute(crud.adjust_stock_statement(product_id, delta, expected_version, branch_ids))).first()
+    if row is not None:
+        return row
+
+    current = (await db.execute(crud.adjust_failure_statement(product_id))).first()
+    raise crud.StockAdjustError(crud.adjust_failure_reason(current, expected_version, branch_ids), product_id)
+
+async def adjust_stock(db: AsyncSession, product_id: int, delta: int, expected_version: int | None = None, branch_ids=None,
+                       user_id: int | None = None, reason: str = "adjust"):
+    try:
+        row = await _adjust_stock(db, product_id, delta, expected_version, branch_ids)
+    except crud.StockAdjustError:
+        await db.rollback()
+        raise
+    changes = crud.ChangeSet(user_id)
+    changes.adjusted(row, delta, reason)
+    for stmt in changes.statements(db):
+        await db.execute(stmt)
+    await db.commit()
+    products_changed({row.branch_id})
+    return row
+
+async def adjust_stock_batch(db: AsyncSession, items: list[schemas.StockAdjustmentItem], branch_ids=None, user_id: int | None = None) -> list:
+    results = [None] * len(items)
+    order = sorted(range(len(items)), key=lambda i: items[i].product_id)
+    try:
+        for i in order:
+            item = items[i]
+            try:
+                results[i] = await _adjust_stock(db, item.product_id, item.delta, item.expected_version, branch_ids)
+            except crud.StockAdjustError as e:
+                e.index = i
+                raise
+        changes = crud.ChangeSet(user_id)
+        for item, row in zip(items, results):
+            changes.adjusted(row, item.delta, item.reason)
+        for stmt in changes.statements(db):
+            await db.execute(stmt)
+    except Exception:
+        await db.rollback()
+        raise
+    await db.commit()
+    products_changed({row.branch_id for row in results})
+    return results
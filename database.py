@@ -1,18 +1,75 @@
 import os
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool, instrument_engine
+
 # อ่านจาก ENV ชื่อ DATABASE_URL
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set in environment variables")
 
+# ===== Connection pool (ค่าเริ่มต้นเท่ากับ QueuePool ของ SQLAlchemy) =====
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))      # วินาทีที่ยอมรอ connection ว่าง
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))        # ปิด connection ที่อายุเกินกี่วินาที (-1 = ไม่ปิด)
+# วิธีตรวจว่า connection ยังใช้ได้:
+#   pre_ping  = SELECT 1 ทุกครั้งที่ checkout (ปลอดภัยสุด แต่เพิ่ม 1 round-trip ต่อ request)
+#   idle_ping = ping เฉพาะ connection ที่ว่างนานเกิน DB_POOL_IDLE_PING_SECONDS
+#   none      = ไม่ ping (ใช้คู่กับ DB_POOL_RECYCLE ที่สั้นกว่า idle timeout ของ server)
+DB_POOL_LIVENESS = os.getenv("DB_POOL_LIVENESS", "pre_ping")
+DB_POOL_IDLE_PING_SECONDS = float(os.getenv("DB_POOL_IDLE_PING_SECONDS", "30"))
+
+if DB_POOL_LIVENESS not in ("pre_ping", "idle_ping", "none"):
+    raise RuntimeError("DB_POOL_LIVENESS must be one of: pre_ping, idle_ping, none")
+
+
+def _pool_options(url: str, poolclass) -> dict:
+    options = {"pool_pre_ping": DB_POOL_LIVENESS == "pre_ping", "pool_recycle": DB_POOL_RECYCLE}
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite" and u.database in (None, "", ":memory:"):
+        return options   # SQLite in-memory ใช้ pool เฉพาะของมัน
+    options.update(
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    return options
+
+
+def _install_idle_ping(sync_engine) -> None:
+    @event.listens_for(sync_engine, "checkin")
+    def _mark_idle(dbapi_conn, record):
+        record.info["idle_since"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "checkout")
+    def _ping_if_idle(dbapi_conn, record, proxy):
+        idle_since = record.info.get("idle_since")
+        if idle_since is None or time.monotonic() - idle_since < DB_POOL_IDLE_PING_SECONDS:
+            return
+        cursor = dbapi_conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception:
+            # ให้ pool ทิ้ง connection นี้แล้วเปิดใหม่
+            raise exc.DisconnectionError()
+        finally:
+            cursor.close()
+
+
 engine = create_engine(
     DATABASE_URL,
-    pool_pre_ping=True,
+    **_pool_options(DATABASE_URL, InstrumentedQueuePool),
 )
+if DB_POOL_LIVENESS == "idle_ping":
+    _install_idle_ping(engine)
+instrument_engine(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -23,3 +80,44 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# ===== Async stack (optional) — เปิดด้วย DB_ASYNC=1 =====
+# ต้องมี driver async: asyncpg (PostgreSQL) / aiosqlite (SQLite)
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+def to_async_url(url: str) -> str:
+    """
+    แปลง DATABASE_URL ปกติเป็น URL ของ driver async
+    """
+    for prefix in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            url = "postgresql+asyncpg://" + url[len(prefix):]
+            # asyncpg ใช้ ssl=... แทน sslmode=...
+            return url.replace("sslmode=", "ssl=")
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+async_engine = None
+AsyncSessionLocal = None
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        **_pool_options(ASYNC_DATABASE_URL, InstrumentedAsyncQueuePool),
+    )
+    if DB_POOL_LIVENESS == "idle_ping":
+        _install_idle_ping(async_engine.sync_engine)
+    instrument_engine(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database is disabled (set DB_ASYNC=1)")
+    async with AsyncSessionLocal() as db:
+        yield db
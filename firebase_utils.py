@@ -5,6 +5,8 @@ import json
 import firebase_admin
 from firebase_admin import credentials, messaging
 
+from metrics import external_call
+
 _app = None  # cache app
 
 def get_firebase_app():
@@ -53,7 +55,39 @@ def send_inventory_notification(title: str, body: str):
             ),
             topic="inventory_alerts",
         )
-        messaging.send(message)
+        with external_call("fcm"):
+            messaging.send(message)
         print(f"📢 ส่งแจ้งเตือนแล้ว: {title} - {body}")
     except Exception as e:
         print(f"❌ แจ้งเตือนล้มเหลว: {e}")
+
+
+def send_inventory_notifications(notes: list[tuple[str, str]]) -> list[bool]:
+    """
+    ส่งหลายข้อความในครั้งเดียวด้วย messaging.send_each (ทีละไม่เกิน 500)
+    คืน list ว่าแต่ละข้อความส่งสำเร็จไหม (ลำดับเดียวกับ notes)
+    """
+    app = get_firebase_app()
+    if app is None:
+        for title, body in notes:
+            print(f"⚠️ Skip FCM: {title} - {body}")
+        return [True] * len(notes)
+
+    results: list[bool] = []
+    for start in range(0, len(notes), 500):
+        messages = [
+            messaging.Message(
+                notification=messaging.Notification(title=title, body=body),
+                topic="inventory_alerts",
+            )
+            for title, body in notes[start:start + 500]
+        ]
+        try:
+            with external_call("fcm"):
+                resp = messaging.send_each(messages)
+            results.extend(r.success for r in resp.responses)
+            print(f"📢 ส่งแจ้งเตือนแล้ว {resp.success_count} รายการ, ล้มเหลว {resp.failure_count} รายการ")
+        except Exception as e:
+            print(f"❌ แจ้งเตือนล้มเหลว: {e}")
+            results.extend([False] * len(messages))
+    return results
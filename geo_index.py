@@ -0,0 +1,139 @@
+# geo_index.py
+"""
+Index พิกัดสาขาในหน่วยความจำ — ใช้แทน earthdistance (GiST) เมื่อไม่ได้ใช้ PostgreSQL (เช่น SQLite ตอน test)
+แปลง (lat, lng) เป็นจุด 3 มิติบนทรงกลมแบบ ll_to_earth แล้วเก็บใน KD-tree:
+ระยะเส้นตรง (chord) ระหว่างจุดเรียงลำดับเหมือนระยะบนผิวโลก จึงหา k ใกล้สุด / ในรัศมีได้โดยไม่ต้องไล่ทุกสาขา
+"""
+import heapq
+import math
+import threading
+
+from sqlalchemy import func, select
+
+import models
+
+# ค่าเดียวกับ earth() ของ earthdistance (เมตร) — ระยะที่คืนจึงตรงกับ earth_distance() บน PostgreSQL
+EARTH_RADIUS_M = 6378168.0
+
+
+def to_point(lat: float, lng: float) -> tuple[float, float, float]:
+    """จุดบนทรงกลมรัศมี 1 (เหมือน ll_to_earth หารด้วย earth())"""
+    lat, lng = math.radians(lat), math.radians(lng)
+    return (math.cos(lat) * math.cos(lng), math.cos(lat) * math.sin(lng), math.sin(lat))
+
+
+def chord_to_meters(chord: float) -> float:
+    return 2 * EARTH_RADIUS_M * math.asin(min(chord / 2, 1.0))
+
+
+def meters_to_chord(meters: float) -> float:
+    return 2 * math.sin(min(meters / EARTH_RADIUS_M, math.pi) / 2)
+
+
+class KDTree:
+    def __init__(self, points: list[tuple[int, tuple[float, float, float]]]):
+        # node = (branch_id, point, axis, left, right)
+        self._root = self._build(points, 0)
+        self.size = len(points)
+
+    @classmethod
+    def _build(cls, points, depth: int):
+        if not points:
+            return None
+        axis = depth % 3
+        points = sorted(points, key=lambda p: p[1][axis])
+        mid = len(points) // 2
+        branch_id, point = points[mid]
+        return (branch_id, point, axis, cls._build(points[:mid], depth + 1), cls._build(points[mid + 1:], depth + 1))
+
+    def nearest(self, target, k: int | None, max_dist2: float = math.inf, accept=None) -> list[tuple[float, int]]:
+        """
+        [(ระยะ chord ยกกำลังสอง, branch_id)] เรียงใกล้ → ไกล
+        k = None คือทุกจุดภายใน max_dist2, accept(branch_id) กรองสาขาที่ไม่ต้องการ (เช่น ไม่มีของ)
+        """
+        best: list[tuple[float, int]] = []    # max-heap (-dist2, -branch_id) ขนาด k
+
+        def bound() -> float:
+            if k is not None and len(best) >= k:
+                return min(-best[0][0], max_dist2)
+            return max_dist2
+
+        def visit(node):
+            if node is None:
+                return
+            branch_id, point, axis, left, right = node
+            d2 = sum((a - b) ** 2 for a, b in zip(point, target))
+            if d2 <= bound() and (accept is None or accept(branch_id)):
+                item = (-d2, -branch_id)
+                if k is None or len(best) < k:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if diff * diff <= bound():
+                visit(far)
+
+        if k != 0:
+            visit(self._root)
+        return sorted((-d2, -neg_id) for d2, neg_id in best)
+
+
+class GeoIndex:
+    def __init__(self, rows):
+        self._tree = KDTree([(branch_id, to_point(lat, lng)) for branch_id, lat, lng in rows])
+
+    def nearest(self, lat: float, lng: float, k: int | None = 10, radius_m: float | None = None, accept=None) -> list[tuple[int, float]]:
+        """คืน [(branch_id, ระยะเมตร)] เรียงใกล้ → ไกล (ภายใน radius_m ถ้าส่งมา)"""
+        max_dist2 = meters_to_chord(radius_m) ** 2 if radius_m is not None else math.inf
+        hits = self._tree.nearest(to_point(lat, lng), k, max_dist2, accept)
+        return [(branch_id, chord_to_meters(math.sqrt(d2))) for d2, branch_id in hits]
+
+
+_index: GeoIndex | None = None
+_signature: tuple | None = None     # ลายเซ็นพิกัดตอนสร้าง _index
+_lock = threading.Lock()
+
+
+def signature_statement():
+    """
+    ลายเซ็นของพิกัดสาขาทั้งหมด (aggregate แถวเดียว) — เปลี่ยนเมื่อสาขาได้ / เสีย / ย้ายพิกัด
+    อ่านจากฐานข้อมูลจึงเห็นการแก้จากทุก worker process ไม่ใช่แค่ invalidate() ใน process ตัวเอง
+    """
+    B = models.Branch
+    return select(
+        func.count(),
+        func.sum(B.latitude), func.sum(B.longitude),
+        func.sum(B.id * B.latitude), func.sum(B.id * B.longitude),     # สลับพิกัดระหว่างสาขาก็เปลี่ยน
+    ).where(B.latitude.isnot(None), B.longitude.isnot(None))
+
+
+def _current_signature(db) -> tuple:
+    # ผลรวม float ต่างกันเล็กน้อยได้ตามลำดับที่บวก → ปัดก่อนเทียบ
+    return tuple(round(value or 0, 6) for value in db.execute(signature_statement()).one())
+
+
+def get_index(db) -> GeoIndex:
+    """
+    สร้าง index จากสาขาที่มีพิกัดครั้งแรกที่ใช้ และเมื่อลายเซ็นพิกัดไม่ตรงกับตอนสร้าง
+    อ่านลายเซ็นก่อนอ่านพิกัด แล้วตรวจ + สร้าง + เก็บภายใต้ _lock: index ที่เก็บไว้ใหม่อย่างน้อยเท่าลายเซ็นที่ติดไว้เสมอ
+    (build ที่ช้ากว่าเขียนทับด้วยลายเซ็นเก่าได้ แต่ครั้งถัดไปลายเซ็นไม่ตรงก็สร้างใหม่ ไม่ค้างข้อมูลเก่า)
+    """
+    global _index, _signature
+    signature = _current_signature(db)
+    with _lock:
+        if _index is None or _signature != signature:
+            B = models.Branch
+            _index = GeoIndex(db.execute(
+                select(B.id, B.latitude, B.longitude).where(B.latitude.isnot(None), B.longitude.isnot(None))
+            ).all())
+            _signature = signature
+        return _index
+
+
+def invalidate() -> None:
+    """เรียกหลังตั้ง / ลบพิกัดสาขา (สาขาที่ถูกลบไม่ต้อง — ไม่มีสินค้าเหลือจึงไม่ผ่าน accept อยู่แล้ว)"""
+    global _index
+    with _lock:
+        _index = None
@@ -0,0 +1,308 @@
+# image_storage.py
+"""
+อัปโหลดรูปสินค้า: อ่านแบบจำกัดขนาด (คิด SHA-256 ไปพร้อมกัน) → เจอรูปเดิมใน image_assets = คืน URL เดิมเลย
+ไม่เจอ → (ถ้ามี Pillow) ย่อ + แปลงเป็น WebP + ทำ thumbnail → เก็บตาม backend โดยใช้ hash เป็นชื่อไฟล์
+
+งานที่ block (Pillow / Cloudinary SDK / เขียนไฟล์) รันใน thread pool ของตัวเองที่จำกัดจำนวน
+ไม่ค้าง event loop และไม่แย่ง threadpool ที่ endpoint แบบ sync ใช้อยู่
+"""
+import asyncio
+import contextvars
+import hashlib
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
+import cloudinary.uploader
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+from metrics import external_call
+
+try:   # optional: ไม่มี Pillow = เก็บไฟล์ต้นฉบับตามเดิม
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+IMAGE_STORAGE = os.getenv("IMAGE_STORAGE", "cloudinary")        # cloudinary | static | memory
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", "4"))
+IMAGE_UPLOAD_QUEUE = int(os.getenv("IMAGE_UPLOAD_QUEUE", "32"))  # งานที่รอคิวได้ เกินนี้ตอบ 503
+IMAGE_PROCESSING = os.getenv("IMAGE_PROCESSING", "1") == "1"
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1600"))
+THUMBNAIL_SIZE = int(os.getenv("IMAGE_THUMBNAIL_SIZE", "320"))
+WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+
+UPLOAD_DIR = "static/images"
+CLOUDINARY_FOLDER = "inventory"
+THUMBNAIL_SUFFIX = "_thumb"
+READ_CHUNK = 64 * 1024
+# boundary + header ของ part ใน multipart — body ทั้ง request ใหญ่กว่าตัวไฟล์ได้เท่านี้
+MULTIPART_OVERHEAD = 64 * 1024
+UPLOAD_PATHS = ("/upload/",)
+
+_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/gif": ".gif"}
+
+
+class ImageUploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass(frozen=True)
+class Variant:
+    data: bytes
+    content_type: str
+    ext: str
+
+
+# ---------- Processing (Pillow) ----------
+def _encode_webp(img, size: int) -> bytes:
+    img = img.copy()
+    img.thumbnail((size, size))     # ย่อเฉพาะรูปที่ใหญ่กว่า size, คงสัดส่วน
+    buf = BytesIO()
+    img.save(buf, "WEBP", quality=WEBP_QUALITY, method=4)
+    return buf.getvalue()
+
+
+def process_image(data: bytes, content_type: str) -> tuple[Variant, Optional[Variant]]:
+    """คืน (รูปหลัก, thumbnail) — ไม่มี Pillow หรือปิด IMAGE_PROCESSING = (ต้นฉบับ, None)"""
+    if Image is None or not IMAGE_PROCESSING:
+        return Variant(data, content_type, _EXTENSIONS.get(content_type, "")), None
+
+    try:
+        with Image.open(BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)   # รูปจากมือถือ: หมุนตาม EXIF ก่อนตัด metadata ทิ้ง
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            return (
+                Variant(_encode_webp(img, IMAGE_MAX_DIMENSION), "image/webp", ".webp"),
+                Variant(_encode_webp(img, THUMBNAIL_SIZE), "image/webp", ".webp"),
+            )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ImageUploadError(400, "Invalid image")
+
+
+# ---------- Storage backends ----------
+class CloudinaryStorage:
+    # Cloudinary ย่อรูปจาก URL ได้เอง (ดู thumbnail_url) — ไม่ต้องอัป thumbnail แยก
+    stores_thumbnails = False
+
+    def save(self, name: str, variant: Variant) -> str:
+        public_id, _ = os.path.splitext(name)
+        with external_call("cloudinary"):
+            result = cloudinary.uploader.upload(
+                BytesIO(variant.data),
+                folder=CLOUDINARY_FOLDER,
+                public_id=public_id,
+                resource_type="image",
+            )
+        image_url = result.get("secure_url")
+        if not image_url:
+            raise ImageUploadError(500, "No image url returned from Cloudinary")
+        return image_url
+
+
+class StaticStorage:
+    """เก็บใน static/images (เสิร์ฟผ่าน /static ของแอปเอง)"""
+    stores_thumbnails = True
+
+    def __init__(self, directory: str = UPLOAD_DIR, base_url: str = "/static/images"):
+        self.directory = directory
+        self.base_url = base_url
+
+    def save(self, name: str, variant: Variant) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(variant.data)
+        os.replace(tmp, path)       # ไม่มีใครเห็นไฟล์ที่เขียนไม่ครบ
+        return f"{self.base_url}/{name}"
+
+
+class MemoryStorage:
+    """ใช้แทน storage จริงตอน dev/test (ไม่ต้องมีบัญชี Cloudinary)"""
+    stores_thumbnails = True
+
+    def __init__(self):
+        self.files: dict[str, Variant] = {}
+
+    def save(self, name: str, variant: Variant) -> str:
+        self.files[name] = variant
+        return f"memory://images/{name}"
+
+
+STORAGES = {"cloudinary": CloudinaryStorage, "static": StaticStorage, "memory": MemoryStorage}
+storage = STORAGES[IMAGE_STORAGE]()
+
+
+# ---------- Thumbnail URL ----------
+_CLOUDINARY_UPLOAD = "/image/upload/"
+_PROCESSED_NAME = re.compile(r"^(?P<key>[0-9a-f]{32,64})\.webp$")
+
+
+def thumbnail_url(image_url: Optional[str]) -> Optional[str]:
+    """
+    - รูปบน Cloudinary: ใส่ transformation ย่อใน URL (ใช้ได้กับรูปเก่าด้วย)
+    - รูปที่ผ่าน process_image: ไฟล์ <sha256>_thumb.webp ข้าง ๆ กัน
+    - อื่น ๆ: ใช้รูปเดิม
+    """
+    if not image_url:
+        return None
+    if "res.cloudinary.com" in image_url and _CLOUDINARY_UPLOAD in image_url:
+        transformation = f"c_limit,w_{THUMBNAIL_SIZE},h_{THUMBNAIL_SIZE},f_auto,q_auto"
+        return image_url.replace(_CLOUDINARY_UPLOAD, f"{_CLOUDINARY_UPLOAD}{transformation}/", 1)
+
+    head, _, name = image_url.rpartition("/")
+    match = _PROCESSED_NAME.match(name)
+    if match:
+        return f"{head}/{match['key']}{THUMBNAIL_SUFFIX}.webp"
+    return image_url
+
+
+# ---------- Dedup (content-addressed) ----------
+def find_asset(db: Session, digest: str) -> Optional[str]:
+    """มีรูปนี้แล้ว: นับ hit และคืน image_url เดิม (UPDATE ... RETURNING คำสั่งเดียว)"""
+    A = models.ImageAsset
+    image_url = db.execute(
+        update(A)
+        .where(A.sha256 == digest)
+        .values(hit_count=A.hit_count + 1, last_hit_at=func.now())
+        .returning(A.image_url)
+    ).scalar_one_or_none()
+    db.commit()
+    return image_url
+
+
+def dedup_stats(db: Session) -> dict:
+    A = models.ImageAsset
+    assets, hits, bytes_saved = db.execute(select(
+        func.count(),
+        func.coalesce(func.sum(A.hit_count), 0),
+        func.coalesce(func.sum(A.hit_count * A.size_bytes), 0),
+    ).select_from(A)).one()
+    uploads = assets + hits
+    return {
+        "assets": assets,
+        "uploads": uploads,
+        "hits": hits,
+        "hit_rate": round(hits / uploads, 4) if uploads else 0.0,
+        "bytes_saved": bytes_saved,
+    }
+
+
+# ---------- Upload pipeline ----------
+def _store_variants(data: bytes, content_type: str, key: str) -> str:
+    main, thumb = process_image(data, content_type)
+    try:
+        image_url = storage.save(key + main.ext, main)
+        if thumb is not None and storage.stores_thumbnails:
+            storage.save(f"{key}{THUMBNAIL_SUFFIX}{thumb.ext}", thumb)
+    except ImageUploadError:
+        raise
+    except Exception as e:
+        raise ImageUploadError(500, f"Upload failed: {e}")
+    return image_url
+
+
+def store_image(data: bytes, content_type: str, digest: str) -> dict:
+    """ทำงานใน thread pool: หา hash เดิมก่อน ไม่เจอค่อย process + เก็บทุก variant"""
+    with SessionLocal() as db:
+        image_url = find_asset(db, digest)
+        deduplicated = image_url is not None
+        if not deduplicated:
+            image_url = _store_variants(data, content_type, digest)
+            db.add(models.ImageAsset(sha256=digest, image_url=image_url, content_type=content_type, size_bytes=len(data)))
+            try:
+                db.commit()
+            except IntegrityError:
+                # รูปเดียวกันอัปพร้อมกัน: อีก request บันทึกไปก่อน (ชื่อไฟล์เป็น hash → เนื้อหาเดียวกัน)
+                db.rollback()
+    return {"image_url": image_url, "thumbnail_url": thumbnail_url(image_url), "deduplicated": deduplicated}
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware: ตัด request อัปโหลดรูปที่ใหญ่เกินก่อน FastAPI parse multipart
+    (parser พักไฟล์ทั้งก้อนลง SpooledTemporaryFile ก่อน endpoint / read_limited ได้ทำงาน)
+    - Content-Length เกิน → 413 ทันที ไม่อ่าน body เลย
+    - ไม่มี Content-Length (chunked) → นับ byte ระหว่างรับ เกินเมื่อไหร่ 413 ตอนนั้น (ที่พักไว้ไม่เกินขอบนี้)
+    """
+    def __init__(self, app, paths=UPLOAD_PATHS, max_bytes: int = IMAGE_MAX_BYTES + MULTIPART_OVERHEAD):
+        self.app = app
+        self.paths = tuple(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse({"detail": "Image too large"}, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI ส่ง HTTPException ที่เกิดระหว่างอ่าน body ต่อให้ exception handler ตามเดิม → 413
+                    raise HTTPException(status_code=413, detail="Image too large")
+            return message
+
+        await self.app(scope, receive_limited, send)
+
+
+async def read_limited(file: UploadFile) -> tuple[bytes, str]:
+    """
+    ตรวจขนาดไฟล์จริง (ไม่รวม envelope ของ multipart) และอ่านเข้าหน่วยความจำไม่เกิน IMAGE_MAX_BYTES
+    ตอนนี้ multipart ถูก parse แล้ว — body ที่ใหญ่เกินต้องถูกตัดก่อนหน้านี้ด้วย UploadSizeLimitMiddleware
+    คืน (เนื้อไฟล์, sha256 hex) — hash คิดไปพร้อมกับการอ่าน
+    """
+    if file.size is not None and file.size > IMAGE_MAX_BYTES:
+        raise ImageUploadError(413, "Image too large")
+    chunks, total = [], 0
+    digest = hashlib.sha256()
+    while chunk := await file.read(READ_CHUNK):
+        total += len(chunk)
+        if total > IMAGE_MAX_BYTES:
+            raise ImageUploadError(413, "Image too large")
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), digest.hexdigest()
+
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_UPLOAD_WORKERS, thread_name_prefix="image-upload")
+_in_flight = 0   # แก้ค่าเฉพาะใน event loop เท่านั้น (ไม่ต้อง lock)
+
+
+async def upload(file: UploadFile) -> dict:
+    global _in_flight
+    data, digest = await read_limited(file)
+    if _in_flight >= IMAGE_UPLOAD_WORKERS + IMAGE_UPLOAD_QUEUE:
+        raise ImageUploadError(503, "Too many uploads in progress")
+
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        # copy context: เวลา DB / Cloudinary ใน thread นี้นับเข้า request ปัจจุบัน (Server-Timing)
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_executor, context.run, store_image, data, file.content_type, digest)
+    finally:
+        _in_flight -= 1
@@ -0,0 +1,251 @@
+# import_jobs.py
+"""
+นำเข้าสินค้าจาก CSV (ไฟล์ตรวจนับสต็อก 10k–200k บรรทัด) เป็นงานเบื้องหลัง
+
+- POST รับไฟล์ → เก็บลงไฟล์ชั่วคราว (จำกัดขนาด) แล้วตอบ 202 + job id ทันที ไม่ถือ HTTP request ค้างไว้
+- worker อ่าน CSV ทีละบรรทัด ไม่โหลดทั้งไฟล์เข้าหน่วยความจำ, ทีละ IMPORT_CHUNK_SIZE แถว:
+  validate (ProductCreate / ProductUpdate) → หาแถวเดิมตาม (name, branch_id) ด้วย query เดียวต่อ chunk
+  → insert แถวใหม่ + แก้แถวเดิมใน transaction เดียวต่อ chunk
+- สิทธิ์เหมือน endpoint ปกติ: สร้างใหม่ต้องเป็น MANAGER, STAFF แก้ได้เฉพาะ quantity
+  (คอลัมน์ที่ค่าไม่ต่างจากเดิมไม่นับว่าแก้ → ไฟล์จาก /products/export ที่แก้แค่ quantity ใช้กับ STAFF ได้)
+- เซลล์ว่าง = ไม่แก้ค่านั้น, คอลัมน์ที่ไม่รู้จัก (id, version, created_at, ...) ถูกข้าม
+
+สถานะงานอยู่ในหน่วยความจำของโปรเซส (เหมือน response_cache แบบ memory):
+ถ้ารันหลาย worker ต้อง poll ไปที่โปรเซสเดียวกับที่รับไฟล์ (sticky session) หรือรัน worker เดียว
+"""
+import csv
+import io
+import os
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+
+import crud
+import models
+import schemas
+from cache import TTLCache
+from database import SessionLocal
+from notification_dispatcher import notify_stock_level
+from permissions import AuthContext, BranchRole, restrict_patch
+
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+IMPORT_MAX_JOBS = int(os.getenv("IMPORT_MAX_JOBS", "200"))
+IMPORT_JOB_TTL_SECONDS = float(os.getenv("IMPORT_JOB_TTL_SECONDS", str(24 * 3600)))
+
+KEY_COLUMNS = ("name", "branch_id")
+COLUMNS = ("name", "branch_id", "price", "quantity", "category", "unit", "image_url", "reorder_threshold")
+READ_CHUNK = 64 * 1024
+
+
+class CsvImportError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class ImportJob:
+    id: str
+    user_id: int
+    filename: Optional[str]
+    path: str
+    size_bytes: int
+    status: str = "queued"
+    bytes_read: int = 0
+    rows_read: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    errors: list[tuple[int, str]] = field(default_factory=list)
+    message: Optional[str] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def progress(self) -> float:
+        if self.status == "done":
+            return 1.0
+        return round(self.bytes_read / self.size_bytes, 4) if self.size_bytes else 0.0
+
+    @property
+    def errors_truncated(self) -> bool:
+        return self.failed > len(self.errors)
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+# งานที่เสร็จแล้วอยู่ได้ IMPORT_JOB_TTL_SECONDS (ให้ client มาดึงรายงาน error)
+jobs = TTLCache(maxsize=IMPORT_MAX_JOBS, ttl=IMPORT_JOB_TTL_SECONDS)
+_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="csv-import")
+
+
+def get_job(job_id: str, user: AuthContext) -> Optional[ImportJob]:
+    """เห็นได้เฉพาะคนที่อัปโหลด (และ Owner)"""
+    job = jobs.get(job_id)
+    if job is None or (job.user_id != user.id and not user.is_owner):
+        return None
+    return job
+
+
+# ---------- Validation ----------
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+
+
+def _cells(record: dict) -> dict:
+    """เฉพาะคอลัมน์ที่รู้จักและไม่ว่าง"""
+    return {k: v.strip() for k in COLUMNS if (v := record.get(k)) is not None and v.strip()}
+
+
+def _plan_chunk(db, job: ImportJob, user: AuthContext, branch_ids: set[int], chunk: list[tuple[int, dict]]):
+    """
+    validate + หาแถวเดิม (query เดียว) + ตรวจสิทธิ์
+    คืน (แถวใหม่ {key: (line, data)}, แถวแก้ [(line, product, data)], บรรทัดที่ไม่มีอะไรเปลี่ยน)
+    """
+    parsed = []
+    for line, record in chunk:
+        if None in record:
+            job.error(line, "Too many columns")
+            continue
+        try:
+            data = schemas.ProductUpdate.model_validate(_cells(record)).model_dump(exclude_unset=True)
+        except ValidationError as e:
+            job.error(line, _validation_message(e))
+            continue
+        if any(data.get(k) is None for k in KEY_COLUMNS):
+            job.error(line, "name and branch_id are required")
+        elif data["branch_id"] not in branch_ids:
+            job.error(line, f"Branch {data['branch_id']} not found")
+        else:
+            parsed.append((line, data))
+
+    existing = crud.products_by_keys(db, {(data["name"], data["branch_id"]) for _, data in parsed})
+    creates: dict[tuple[str, int], tuple[int, dict]] = {}
+    updates: list[tuple[int, models.Product, dict]] = []
+    unchanged: list[int] = []
+    for line, data in parsed:
+        key = (data["name"], data["branch_id"])
+        product = existing.get(key)
+        try:
+            if product is None:
+                # key ซ้ำในไฟล์ก่อนจะถูกสร้าง → แถวหลังสุดชนะ
+                create = schemas.ProductCreate.model_validate(data)
+                user.require_branch(create.branch_id, min_role=BranchRole.MANAGER)
+                creates[key] = (line, create.model_dump(exclude={"id"}))
+                continue
+            role = user.require_branch(product.branch_id)
+            patch = {k: v for k, v in data.items() if k not in KEY_COLUMNS and getattr(product, k) != v}
+            if not patch:
+                unchanged.append(line)
+                continue
+            patch = restrict_patch(user, role, schemas.ProductUpdate(**patch)).model_dump(exclude_unset=True)
+            updates.append((line, product, patch))
+        except ValidationError as e:
+            job.error(line, _validation_message(e))
+        except HTTPException as e:
+            job.error(line, f"{e.detail} (branch {key[1]})")
+    return creates, updates, unchanged
+
+
+def _import_chunk(db, job: ImportJob, user: AuthContext, branch_ids: set[int], chunk: list[tuple[int, dict]]) -> None:
+    creates, updates, unchanged = _plan_chunk(db, job, user, branch_ids, chunk)
+    try:
+        stock = crud.apply_product_import(db, [data for _, data in creates.values()], [(p, data) for _, p, data in updates], user.id)
+    except DBAPIError as e:
+        # ทั้ง chunk ถูก rollback → ลองทีละแถวเพื่อรายงาน error เฉพาะแถวที่พัง
+        lines = sorted([line for line, _ in creates.values()] + [line for line, _, _ in updates])
+        if len(chunk) == 1:
+            job.error(chunk[0][0], crud._db_error_message(e))
+            return
+        records = dict(chunk)
+        for line in lines:
+            _import_chunk(db, job, user, branch_ids, [(line, records[line])])
+        job.unchanged += len(unchanged)
+        return
+    for row in stock:
+        notify_stock_level(row)
+    job.inserted += len(creates)
+    job.updated += len(updates)
+    job.unchanged += len(unchanged)
+
+
+# ---------- Worker ----------
+def run(job: ImportJob, user: AuthContext) -> None:
+    job.status, job.started_at = "running", datetime.now(timezone.utc)
+    try:
+        with open(job.path, "rb") as raw, SessionLocal() as db:
+            branch_ids = set(db.scalars(select(models.Branch.id)))
+            reader = csv.DictReader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+            chunk: list[tuple[int, dict]] = []
+            for record in reader:
+                job.rows_read += 1
+                chunk.append((reader.line_num, record))
+                if len(chunk) >= crud.IMPORT_CHUNK_SIZE:
+                    _import_chunk(db, job, user, branch_ids, chunk)
+                    chunk = []
+                    job.bytes_read = raw.tell()
+            if chunk:
+                _import_chunk(db, job, user, branch_ids, chunk)
+            job.bytes_read = job.size_bytes
+        job.status = "done"
+    except Exception as e:
+        # เช่น CSV เสีย / encoding ผิดกลางไฟล์ — chunk ที่ commit ไปแล้วยังอยู่ (ดูได้จาก inserted / updated)
+        job.status, job.message = "failed", f"Stopped at row {job.rows_read}: {e}"
+    finally:
+        job.finished_at = datetime.now(timezone.utc)
+        os.remove(job.path)
+
+
+# ---------- Submit ----------
+def _check_header(path: str) -> None:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        try:
+            header = next(csv.reader(f), None)
+        except (csv.Error, UnicodeDecodeError):
+            header = None
+    if not header:
+        raise CsvImportError(400, "File must be a UTF-8 CSV with a header row")
+    missing = [c for c in KEY_COLUMNS if c not in {h.strip() for h in header}]
+    if missing:
+        raise CsvImportError(400, f"Missing columns: {', '.join(missing)}")
+
+
+def submit(file: UploadFile, user: AuthContext) -> ImportJob:
+    """
+    คัดลอกไฟล์ที่อัปโหลดลงไฟล์ชั่วคราวทีละ chunk (หยุดทันทีที่เกิน IMPORT_MAX_BYTES) แล้วเข้าคิว
+    เรียกจาก endpoint แบบ sync (อยู่ใน threadpool อยู่แล้ว)
+    """
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=".csv")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := file.file.read(READ_CHUNK):
+                size += len(chunk)
+                if size > IMPORT_MAX_BYTES:
+                    raise CsvImportError(413, "File too large")
+                out.write(chunk)
+        _check_header(path)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    job = ImportJob(id=uuid.uuid4().hex, user_id=user.id, filename=file.filename, path=path, size_bytes=size)
+    jobs.set(job.id, job)
+    _executor.submit(run, job, user)
+    return job
@@ -1,32 +1,70 @@
-from fastapi import APIRouter,FastAPI, Depends, HTTPException, UploadFile, File, Query
+from fastapi import APIRouter,FastAPI, Depends, HTTPException, UploadFile, File, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-import os, shutil
+from typing import List, Literal
+from contextlib import asynccontextmanager
+from datetime import datetime
+from sqlalchemy.exc import DBAPIError
+import asyncio, os, shutil
 import json
+import csv, io
 import cloudinary
-import cloudinary.uploader
 
 import firebase_admin
 from firebase_admin import credentials, messaging
-import models, schemas, crud
-from database import engine, get_db, Base
+import models, schemas, crud, response_cache, image_storage, import_jobs, geo_index, passwords
+from database import engine, async_engine, get_db, Base, DB_ASYNC, SessionLocal
+from metrics import METRICS_PUBLIC, pool_stats, render_prometheus, RequestMetricsMiddleware
 
 # import roles
 from auth import get_current_user, require_owner
-from permissions import require_branch_member
+from permissions import require_branch_member, get_auth_context, get_claims_context, restrict_patch, AuthContext
 from models import BranchRoleEnum as BranchRole, UserGlobalRole as GlobalRole, User, UserBranchRole
 from auth import create_access_token, verify_password
 from schemas import LoginRequest, Token, UserCreate
 from auth import router as auth_router  # << นำ router เข้ามา
 from firebase_utils import send_inventory_notification 
+from notification_dispatcher import notify_stock_level
 from models import Branch
 
 # ----- สร้างตารางเมื่อรันครั้งแรก (ถ้ายังไม่มี) -----
 # Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Inventory API")
+def _prepare_stock_movement_partitions():
+    # สร้าง partition รายเดือนของ stock_movements ล่วงหน้า (PostgreSQL; ตารางต้องผ่าน migration แล้ว)
+    if engine.dialect.name != "postgresql":
+        return      # ฐานข้อมูลอื่นใช้ตารางธรรมดา ไม่มี partition
+    with SessionLocal() as db:
+        try:
+            crud.ensure_stock_movement_partitions(db)
+        except DBAPIError as e:
+            db.rollback()
+            print(f"⚠️ stock_movements partitions not created: {e.orig}")
+
+
+async def _stock_movement_partition_loop():
+    # ตอน start สร้างไว้ถึง STOCK_MOVEMENT_PARTITIONS_AHEAD เดือน — process ที่รันนานกว่านั้นต้องสร้างต่อเอง
+    while True:
+        await asyncio.sleep(crud.STOCK_MOVEMENT_PARTITION_CHECK_SECONDS)
+        await run_in_threadpool(_prepare_stock_movement_partitions)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(_prepare_stock_movement_partitions)
+    partitions = asyncio.create_task(_stock_movement_partition_loop()) if engine.dialect.name == "postgresql" else None
+    await run_in_threadpool(passwords.start)     # spawn process pool สำหรับ hash รหัสผ่านล่วงหน้า
+    yield
+    if partitions is not None:
+        partitions.cancel()
+    passwords.shutdown()
+
+
+app = FastAPI(title="Inventory API", lifespan=lifespan)
 
 cloudinary.config(
     cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
@@ -35,6 +73,9 @@ router = APIRouter(prefix="/branches", tags=["Branches"])
 app.include_router(auth_router)  # << เพิ่มบรรทัดนี้
 app.include_router(router)
 
+# ----- จำกัดขนาด body ของ /upload/ ก่อน parse multipart (อยู่ใน CORS: 413 มี header CORS ด้วย) -----
+app.add_middleware(image_storage.UploadSizeLimitMiddleware)
+
 # ----- เปิด CORS (ช่วงพัฒนาให้ * ไปก่อน ถ้าโปรดักชันควรระบุโดเมน) -----
 
 origins = [
@@ -51,45 +92,68 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# latency / จำนวน query ต่อ route + header Server-Timing (ดูค่ารวมที่ GET /metrics)
+app.add_middleware(RequestMetricsMiddleware)
 
 # ----- Static files สำหรับเสิร์ฟรูป -----
 app.mount("/static", StaticFiles(directory="static"), name="static")
-UPLOAD_DIR = "static/images"
+UPLOAD_DIR = image_storage.UPLOAD_DIR
+
+
+# --------------- Prometheus ---------------
+# ชื่อ route / ขนาด pool / สถิติรูปเป็นข้อมูลภายใน: owner เท่านั้น เว้นแต่ตั้ง METRICS_PUBLIC=1
+metrics_access = [] if METRICS_PUBLIC else [Depends(require_owner)]
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=metrics_access)
+def read_metrics():
+    # latency ต่อ route, query ต่อ request, เวลาเรียก Firebase/Cloudinary, pool
+    return PlainTextResponse(
+        render_prometheus({"sync": engine, "async": async_engine.sync_engine if async_engine is not None else None}),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+# --------------- Pool telemetry ---------------
+@app.get("/metrics/pool", dependencies=metrics_access)
+def read_pool_metrics():
+    # connection ที่ถูกยืม/ว่าง, เวลารอ checkout และจำนวนครั้งที่ pool timeout
+    return {
+        "sync": pool_stats(engine),
+        "async": pool_stats(async_engine.sync_engine) if async_engine is not None else None,
+    }
+
+
+@app.get("/metrics/images", dependencies=metrics_access)
+def read_image_metrics(db: Session = Depends(get_db)):
+    # อัตรา dedup ของรูปที่อัปโหลด (hit = ได้ URL เดิมโดยไม่อัปขึ้น storage)
+    return image_storage.dedup_stats(db)
 
 
 # --------------- Upload image ---------------
 @app.post("/upload/")
 async def upload_image(file: UploadFile = File(...)):
     # ตรวจว่าเป็นรูปคร่าว ๆ
-    if not file.content_type.startswith("image/"):
+    if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
+    # ย่อ/ทำ thumbnail/อัปโหลดใน thread pool ของ image_storage (ไม่ค้าง event loop)
     try:
-        # อัปโหลดขึ้น Cloudinary (ไปอยู่ในโฟลเดอร์ inventory)
-        result = cloudinary.uploader.upload(
-            file.file,          # ใช้ stream จาก UploadFile
-            folder="inventory", # ชื่อโฟลเดอร์ใน Cloudinary จะรวมรูปไว้ด้วยกัน
-            resource_type="image",
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
-
-    image_url = result.get("secure_url")
-    if not image_url:
-        raise HTTPException(status_code=500, detail="No image url returned from Cloudinary")
+        result = await image_storage.upload(file)
+    except image_storage.ImageUploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-    # ส่ง URL ถาวรกลับไปให้ Flutter
-    return {"image_url": image_url}
+    # ส่ง URL ถาวร (และ thumbnail) กลับไปให้ Flutter
+    return result
 
 # ---------- Branches ----------
 @app.get("/branches/", response_model=List[schemas.Branch])
 def read_branches(
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),       # ต้องล็อกอิน
+    mine: bool = Query(False),                         # เฉพาะสาขาที่ตัวเองสังกัด
+    user: AuthContext = Depends(get_claims_context),   # ต้องล็อกอิน
 ):
-    # Owner เห็นทุกสาขา / คนอื่นอาจอยากเห็นเฉพาะสาขาที่ตัวเองสังกัดก็ได้
-    # เบื้องต้นอนุญาตให้เห็นทั้งหมด (ถ้าต้องการจำกัด ให้ query ตาม membership)
-    return crud.get_branches(db)
+    # เบื้องต้นอนุญาตให้เห็นทั้งหมด / mine=true: เฉพาะสาขาที่สังกัด (Owner = ทุกสาขา)
+    return crud.get_branches(db, member_user_id=user.id if mine and not user.is_owner else None)
 
 @app.post("/branches/", response_model=schemas.Branch, status_code=201)
 def create_branch(
@@ -117,6 +181,7 @@ def set_branch_location(
     branch.address = address
     db.commit()
     db.refresh(branch)
+    geo_index.invalidate()   # /products/nearby (ฐานข้อมูลที่ไม่ใช่ PostgreSQL)
 
     return {
         "id": branch.id,
@@ -172,19 +237,148 @@ def delete_branch(
 def create_product(
     product: schemas.ProductCreate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: AuthContext = Depends(get_auth_context),
 ):
-    if user.global_role == GlobalRole.OWNER:
-        return crud.create_product(db=db, product=product)
-    # อนุญาตเฉพาะ Manager ในสาขา
-    require_branch_member(product.branch_id, min_role=BranchRole.MANAGER)(db=db, user=user)
-    return crud.create_product(db=db, product=product)
+    # Owner ผ่าน / อนุญาตเฉพาะ Manager ในสาขา
+    user.require_branch(product.branch_id, min_role=BranchRole.MANAGER)
+    try:
+        return crud.create_product(db=db, product=product, user_id=user.id)
+    except crud.DuplicateProductError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+
+# --------------- Bulk upsert (JSON array / NDJSON) ---------------
+async def _iter_bulk_items(request: Request):
+    """
+    อ่าน body ทีละรายการ: application/x-ndjson อ่านแบบ stream ทีละบรรทัด, นอกนั้นเป็น JSON array
+    yield (index, obj) หรือ (index, ValueError) ถ้าบรรทัดนั้น parse ไม่ได้
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonlines" not in content_type:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(400, "Body must be a JSON array")
+        if not isinstance(items, list):
+            raise HTTPException(400, "Body must be a JSON array")
+        for index, obj in enumerate(items):
+            yield index, obj
+        return
+
+    index, buffer = 0, b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield index, json.loads(line)
+                except ValueError as e:
+                    yield index, e
+                index += 1
+    if buffer.strip():
+        try:
+            yield index, json.loads(buffer)
+        except ValueError as e:
+            yield index, e
+
+
+@app.post("/products/bulk", response_model=schemas.BulkUpsertResult)
+async def bulk_upsert_products(
+    request: Request,
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_auth_context),
+):
+    received = upserted = 0
+    errors: list[schemas.BulkRowError] = []
+    allowed: dict[int, str | None] = {}   # ตรวจสิทธิ์ครั้งเดียวต่อสาขา (None = ผ่าน)
+    pending: list[tuple[int, dict]] = []
+
+    async def flush():
+        nonlocal upserted, pending
+        done, failed, stock = await run_in_threadpool(crud.bulk_upsert_products, db, pending, user.id)
+        upserted += done
+        errors.extend(schemas.BulkRowError(index=i, error=msg) for i, msg in failed)
+        for row in stock:       # commit แล้ว — เข้าคิว background เหมือน PUT / adjust
+            notify_stock_level(row)
+        pending = []
+
+    async for index, obj in _iter_bulk_items(request):
+        received += 1
+        if isinstance(obj, Exception):
+            errors.append(schemas.BulkRowError(index=index, error=f"Invalid JSON: {obj}"))
+            continue
+        try:
+            product = schemas.ProductCreate.model_validate(obj)
+        except ValidationError as e:
+            msg = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            errors.append(schemas.BulkRowError(index=index, error=msg))
+            continue
+
+        if product.branch_id not in allowed:
+            try:
+                user.require_branch(product.branch_id, min_role=BranchRole.MANAGER)
+                allowed[product.branch_id] = None
+            except HTTPException as e:
+                allowed[product.branch_id] = f"{e.detail} (branch {product.branch_id})"
+        if allowed[product.branch_id]:
+            errors.append(schemas.BulkRowError(index=index, error=allowed[product.branch_id]))
+            continue
+
+        # เฉพาะฟิลด์ที่ส่งมา: สินค้าที่มีอยู่แล้วไม่ถูกล้าง category / image_url / reorder_threshold เป็นค่า default
+        pending.append((index, product.model_dump(exclude_unset=True)))
+        if len(pending) >= crud.BULK_UPSERT_CHUNK_SIZE:
+            await flush()
+
+    if pending:
+        await flush()
+
+    errors.sort(key=lambda e: e.index)
+    return schemas.BulkUpsertResult(received=received, upserted=upserted, errors=errors)
+
+
+# --------------- CSV import (งานเบื้องหลัง + poll ความคืบหน้า) ---------------
+@app.post("/products/import", response_model=schemas.ImportJob, status_code=202)
+def import_products(
+    file: UploadFile = File(...),
+    user: AuthContext = Depends(get_auth_context),
+):
+    # สิทธิ์ตรวจรายแถวตอนนำเข้า (แถวที่ไม่มีสิทธิ์ไปอยู่ในรายงาน error)
+    try:
+        return import_jobs.submit(file, user)
+    except import_jobs.CsvImportError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 
+def _import_job_or_404(job_id: str, user: AuthContext) -> import_jobs.ImportJob:
+    job = import_jobs.get_job(job_id, user)
+    if job is None:
+        raise HTTPException(404, "Import job not found")
+    return job
+
+
+@app.get("/products/import/{job_id}", response_model=schemas.ImportJob)
+def read_import_job(job_id: str, user: AuthContext = Depends(get_claims_context)):
+    return _import_job_or_404(job_id, user)
+
+
+@app.get("/products/import/{job_id}/errors", response_model=List[schemas.ImportRowError])
+def read_import_errors(
+    job_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=import_jobs.IMPORT_MAX_ERRORS),
+    user: AuthContext = Depends(get_claims_context),
+):
+    job = _import_job_or_404(job_id, user)
+    errors = sorted(job.errors)     # ใน chunk เดียวกัน error จากแต่ละขั้นถูกเก็บไม่เรียงบรรทัด
+    return [schemas.ImportRowError(line=line, error=error) for line, error in errors[skip:skip + limit]]
+
 
 # --------------- List + Search/Filter + Pagination ---------------
 @app.get("/products/")
 def read_products(
+    request: Request,
     db: Session = Depends(get_db),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, gt=0, le=1000),
@@ -193,119 +387,430 @@ def read_products(
     min_price: float | None = Query(None, ge=0),
     max_price: float | None = Query(None, ge=0),
     branch_id: int | None = Query(None),
-    user: User = Depends(get_current_user),       # ต้องล็อกอิน
+    paginate: Literal["offset", "cursor"] = Query("offset"),   # cursor = keyset pagination
+    order_by: Literal["id", "branch", "name"] | None = Query(None),   # ค่าเริ่มต้น id (mine = branch)
+    cursor: str | None = Query(None),                          # next_cursor จากหน้าก่อน
+    fields: str | None = Query(None),                          # เช่น id,name,quantity (ไม่ส่ง = ทุก field)
+    mine: bool = Query(False),                                 # ทุกสาขาที่เป็นสมาชิก (ไม่ต้องส่ง branch_id)
+    user: AuthContext = Depends(get_claims_context),  # ต้องล็อกอิน (อ่านอย่างเดียว)
 ):
-    # Owner: ผ่าน
-    if user.global_role != GlobalRole.OWNER:
-        # Non-owner: ต้องมี branch_id และเป็นสมาชิกสาขานี้
-        if branch_id is None:
-            raise HTTPException(400, "branch_id is required for non-owner")
-        require_branch_member(branch_id)(db=db, user=user)
+    # Owner: ผ่าน (mine = ทุกสาขา)
+    # Non-owner: ระบุ branch_id ที่เป็นสมาชิก หรือ mine=true = ทุกสาขาที่เป็นสมาชิกใน query เดียว
+    member_user_id = user.id if mine and not user.is_owner else None
+    if not user.is_owner:
+        if branch_id is None and member_user_id is None:
+            raise HTTPException(400, "branch_id is required for non-owner (or use mine=true)")
+        if branch_id is not None:
+            user.require_branch(branch_id)
+    order_by = order_by or ("branch" if mine else "id")
 
-    return crud.get_products(
-        db=db,
-        skip=skip,
-        limit=limit,
+    try:
+        fields = crud.parse_product_fields(fields)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    filters = dict(
         name=name,
         category=category,
         min_price=min_price,
         max_price=max_price,
         branch_id=branch_id,
+        member_user_id=member_user_id,
+    )
+
+    # cache ตาม (สาขา, filter, หน้า, fields) — ตรวจสิทธิ์ข้างบนแล้ว, เนื้อหาไม่ขึ้นกับ user (ยกเว้น mine)
+    if member_user_id is not None and branch_id is None:
+        scope = response_cache.scopes_of(user.branch_roles)   # หมดอายุเมื่อสาขาใดของ user เปลี่ยน
+    else:
+        scope = response_cache.scope_of(branch_id)
+    key = response_cache.cache_key(
+        scope,
+        skip=skip, limit=limit, paginate=paginate, order_by=order_by, cursor=cursor, fields=fields, **filters,
     )
+    entry = response_cache.lookup(key)
+    if entry is not None:
+        return response_cache.respond(request, entry, hit=True)
+
+    # SELECT เฉพาะคอลัมน์ → row tuple (ไม่สร้าง ORM object, ไม่ผ่าน pydantic)
+    columns = crud.product_columns(fields, order_by)
+
+    # โหมด cursor: ส่ง cursor มา = ใช้โหมดนี้อัตโนมัติ
+    if paginate == "cursor" or cursor is not None:
+        try:
+            data = crud.get_products_page(db=db, limit=limit, order_by=order_by, cursor=cursor, columns=columns, **filters)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    else:
+        data = crud.get_product_rows(
+            db=db,
+            skip=skip,
+            limit=limit,
+            order_by=order_by,
+            columns=columns,
+            **filters,
+        )
+    return response_cache.respond(request, response_cache.store(key, data, fields), hit=False)
+
+# --------------- Export (CSV / NDJSON แบบ stream) ---------------
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_chunks(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(crud.EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows([_export_value(v) for v in row] for row in batch)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(crud.EXPORT_COLUMNS, map(_export_value, row))), ensure_ascii=False) + "\n"
+            for row in batch
+        )
+
+
+@app.get("/products/export")
+def export_products(
+    format: Literal["csv", "ndjson"] = Query("csv"),
+    name: str | None = None,
+    category: str | None = None,
+    min_price: float | None = Query(None, ge=0),
+    max_price: float | None = Query(None, ge=0),
+    branch_id: int | None = Query(None),
+    order_by: Literal["id", "branch", "name"] = Query("id"),
+    user: AuthContext = Depends(get_claims_context),
+):
+    # สิทธิ์เหมือน GET /products/: Non-owner ต้องระบุสาขาที่เป็นสมาชิก
+    if not user.is_owner:
+        if branch_id is None:
+            raise HTTPException(400, "branch_id is required for non-owner")
+        user.require_branch(branch_id)
+
+    batches = crud.iter_product_rows(
+        engine, order_by=order_by,
+        name=name, category=category, min_price=min_price, max_price=max_price, branch_id=branch_id,
+    )
+    filename = f"products-{branch_id if branch_id is not None else 'all'}.{format}"
+    if format == "csv":
+        body, media_type = _csv_chunks(batches), "text/csv; charset=utf-8"
+    else:
+        body, media_type = _ndjson_chunks(batches), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+# --------------- Search (ranked) + Autocomplete ---------------
+def _visible_branch_ids(user: AuthContext, branch_id: int | None) -> list[int] | None:
+    # Owner: ไม่จำกัด (หรือเฉพาะ branch_id ที่ขอ) / Non-owner: ต้องระบุ branch_id ที่เป็นสมาชิก
+    if branch_id is None:
+        if user.is_owner:
+            return None
+        raise HTTPException(400, "branch_id is required for non-owner")
+    user.require_branch(branch_id)
+    return [branch_id]
+
+
+@app.get("/products/search")
+def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    branch_id: int | None = Query(None),
+    category: str | None = None,
+    limit: int = Query(20, gt=0, le=100),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    hits = crud.search_products(db, q, branch_ids=_visible_branch_ids(user, branch_id), category=category, limit=limit)
+    return [
+        {**schemas.Product.model_validate(p).model_dump(), "score": round(score, 4)}
+        for p, score in hits
+    ]
+
+
+@app.get("/products/autocomplete", response_model=List[str])
+def autocomplete_products(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    branch_id: int | None = Query(None),
+    limit: int = Query(10, gt=0, le=50),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    return crud.autocomplete_products(db, prefix, branch_ids=_visible_branch_ids(user, branch_id), limit=limit)
+
+
+# --------------- Nearby stock ---------------
+@app.get("/products/nearby", response_model=List[schemas.BranchStock])
+def read_nearby_stock(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    name: str | None = Query(None, min_length=1, max_length=255),
+    category: str | None = Query(None, min_length=1, max_length=100),
+    radius_km: float | None = Query(None, gt=0, le=20000),   # ไม่ส่ง = k สาขาใกล้สุดไม่จำกัดระยะ
+    k: int = Query(10, gt=0, le=100),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    # สาขาใกล้สุดที่มีของ — เห็นได้ทุกสาขา (เหมือน /branches/) แต่คืนแค่ยอดรวม ไม่คืนรายการสินค้าของสาขาอื่น
+    if name is None and category is None:
+        raise HTTPException(400, "name or category is required")
+    hits = crud.nearby_stock(
+        db, lat, lng, name=name, category=category,
+        radius_m=radius_km * 1000 if radius_km is not None else None, k=k,
+    )
+    return [
+        {
+            "branch_id": b.id,
+            "branch_name": b.name,
+            "address": b.address,
+            "latitude": b.latitude,
+            "longitude": b.longitude,
+            "distance_km": round(distance / 1000, 3),
+            "quantity": quantity,
+            "product_count": product_count,
+        }
+        for b, quantity, product_count, distance in hits
+    ]
+
+
+# --------------- Delta sync (offline client) ---------------
+@app.get("/products/changes", response_model=schemas.ProductChanges)
+def read_product_changes(
+    branch_id: int | None = Query(None),
+    since: str | None = Query(None),            # next_token จากรอบก่อน (ไม่ส่ง = snapshot ครั้งแรก)
+    limit: int = Query(500, gt=0, le=5000),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    try:
+        return crud.get_product_changes(db, branch_ids=_visible_branch_ids(user, branch_id), since=since, limit=limit)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+# --------------- Low stock (watchlist) ---------------
+@app.get("/products/low-stock", response_model=List[schemas.Product])
+def read_low_stock(
+    branch_id: int | None = Query(None),
+    category: str | None = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, gt=0, le=1000),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    # quantity <= reorder_threshold ของแต่ละสินค้า (เกณฑ์เดียวกับแจ้งเตือนและ low_stock_count)
+    return crud.get_low_stock(
+        db, branch_ids=_visible_branch_ids(user, branch_id), category=category, skip=skip, limit=limit,
+    )
+
+
+# --------------- Read many (multi-get) ---------------
+@app.get("/products/batch", response_model=schemas.ProductBatch)
+def read_products_batch(
+    ids: str = Query(..., description="product id คั่นด้วยจุลภาค เช่น 12,7,30"),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    # แทนการเรียก GET /products/{id} ทีละตัว (สแกนบาร์โค้ด / ตะกร้า): query เดียว + ตรวจสิทธิ์ครั้งเดียวต่อสาขา
+    try:
+        ids = crud.parse_product_ids(ids)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    found = crud.get_products_by_ids(db, ids)
+    allowed = user.member_branches({p.branch_id for p in found.values()})
+    return {
+        "items": [found[i] for i in ids if i in found and found[i].branch_id in allowed],
+        "missing": [i for i in ids if i not in found],
+        "forbidden": [i for i in ids if i in found and found[i].branch_id not in allowed],
+    }
+
 
 # --------------- Read one ---------------
 @app.get("/products/{product_id}", response_model=schemas.Product)
 def read_product(
     product_id: int,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: AuthContext = Depends(get_claims_context),
 ):
     obj = crud.get_product(db, product_id)
     if not obj:
         raise HTTPException(status_code=404, detail="Product not found")
-    if user.global_role != GlobalRole.OWNER:
-        require_branch_member(obj.branch_id)(db=db, user=user)
+    user.require_branch(obj.branch_id)
     return obj
 
 
 
+# --------------- Stock movements (ledger) ---------------
+@app.get("/products/{product_id}/movements", response_model=List[schemas.StockMovement])
+def read_product_movements(
+    product_id: int,
+    since: datetime | None = Query(None),
+    until: datetime | None = Query(None),
+    limit: int = Query(100, gt=0, le=1000),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    # ประวัติยังอยู่แม้สินค้าถูกลบ/ย้าย → กรองตามสาขาที่ user เป็นสมาชิก แทนการดูสาขาปัจจุบันของสินค้า
+    branch_ids = None if user.is_owner else list(user.branch_roles)
+    return crud.get_stock_movements(
+        db, branch_ids=branch_ids, product_id=product_id, since=since, until=until, limit=limit,
+    )
+
+
+@app.get("/branches/{branch_id}/movements", response_model=List[schemas.StockMovement])
+def read_branch_movements(
+    branch_id: int,
+    product_id: int | None = Query(None),
+    since: datetime | None = Query(None),
+    until: datetime | None = Query(None),
+    limit: int = Query(100, gt=0, le=1000),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    user.require_branch(branch_id)
+    return crud.get_stock_movements(
+        db, branch_ids=[branch_id], product_id=product_id, since=since, until=until, limit=limit,
+    )
+
+
 # --------------- Update ---------------
 @app.put("/products/{product_id}", response_model=schemas.Product)
 def update_product(
     product_id: int,
     patch: schemas.ProductUpdate,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: AuthContext = Depends(get_auth_context),
 ):
     current = crud.get_product(db, product_id)
     if not current:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Owner: แก้ได้ทุก field
-    if user.global_role == GlobalRole.OWNER:
-        updated = crud.update_product(db, product_id, patch)
-    else:
-        # ต้องเป็นสมาชิกสาขานี้
-        require_branch_member(current.branch_id)(db=db, user=user)
-
-        ur = db.query(UserBranchRole).filter_by(
-            user_id=user.id,
-            branch_id=current.branch_id,
-        ).first()
-        if not ur:
-            raise HTTPException(403, "Not a member of this branch")
-
-        if ur.role == BranchRole.MANAGER:
-            updated = crud.update_product(db, product_id, patch)
-        else:
-            # STAFF: อัปเดตได้เฉพาะ quantity
-            if patch.quantity is None or any([
-                patch.name is not None,
-                patch.price is not None,
-                patch.category is not None,
-                patch.image_url is not None,
-                patch.branch_id is not None,
-            ]):
-                raise HTTPException(403, "Staff can only update quantity")
-
-            updated = crud.update_product(
-                db, product_id, schemas.ProductUpdate(quantity=patch.quantity)
-            )
-
-    # ==== แจ้งเตือน FCM แบบใช้ helper ====
-    if patch.quantity is not None:
-        title = None
-        body = None
-
-        if patch.quantity == 0:
-            title = "สินค้าหมดสต็อก"
-            body = f"{updated.name} หมดแล้วในสาขา ID {updated.branch_id}"
-        elif patch.quantity <= 5:
-            title = "สินค้าใกล้หมด"
-            body = f"{updated.name} เหลือเพียง {patch.quantity} ชิ้น"
-
-        if title:
-            send_inventory_notification(title, body)
+    # ต้องเป็นสมาชิกสาขานี้ (Owner ได้ None) / Staff แก้ได้เฉพาะ quantity
+    role = user.require_branch(current.branch_id)
+    try:
+        updated = crud.update_product(db, product_id, restrict_patch(user, role, patch), user_id=user.id)
+    except crud.DuplicateProductError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    # ==== แจ้งเตือน FCM (ผ่านคิว background ไม่รอ FCM) ====
+    if patch.quantity is not None or patch.reorder_threshold is not None:
+        notify_stock_level(updated)
 
     return updated
 
 
+# --------------- Adjust stock (delta) ---------------
+def _adjust_error(e: crud.StockAdjustError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+@app.post("/products/adjust", response_model=List[schemas.StockLevel])
+def adjust_stock_batch(
+    items: List[schemas.StockAdjustmentItem],
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_auth_context),
+):
+    # Staff ก็ปรับจำนวนได้ (เหมือน PUT quantity) — ทั้งชุดสำเร็จหรือไม่สำเร็จพร้อมกัน
+    branch_ids = None if user.is_owner else list(user.branch_roles)
+    try:
+        rows = crud.adjust_stock_batch(db, items, branch_ids=branch_ids, user_id=user.id)
+    except crud.StockAdjustError as e:
+        raise _adjust_error(e)
+
+    for row in rows:
+        notify_stock_level(row)
+    return rows
+
+
+@app.post("/products/{product_id}/adjust", response_model=schemas.StockLevel)
+def adjust_stock(
+    product_id: int,
+    adj: schemas.StockAdjustment,
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_auth_context),
+):
+    branch_ids = None if user.is_owner else list(user.branch_roles)
+    try:
+        row = crud.adjust_stock(
+            db, product_id, adj.delta, adj.expected_version,
+            branch_ids=branch_ids, user_id=user.id, reason=adj.reason,
+        )
+    except crud.StockAdjustError as e:
+        raise _adjust_error(e)
+
+    notify_stock_level(row)
+    return row
+
+
 # --------------- Delete ---------------
 @app.delete("/products/{product_id}")
 def delete_product(
     product_id: int,
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    user: AuthContext = Depends(get_auth_context),
 ):
     obj = crud.get_product(db, product_id)
     if not obj:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    if user.global_role == GlobalRole.OWNER:
-        ok = crud.delete_product(db, product_id)
-        return {"deleted": ok, "id": product_id}
-
-    # Manager เท่านั้นในสาขาตน
-    require_branch_member(obj.branch_id, min_role=BranchRole.MANAGER)(db=db, user=user)
-    ok = crud.delete_product(db, product_id)
+    # Owner ผ่าน / Manager เท่านั้นในสาขาตน
+    user.require_branch(obj.branch_id, min_role=BranchRole.MANAGER)
+    ok = crud.delete_product(db, product_id, user_id=user.id)
     return {"deleted": ok, "id": product_id}
+
+
+# --------------- Inventory analytics (อ่านจาก inventory_summary) ---------------
+def _analytics_scope(user: AuthContext, branch_id: int | None) -> list[int] | None:
+    # Owner: ทุกสาขา / Non-owner: เฉพาะสาขาที่เป็นสมาชิก
+    if branch_id is not None:
+        user.require_branch(branch_id)
+        return [branch_id]
+    return None if user.is_owner else list(user.branch_roles)
+
+
+@app.get("/analytics/summary", response_model=schemas.InventoryTotals)
+def read_inventory_totals(
+    branch_id: int | None = Query(None),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    return crud.get_inventory_summary(db, branch_ids=_analytics_scope(user, branch_id))[0]
+
+
+@app.get("/analytics/branches", response_model=List[schemas.BranchInventory])
+def read_inventory_by_branch(
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    return crud.get_inventory_summary(db, branch_ids=_analytics_scope(user, None), group_by="branch")
+
+
+@app.get("/analytics/categories", response_model=List[schemas.CategoryInventory])
+def read_inventory_by_category(
+    branch_id: int | None = Query(None),
+    db: Session = Depends(get_db),
+    user: AuthContext = Depends(get_claims_context),
+):
+    return crud.get_inventory_summary(db, branch_ids=_analytics_scope(user, branch_id), group_by="category")
+
+
+@app.post("/analytics/refresh", response_model=schemas.InventoryTotals)
+def refresh_inventory_summary(
+    branch_id: int | None = Query(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(require_owner),          # Owner เท่านั้น
+):
+    # คำนวณใหม่จาก products (ใช้หลังแก้ข้อมูลนอกแอป หรือถ้าสงสัยว่าค่าเพี้ยน)
+    branch_ids = [branch_id] if branch_id is not None else None
+    crud.refresh_inventory_summary(db, branch_ids)
+    return crud.get_inventory_summary(db, branch_ids=branch_ids)[0]
+
+
+# ----- Async stack (DB_ASYNC=1): ใช้ handler async แทน endpoint สินค้า/สาขาด้านบน -----
+if DB_ASYNC:
+    import async_routes
+    async_routes.install(app)
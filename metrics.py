@@ -0,0 +1,334 @@
+# metrics.py
+"""
+Telemetry ในโปรเซส (ไม่ต้องมี prometheus_client):
+
+- RequestMetricsMiddleware: latency ต่อ route + จำนวน/เวลา query ต่อ request + header Server-Timing
+- instrument_engine: จับเวลาทุก query (event ของ SQLAlchemy), log query ที่ช้าเกิน SLOW_QUERY_SECONDS
+  และ query เดียวกันที่ถูกเรียกซ้ำใน request เดียวเกิน REPEATED_QUERY_THRESHOLD ครั้ง (N+1)
+- external_call("fcm"): จับเวลางานที่ block ไปหาระบบนอก (Firebase, Cloudinary)
+- render_prometheus(): ทั้งหมดในรูปแบบ text ของ Prometheus (GET /metrics — owner เท่านั้น เว้นแต่ METRICS_PUBLIC=1)
+
+ข้อมูลต่อ request อยู่ใน contextvar — endpoint แบบ sync ที่รันใน threadpool ก็เห็น (context ถูก copy ไปด้วย)
+งานใน thread ของเราเอง (import_jobs, notification_dispatcher) ไม่มี request → นับเฉพาะค่ารวม
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.2"))
+REPEATED_QUERY_THRESHOLD = int(os.getenv("REPEATED_QUERY_THRESHOLD", "10"))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+# GET /metrics* เปิดโดยไม่ต้อง login เฉพาะเมื่อตั้ง METRICS_PUBLIC=1 (เช่น Prometheus scrape ในเครือข่ายภายใน)
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"
+
+logger = logging.getLogger("inventory.perf")
+
+
+class Histogram:
+    """
+    Histogram แบบ bucket สะสม (รูปแบบเดียวกับ Prometheus: le = ขอบบน, หน่วยวินาที)
+    """
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)   # ช่องสุดท้าย = +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, running = {}, 0
+        for le, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative["+Inf" if le == float("inf") else str(le)] = running
+        return {"buckets": cumulative, "count": running, "sum": total}
+
+
+# ===== Connection pool =====
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _InstrumentedPoolMixin:
+    """
+    จับเวลารอ connection ตอน checkout และนับครั้งที่ pool timeout
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_seconds = Histogram(POOL_WAIT_BUCKETS)
+        self.timeouts = 0
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        self.wait_seconds.observe(time.perf_counter() - t0)
+        return conn
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_stats(engine) -> dict | None:
+    if engine is None:
+        return None
+    pool = engine.pool
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, _InstrumentedPoolMixin):
+        stats.update(timeouts=pool.timeouts, checkout_wait_seconds=pool.wait_seconds.snapshot())
+    return stats
+
+
+# ===== Request / query / external call =====
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+EXTERNAL_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class HistogramFamily:
+    """Histogram แยกตาม label (เช่น method/route/status)"""
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self._children: dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> Histogram:
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, Histogram(self.buckets))
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in sorted(self._children.items()):
+            lines += _histogram_lines(self.name, list(zip(self.label_names, values)), child.snapshot())
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _histogram_lines(name: str, pairs: list, snap: dict) -> list[str]:
+    lines = [f"{name}_bucket{_labels(pairs + [('le', le)])} {n}" for le, n in snap["buckets"].items()]
+    lines.append(f"{name}_sum{_labels(pairs)} {snap['sum']}")
+    lines.append(f"{name}_count{_labels(pairs)} {snap['count']}")
+    return lines
+
+
+REQUEST_SECONDS = HistogramFamily(
+    "http_request_duration_seconds", "Request latency by route.", ("method", "route", "status"), LATENCY_BUCKETS)
+REQUEST_QUERIES = HistogramFamily(
+    "http_request_db_queries", "SQL statements executed per request.", ("method", "route"), QUERY_COUNT_BUCKETS)
+REQUEST_DB_SECONDS = HistogramFamily(
+    "http_request_db_seconds", "Time spent in SQL per request.", ("method", "route"), LATENCY_BUCKETS)
+QUERY_SECONDS = HistogramFamily(
+    "db_query_duration_seconds", "SQL statement latency.", (), QUERY_BUCKETS)
+EXTERNAL_SECONDS = HistogramFamily(
+    "external_call_duration_seconds", "Blocking calls to external services.", ("service", "outcome"), EXTERNAL_BUCKETS)
+
+_counters: Counter = Counter()      # slow_queries / repeated_queries (ค่ารวม)
+_counters_lock = threading.Lock()
+
+
+def _count(name: str) -> None:
+    with _counters_lock:
+        _counters[name] += 1
+
+
+@dataclass
+class RequestStats:
+    db_count: int = 0
+    db_seconds: float = 0.0
+    external: dict[str, float] = field(default_factory=dict)
+    statements: Counter = field(default_factory=Counter)
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def instrument_engine(sync_engine) -> None:
+    """จับเวลาทุก statement ของ engine นี้ (async engine ให้ส่ง .sync_engine มา)"""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        QUERY_SECONDS.labels().observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.db_count += 1
+            stats.db_seconds += elapsed
+            stats.statements[statement] += 1
+        if elapsed >= SLOW_QUERY_SECONDS:
+            _count("slow_queries")
+            logger.warning("slow query %.1f ms: %s", elapsed * 1000, _shorten(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _discard(context):
+        # statement ที่ error ไม่ผ่าน after_cursor_execute — ทิ้งเวลาเริ่มไว้ไม่ให้ค้างใน stack
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def _shorten(statement: str, limit: int = 500) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + " ..."
+
+
+@contextmanager
+def external_call(service: str):
+    """
+    with external_call("cloudinary"): ... — นับทั้งค่ารวม (histogram) และเวลาใน request ปัจจุบัน (Server-Timing)
+    """
+    outcome = "error"
+    t0 = time.perf_counter()
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - t0
+        EXTERNAL_SECONDS.labels(service, outcome).observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.external[service] = stats.external.get(service, 0.0) + elapsed
+
+
+def _server_timing(stats: RequestStats, total: float) -> str:
+    parts = [f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_count} queries"']
+    parts += [f"{service};dur={seconds * 1000:.1f}" for service, seconds in stats.external.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def _route_of(scope) -> str:
+    # ใช้ path template (/products/{product_id}) ไม่ใช่ path จริง — จำนวน label ไม่บาน
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware (ไม่ใช่ BaseHTTPMiddleware: ไม่ต้องพัก response / ใช้กับ StreamingResponse ได้)"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    header = _server_timing(stats, time.perf_counter() - t0)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+            self._record(scope, stats, status, time.perf_counter() - t0)
+
+    @staticmethod
+    def _record(scope, stats: RequestStats, status: int, elapsed: float) -> None:
+        method, route = scope["method"], _route_of(scope)
+        REQUEST_SECONDS.labels(method, route, f"{status // 100}xx").observe(elapsed)
+        REQUEST_QUERIES.labels(method, route).observe(stats.db_count)
+        REQUEST_DB_SECONDS.labels(method, route).observe(stats.db_seconds)
+
+        repeated = [(sql, n) for sql, n in stats.statements.items() if n >= REPEATED_QUERY_THRESHOLD]
+        for statement, n in repeated:
+            _count("repeated_queries")
+            logger.warning("possible N+1 in %s %s: same query ran %d times: %s", method, route, n, _shorten(statement))
+
+
+# ===== Prometheus text format =====
+POOL_GAUGES = (
+    ("db_pool_size", "size", "Configured pool size."),
+    ("db_pool_checked_out", "checked_out", "Connections currently checked out."),
+    ("db_pool_overflow", "overflow", "Connections opened beyond pool_size."),
+)
+
+
+def _pool_lines(engines: dict) -> list[str]:
+    stats = {name: pool_stats(engine) for name, engine in engines.items()}
+    stats = {name: s for name, s in stats.items() if s and "size" in s}
+    lines = []
+    for metric, key, help in POOL_GAUGES:
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} gauge"]
+        lines += [f"{metric}{_labels([('engine', name)])} {s[key]}" for name, s in stats.items()]
+    instrumented = {name: s for name, s in stats.items() if "timeouts" in s}
+    lines += ["# HELP db_pool_timeouts_total Checkouts that hit pool_timeout.", "# TYPE db_pool_timeouts_total counter"]
+    lines += [f"db_pool_timeouts_total{_labels([('engine', name)])} {s['timeouts']}" for name, s in instrumented.items()]
+    lines += ["# HELP db_pool_checkout_wait_seconds Time waiting for a pooled connection.",
+              "# TYPE db_pool_checkout_wait_seconds histogram"]
+    for name, s in instrumented.items():
+        lines += _histogram_lines("db_pool_checkout_wait_seconds", [("engine", name)], s["checkout_wait_seconds"])
+    return lines
+
+
+def render_prometheus(engines: dict) -> str:
+    """engines = {"sync": engine, "async": async_engine.sync_engine หรือ None}"""
+    lines = []
+    for family in (REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS, QUERY_SECONDS, EXTERNAL_SECONDS):
+        lines += family.render()
+    for name, help in (("slow_queries", "Statements slower than SLOW_QUERY_SECONDS."),
+                       ("repeated_queries", "Statements repeated REPEATED_QUERY_THRESHOLD+ times in one request.")):
+        lines += [f"# HELP db_{name}_total {help}", f"# TYPE db_{name}_total counter", f"db_{name}_total {_counters[name]}"]
+    lines += _pool_lines({name: engine for name, engine in engines.items() if engine is not None})
+    return "\n".join(lines) + "\n"
@@ -1,11 +1,12 @@
 # models.py
 import enum as pyenum
 from sqlalchemy import (
-    Column, Integer, String, Float, DateTime, ForeignKey, Index, UniqueConstraint, func
+    Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Index, UniqueConstraint, func
 )
 from sqlalchemy.types import Enum as SAEnum   # <<< ใช้ SAEnum เป็นของ SQLAlchemy เท่านั้น
 from sqlalchemy.orm import relationship
 from database import Base
+from notification_dispatcher import LOW_STOCK_THRESHOLD
 
 # ===== Global role (ทั้งระบบ) =====
 class UserGlobalRole(pyenum.Enum):           # <<< ใช้ Python enum
@@ -30,6 +31,14 @@ class Branch(Base):
 
     products = relationship("Product", back_populates="branch", cascade="all, delete-orphan")
 
+# หาสาขาใกล้ที่สุด (PostgreSQL เท่านั้น, ต้องมี extension cube + earthdistance):
+# GiST บนจุด 3 มิติของ ll_to_earth ใช้ได้ทั้ง earth_box (@>) ในรัศมี และ ORDER BY <-> (k ใกล้สุด)
+Index(
+    "ix_branches_location_earth", func.ll_to_earth(Branch.latitude, Branch.longitude),
+    postgresql_using="gist",
+    postgresql_where=Branch.latitude.isnot(None) & Branch.longitude.isnot(None),
+).ddl_if(dialect="postgresql")
+
 class Product(Base):
     __tablename__ = "products"
     id = Column(Integer, primary_key=True, index=True)
@@ -43,8 +52,100 @@ class Product(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     unit = Column(String(50), nullable=True)
+    # เพิ่มขึ้นทุกครั้งที่แก้ไข — ใช้ทำ optimistic concurrency (expected_version)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    # quantity <= reorder_threshold = ใกล้หมด (แจ้งเตือน / inventory_summary.low_stock_count / GET /products/low-stock)
+    reorder_threshold = Column(
+        Integer, nullable=False, default=LOW_STOCK_THRESHOLD, server_default=str(LOW_STOCK_THRESHOLD),
+    )
 
 Index("ix_products_name_category_branch", Product.name, Product.category, Product.branch_id)
+# สำหรับ keyset pagination (ORDER BY branch_id, id / name, id)
+Index("ix_products_branch_id_id", Product.branch_id, Product.id)
+Index("ix_products_name_id", Product.name, Product.id)
+# ค้นหาชื่อ (PostgreSQL เท่านั้น, ต้องมี extension pg_trgm):
+# - GIN trigram ใช้ได้กับ word similarity (<%) และ ILIKE '%...%'
+# - lower(name) text_pattern_ops สำหรับ autocomplete แบบ prefix
+Index(
+    "ix_products_name_trgm", Product.name,
+    postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_products_name_lower_prefix", func.lower(Product.name),
+    postgresql_ops={"lower": "text_pattern_ops"},
+).ddl_if(dialect="postgresql")
+# รายการใกล้หมดต่อสาขา: partial index เก็บเฉพาะแถวที่ต่ำกว่า threshold (ไม่กี่แถวแม้ catalog ใหญ่)
+Index(
+    "ix_products_low_stock", Product.branch_id, Product.quantity, Product.id,
+    postgresql_where=Product.quantity <= Product.reorder_threshold,
+    sqlite_where=Product.quantity <= Product.reorder_threshold,
+)
+# natural key สำหรับ bulk upsert (INSERT ... ON CONFLICT (name, branch_id))
+Index("uq_products_name_branch", Product.name, Product.branch_id, unique=True)
+# delta sync: แถวที่เปลี่ยนในสาขาหลังเวลาหนึ่ง (ORDER BY changed_at, id)
+Index(
+    "ix_products_branch_changed",
+    Product.branch_id, func.coalesce(Product.updated_at, Product.created_at), Product.id,
+)
+
+class ProductTombstone(Base):
+    """
+    บันทึกสินค้าที่หายไปจากสาขา (ถูกลบ หรือย้ายไปสาขาอื่น) ให้ client ที่ sync แบบ delta ลบออกจากเครื่อง
+    """
+    __tablename__ = "product_tombstones"
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)     # ไม่ผูก FK — แถวสินค้าถูกลบไปแล้ว
+    branch_id = Column(Integer, ForeignKey("branches.id", ondelete="CASCADE"), nullable=False)
+    deleted_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+Index("ix_product_tombstones_branch_deleted", ProductTombstone.branch_id, ProductTombstone.deleted_at, ProductTombstone.id)
+
+class StockMovement(Base):
+    """
+    สมุดบัญชีการเปลี่ยน quantity (append-only) — เขียนใน transaction เดียวกับการแก้ products เสมอ
+    บน PostgreSQL ตารางแบ่ง partition รายเดือนตาม created_at (สร้างใน migration + crud.ensure_stock_movement_partitions)
+    ไม่มี FK เพื่อให้ insert ถูกที่สุด และเก็บประวัติไว้ได้แม้สินค้า/ผู้ใช้ถูกลบ
+    """
+    __tablename__ = "stock_movements"
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    branch_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=True)          # None = ระบบ / ไม่ทราบ
+    delta = Column(Integer, nullable=False)
+    quantity_after = Column(Integer, nullable=False)
+    reason = Column(String(32), nullable=False)       # create / update / adjust / bulk / delete / transfer_in / transfer_out หรือที่ client ส่งมา
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+# ช่วงเวลา: BRIN เล็กมากและแทบไม่เพิ่มต้นทุน insert (ข้อมูลเรียงตามเวลาอยู่แล้ว)
+Index("ix_stock_movements_created_brin", StockMovement.created_at, postgresql_using="brin").ddl_if(dialect="postgresql")
+Index("ix_stock_movements_product_created", StockMovement.product_id, StockMovement.created_at)
+
+class InventorySummary(Base):
+    """
+    aggregate ของสินค้าต่อ (สาขา, หมวด) — crud ปรับค่าแบบ += ในทุก transaction ที่เขียน products
+    category = "" แทนสินค้าที่ไม่มีหมวด (คีย์หลักเป็น NULL ไม่ได้)
+    """
+    __tablename__ = "inventory_summary"
+    branch_id = Column(Integer, ForeignKey("branches.id", ondelete="CASCADE"), primary_key=True)
+    category = Column(String(100), primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_quantity = Column(Integer, nullable=False, default=0, server_default="0")
+    total_value = Column(Float, nullable=False, default=0, server_default="0")     # sum(price * quantity)
+    low_stock_count = Column(Integer, nullable=False, default=0, server_default="0")
+    out_of_stock_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+class ImageAsset(Base):
+    """
+    รูปที่อัปโหลดแล้ว คีย์ด้วย SHA-256 ของไฟล์ต้นฉบับ — อัปรูปเดิมซ้ำได้ URL เดิมโดยไม่อัปขึ้น storage อีก
+    """
+    __tablename__ = "image_assets"
+    sha256 = Column(String(64), primary_key=True)
+    image_url = Column(String(512), nullable=False)
+    content_type = Column(String(100), nullable=True)
+    size_bytes = Column(Integer, nullable=False)
+    hit_count = Column(Integer, nullable=False, default=0, server_default="0")   # จำนวนครั้งที่ได้จาก dedup
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
 
 class User(Base):
     __tablename__ = "users"
@@ -68,6 +169,9 @@ class User(Base):
     # default branch (optional)
     default_branch_id = Column(Integer, ForeignKey("branches.id"), nullable=True)
 
+    # เพิ่มขึ้นทุกครั้งที่ role ในสาขาเปลี่ยน — ใช้ตรวจว่า roles ใน JWT ยังใช้ได้อยู่ไหม
+    role_version = Column(Integer, nullable=False, default=0, server_default="0")
+
     branch_roles = relationship("UserBranchRole", back_populates="user", cascade="all, delete-orphan")
 
 class UserBranchRole(Base):
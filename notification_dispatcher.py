@@ -0,0 +1,227 @@
+# notification_dispatcher.py
+"""
+ส่งแจ้งเตือนสต็อกต่ำแบบ background — request ไม่ต้องรอ FCM
+
+- endpoint เรียก observe() ทุกครั้งที่ quantity เปลี่ยน (ใส่คิวแล้วกลับทันที)
+- worker thread รวมเหตุการณ์ในช่วง NOTIFY_COALESCE_SECONDS ให้เหลือค่าล่าสุดต่อสินค้า
+- แจ้งเตือนเฉพาะตอนระดับแย่ลง (ปกติ → ใกล้หมด → หมด) ไม่ส่งซ้ำระหว่างที่ยังต่ำกว่า threshold
+- ส่งเป็น batch ผ่าน sink (firebase / local) และ retry แบบ backoff
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+NOTIFY_SINK = os.getenv("NOTIFY_SINK", "firebase")          # firebase | local
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "2"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+NOTIFY_RETRY_BACKOFF_SECONDS = float(os.getenv("NOTIFY_RETRY_BACKOFF_SECONDS", "1"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+
+# ค่าเริ่มต้นของ products.reorder_threshold (แต่ละสินค้าตั้งเองได้)
+LOW_STOCK_THRESHOLD = 5
+
+# ระดับความรุนแรง: ส่งแจ้งเตือนเมื่อระดับสูงขึ้นเท่านั้น
+LEVEL_RANK = {None: 0, "low": 1, "out": 2}
+
+
+@dataclass(frozen=True)
+class StockAlert:
+    product_id: int
+    name: str
+    branch_id: int
+    quantity: int
+    threshold: int = LOW_STOCK_THRESHOLD     # reorder_threshold ของสินค้า
+
+    @property
+    def level(self) -> Optional[str]:
+        if self.quantity <= 0:
+            return "out"
+        if self.quantity <= self.threshold:
+            return "low"
+        return None
+
+    def message(self) -> tuple[str, str]:
+        if self.level == "out":
+            return "สินค้าหมดสต็อก", f"{self.name} หมดแล้วในสาขา ID {self.branch_id}"
+        return "สินค้าใกล้หมด", f"{self.name} เหลือเพียง {self.quantity} ชิ้น"
+
+
+class FirebaseSink:
+    def send(self, alerts: list[StockAlert]) -> list[bool]:
+        from firebase_utils import send_inventory_notifications
+        return send_inventory_notifications([a.message() for a in alerts])
+
+
+class LocalSink:
+    """
+    เก็บแจ้งเตือนไว้ในหน่วยความจำ (ใช้ตอน dev / test ที่ไม่มี Firebase)
+    """
+    def __init__(self, maxlen: int = 1000):
+        self.sent: deque = deque(maxlen=maxlen)
+
+    def send(self, alerts: list[StockAlert]) -> list[bool]:
+        for alert in alerts:
+            title, body = alert.message()
+            print(f"📢 [local] {title} - {body}")
+            self.sent.append(alert)
+        return [True] * len(alerts)
+
+
+SINKS = {"firebase": FirebaseSink, "local": LocalSink}
+
+
+class AlertDispatcher:
+    def __init__(
+        self,
+        sink,
+        window: float = NOTIFY_COALESCE_SECONDS,
+        max_retries: int = NOTIFY_MAX_RETRIES,
+        backoff: float = NOTIFY_RETRY_BACKOFF_SECONDS,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+    ):
+        self.sink = sink
+        self.window = window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._levels: dict[int, Optional[str]] = {}   # product_id -> ระดับที่แจ้งไปล่าสุด (ใช้ dedup)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    # ----- ฝั่ง request -----
+    def observe(self, product_id: int, name: str, branch_id: int, quantity: int, threshold: int = LOW_STOCK_THRESHOLD) -> None:
+        """
+        แจ้งว่า quantity (หรือ threshold) ของสินค้าเปลี่ยน (เรียกได้ทุกครั้ง ไม่บล็อก)
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(StockAlert(product_id, name, branch_id, quantity, threshold))
+        except queue.Full:
+            self.dropped += 1
+
+    # ----- lifecycle -----
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stock-alerts", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def flush(self) -> None:
+        """รอจนคิวว่างและส่งครบ (ใช้ใน test / ตอนปิดระบบ)"""
+        self._queue.join()
+
+    # ----- worker -----
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._queue.task_done()
+                return
+
+            # รวมเหตุการณ์ในหน้าต่างเวลา: เหลือค่าล่าสุดต่อสินค้า
+            latest = {first.product_id: first}
+            taken, stop = 1, False
+            deadline = time.monotonic() + self.window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                taken += 1
+                if item is None:
+                    stop = True
+                    break
+                latest[item.product_id] = item
+
+            try:
+                self._dispatch(list(latest.values()))
+            except Exception as e:
+                print(f"❌ stock-alerts worker error: {e}")
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _dispatch(self, snapshots: list[StockAlert]) -> None:
+        pending = []
+        for alert in snapshots:
+            level = alert.level
+            sent = self._levels.get(alert.product_id)
+            if level is None:
+                self._levels.pop(alert.product_id, None)   # กลับมาปกติ → แจ้งใหม่ได้ครั้งหน้า
+            elif LEVEL_RANK[level] > LEVEL_RANK[sent]:
+                pending.append(alert)
+            else:
+                self._levels[alert.product_id] = level     # ยังต่ำอยู่ / ดีขึ้นบางส่วน → ไม่ส่งซ้ำ
+
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                return
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                results = self.sink.send(pending)
+            except Exception as e:
+                print(f"❌ แจ้งเตือนล้มเหลว: {e}")
+                results = [False] * len(pending)
+
+            failed = []
+            for alert, ok in zip(pending, results):
+                if ok:
+                    self._levels[alert.product_id] = alert.level
+                else:
+                    failed.append(alert)
+            pending = failed
+
+        if pending:
+            print(f"❌ ทิ้งแจ้งเตือน {len(pending)} รายการหลัง retry {self.max_retries} ครั้ง")
+
+
+_dispatcher: Optional[AlertDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> AlertDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = AlertDispatcher(SINKS[NOTIFY_SINK]())
+                atexit.register(lambda: _dispatcher and _dispatcher.stop())
+    return _dispatcher
+
+
+def set_dispatcher(dispatcher: AlertDispatcher) -> AlertDispatcher:
+    """เปลี่ยน dispatcher (เช่น ใช้ LocalSink + window=0 ตอน test)"""
+    global _dispatcher
+    if _dispatcher is not None:
+        _dispatcher.stop()
+    _dispatcher = dispatcher
+    return dispatcher
+
+
+def notify_stock_level(product) -> None:
+    """
+    เรียกหลัง quantity / reorder_threshold เปลี่ยน — dispatcher ตัดสินเองว่าต้องแจ้งไหม (dedup ระหว่างที่ยังต่ำกว่า threshold)
+    product = ORM object หรือ row จาก adjust_stock_statement (มี reorder_threshold)
+    """
+    get_dispatcher().observe(product.id, product.name, product.branch_id, product.quantity, product.reorder_threshold)
@@ -1,6 +1,8 @@
 import firebase_admin
 from firebase_admin import credentials, messaging
 
+from metrics import external_call
+
 cred = credentials.Certificate("serviceAccountKey.json")
 firebase_admin.initialize_app(cred)
 
@@ -12,6 +14,7 @@ def send_fcm_to_tokens(tokens: list[str], title: str, body: str, data: dict | No
         notification=messaging.Notification(title=title, body=body),
         data={k: str(v) for k, v in (data or {}).items()},
     )
-    resp = messaging.send_multicast(message)
+    with external_call("fcm"):
+        resp = messaging.send_multicast(message)
     print(f"✅ ส่งแจ้งเตือนสำเร็จ {resp.success_count} เครื่อง, ล้มเหลว {resp.failure_count} เครื่อง")
     return resp
\ No newline at end of file
@@ -0,0 +1,159 @@
+# passwords.py
+"""
+Hash / ตรวจรหัสผ่านนอก request path
+
+- ตั้ง scheme และ cost ได้ (PASSWORD_HASH_SCHEME / PASSWORD_HASH_ROUNDS)
+- ตรวจได้ทุก scheme ที่รู้จัก (รวม bcrypt จาก seed_roles.py) — hash ที่ scheme / cost ไม่ตรงค่าปัจจุบัน
+  ได้ hash ใหม่กลับไปด้วย ให้ login เขียนทับ (rehash ตอน login ครั้งถัดไป ไม่ต้อง migrate ทั้งตาราง)
+- งาน hash รันใน process pool ของตัวเอง (PASSWORD_HASH_WORKERS โปรเซส) ช่วง login พร้อมกันมาก ๆ
+  ใช้ CPU ได้ไม่เกินจำนวนนั้น ที่เหลือยังตอบ request อื่นได้, งานรอคิวเกิน PASSWORD_HASH_QUEUE ตอบ 503
+- endpoint ใช้ *_async: รอผลบน event loop (asyncio.wrap_future) ไม่ยึด thread ของ threadpool ระหว่างรอ
+  login ที่ค้างคิวจึงไม่ทำให้ endpoint แบบ sync อื่นไม่มี thread ใช้ — แบบ sync มีไว้ให้สคริปต์ (seed) เท่านั้น
+
+process pool ใช้ spawn (ปลอดภัยกับโปรเซสที่มีหลาย thread): สคริปต์ที่เรียก hash_password ตรง ๆ
+ต้องมี if __name__ == "__main__" หรือตั้ง PASSWORD_HASH_WORKERS=0 (hash ใน thread ที่เรียกเหมือนเดิม)
+"""
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "pbkdf2_sha256")      # pbkdf2_sha256 | bcrypt
+PASSWORD_HASH_ROUNDS = os.getenv("PASSWORD_HASH_ROUNDS")                         # ไม่ตั้ง = ค่าเริ่มต้นของ passlib
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))                # งานที่รอคิวได้ เกินนี้ตอบ 503
+
+SCHEMES = ("pbkdf2_sha256", "bcrypt")
+
+
+class PasswordHashError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _context() -> CryptContext:
+    if PASSWORD_HASH_SCHEME not in SCHEMES:
+        raise RuntimeError(f"PASSWORD_HASH_SCHEME must be one of: {', '.join(SCHEMES)}")
+    settings = {}
+    if PASSWORD_HASH_ROUNDS:
+        # min = max = default → hash เดิมที่ cost ต่างจากนี้ (ทั้งต่ำและสูงกว่า) ถูก rehash
+        rounds = int(PASSWORD_HASH_ROUNDS)
+        for key in ("default_rounds", "min_rounds", "max_rounds"):
+            settings[f"{PASSWORD_HASH_SCHEME}__{key}"] = rounds
+    # deprecated="auto": ทุก scheme ที่ไม่ใช่ default ต้อง rehash
+    return CryptContext(schemes=list(SCHEMES), default=PASSWORD_HASH_SCHEME, deprecated="auto", **settings)
+
+
+context = _context()
+
+
+# ---------- รันใน worker process ----------
+def _hash(raw: str) -> str:
+    return context.hash(raw)
+
+
+def _verify_and_update(raw: str, hashed: str) -> tuple[bool, Optional[str]]:
+    try:
+        return context.verify_and_update(raw, hashed)
+    except ValueError:      # hash เสีย / scheme ที่ไม่รู้จัก = รหัสผ่านไม่ถูก
+        return False, None
+
+
+# ---------- Pool ----------
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+_in_flight = 0
+
+
+def start() -> None:
+    """สร้าง pool และ worker ล่วงหน้า (เรียกตอน app start — login แรกไม่ต้องรอ spawn)"""
+    global _executor
+    if PASSWORD_HASH_WORKERS <= 0 or _executor is not None:
+        return
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+            )
+    for future in [_executor.submit(_hash, "") for _ in range(PASSWORD_HASH_WORKERS)]:
+        future.result()
+
+
+def shutdown() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+atexit.register(shutdown)
+
+
+def _admit() -> None:
+    """จองที่ในคิว — เกิน PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE งานที่ค้างอยู่ตอบ 503 ทันที"""
+    global _in_flight
+    with _lock:
+        if _in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE:
+            raise PasswordHashError(503, "Too many logins in progress, retry shortly")
+        _in_flight += 1
+
+
+def _release() -> None:
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+
+
+def _run(fn, *args):
+    """แบบ sync (สคริปต์): thread ที่เรียกรอจนได้ผล"""
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+    _admit()
+    try:
+        if _executor is None:
+            start()
+        return _executor.submit(fn, *args).result()
+    finally:
+        _release()
+
+
+async def _run_async(fn, *args):
+    """
+    แบบ async (endpoint): รอผลจาก worker process บน event loop — ไม่มี thread ไหนถูกยึดระหว่างรอ
+    PASSWORD_HASH_WORKERS=0 = hash ใน threadpool แบบเดิม (ไม่มีคิว)
+    """
+    if PASSWORD_HASH_WORKERS <= 0:
+        return await run_in_threadpool(fn, *args)
+    _admit()
+    try:
+        if _executor is None:
+            await run_in_threadpool(start)
+        return await asyncio.wrap_future(_executor.submit(fn, *args))
+    finally:
+        _release()
+
+
+def hash_password(raw: str) -> str:
+    return _run(_hash, raw)
+
+
+def verify_and_update(raw: str, hashed: str) -> tuple[bool, Optional[str]]:
+    """คืน (ถูกต้องไหม, hash ใหม่ถ้าต้อง rehash ตาม scheme / cost ปัจจุบัน ไม่งั้น None)"""
+    return _run(_verify_and_update, raw, hashed)
+
+
+async def hash_password_async(raw: str) -> str:
+    return await _run_async(_hash, raw)
+
+
+async def verify_and_update_async(raw: str, hashed: str) -> tuple[bool, Optional[str]]:
+    return await _run_async(_verify_and_update, raw, hashed)
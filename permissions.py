@@ -1,12 +1,197 @@
 # permissions.py
-from fastapi import Depends, HTTPException
+import os
+from dataclasses import dataclass
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
 
-from database import get_db
+from database import get_db, get_async_db
 from models import User, UserBranchRole, BranchRoleEnum as BranchRole, UserGlobalRole as GlobalRole
 
-from auth import get_current_user
+import schemas
+from auth import get_current_user, decode_token, oauth2_scheme
+from cache import auth_contexts, role_versions
+
+# เทียบลำดับสิทธิ์: MANAGER > STAFF
+ROLE_ORDER = {BranchRole.MANAGER: 2, BranchRole.STAFF: 1}
+
+# ปิดได้ด้วย AUTH_CLAIMS_FAST_PATH=0 (จะกลับไปใช้ get_auth_context ทุก endpoint)
+AUTH_CLAIMS_FAST_PATH = os.getenv("AUTH_CLAIMS_FAST_PATH", "1") == "1"
+
+
+@dataclass(frozen=True)
+class AuthContext:
+    """
+    ข้อมูลสิทธิ์ของ user ที่ resolve ครั้งเดียว (user + role ทุกสาขา)
+    ใช้แทน User ใน endpoint ได้ (มี id / username / global_role เหมือนกัน)
+    """
+    id: int
+    username: str
+    global_role: GlobalRole
+    branch_roles: dict[int, BranchRole]
+    role_version: int = 0
+
+    @property
+    def is_owner(self) -> bool:
+        return self.global_role == GlobalRole.OWNER
+
+    def require_branch(self, branch_id: int, min_role: Optional[BranchRole] = None) -> Optional[BranchRole]:
+        """
+        ตรวจสิทธิ์ในสาขาจากข้อมูลในหน่วยความจำ (ไม่ query DB)
+        คืน role ในสาขานั้น (Owner คืน None)
+        """
+        if self.is_owner:
+            return None
+
+        role = self.branch_roles.get(branch_id)
+        if role is None:
+            raise HTTPException(status_code=403, detail="Not a member of this branch")
+
+        if min_role is not None and ROLE_ORDER[role] < ROLE_ORDER[min_role]:
+            raise HTTPException(status_code=403, detail="Insufficient branch role")
+        return role
+
+    def member_branches(self, branch_ids) -> set[int]:
+        """สาขาใน branch_ids ที่เห็นได้ (ตรวจทีเดียวทั้งชุด เช่น multi-get ที่มีสินค้าหลายสาขา)"""
+        if self.is_owner:
+            return set(branch_ids)
+        return {b for b in branch_ids if b in self.branch_roles}
+
+
+def restrict_patch(user: AuthContext, role: Optional[BranchRole], patch: schemas.ProductUpdate) -> schemas.ProductUpdate:
+    """
+    Owner / Manager: แก้ได้ทุก field
+    STAFF: อัปเดตได้เฉพาะ quantity
+    """
+    if user.is_owner or role == BranchRole.MANAGER:
+        return patch
+
+    if patch.quantity is None or any([
+        patch.name is not None,
+        patch.price is not None,
+        patch.category is not None,
+        patch.image_url is not None,
+        patch.branch_id is not None,
+        patch.reorder_threshold is not None,
+    ]):
+        raise HTTPException(403, "Staff can only update quantity")
+    return schemas.ProductUpdate(quantity=patch.quantity)
+
+
+def _auth_context_statement(user_id: Optional[int] = None, username: Optional[str] = None):
+    # user + role ทุกสาขาใน query เดียว (outer join)
+    q = select(User, UserBranchRole.branch_id, UserBranchRole.role).outerjoin(
+        UserBranchRole, UserBranchRole.user_id == User.id
+    )
+    return q.where(User.id == user_id) if user_id is not None else q.where(User.username == username)
+
+
+def _cache_auth_context(rows) -> Optional[AuthContext]:
+    if not rows:
+        return None
+
+    user = rows[0][0]
+    ctx = AuthContext(
+        id=user.id,
+        username=user.username,
+        global_role=user.global_role,
+        branch_roles={branch_id: role for _, branch_id, role in rows if branch_id is not None},
+        role_version=user.role_version,
+    )
+    auth_contexts.set(ctx.id, ctx)
+    role_versions.set(ctx.id, ctx.role_version)
+    return ctx
+
+
+def load_auth_context(db: Session, user_id: Optional[int] = None, username: Optional[str] = None) -> Optional[AuthContext]:
+    """
+    ดึง user + role ทุกสาขาใน query เดียว แล้วเก็บลง cache
+    """
+    return _cache_auth_context(db.execute(_auth_context_statement(user_id, username)).all())
+
+
+async def load_auth_context_async(db: AsyncSession, user_id: Optional[int] = None, username: Optional[str] = None) -> Optional[AuthContext]:
+    return _cache_auth_context((await db.execute(_auth_context_statement(user_id, username))).all())
+
+
+def _cached_context(payload: dict) -> Optional[AuthContext]:
+    uid = payload.get("uid")
+    ctx = auth_contexts.get(uid) if uid is not None else None
+    return ctx if ctx is not None and ctx.username == payload["sub"] else None
+
+
+def _claims_context(payload: dict) -> Optional[AuthContext]:
+    """
+    เชื่อ roles ที่อยู่ใน JWT (ลายเซ็นถูกต้องแล้ว) ถ้า rv ตรงกับ role_version ล่าสุดที่โปรเซสนี้รู้
+    """
+    uid, rv, roles = payload.get("uid"), payload.get("rv"), payload.get("roles")
+    if not AUTH_CLAIMS_FAST_PATH or uid is None or rv is None or roles is None:
+        return None
+    if role_versions.get(uid) != rv:
+        return None
+    try:
+        return AuthContext(
+            id=uid,
+            username=payload["sub"],
+            global_role=GlobalRole(payload["global_role"]),
+            branch_roles={int(b): BranchRole(r) for b, r in roles.items()},
+            role_version=rv,
+        )
+    except (KeyError, ValueError, AttributeError):
+        return None   # claims ผิดรูปแบบ → ไปทางปกติ
+
+
+def _user_not_found() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+
+def _resolve_context(db: Session, payload: dict) -> AuthContext:
+    ctx = _cached_context(payload) or load_auth_context(db, username=payload["sub"])
+    if ctx is None:
+        raise _user_not_found()
+    return ctx
+
+
+async def _resolve_context_async(db: AsyncSession, payload: dict) -> AuthContext:
+    ctx = _cached_context(payload) or await load_auth_context_async(db, username=payload["sub"])
+    if ctx is None:
+        raise _user_not_found()
+    return ctx
+
+
+def get_auth_context(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> AuthContext:
+    """
+    Dependency แทน get_current_user สำหรับ endpoint ที่ใช้บ่อย:
+    cache hit = ไม่มี round-trip ไป DB เลย (ทั้งหา user และเช็ค role)
+    """
+    return _resolve_context(db, decode_token(token))
+
+
+def get_claims_context(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> AuthContext:
+    """
+    สำหรับ endpoint อ่านอย่างเดียว: ถ้า roles ใน token ยังเป็นปัจจุบัน — ไม่แตะ DB เลย
+    ถ้าไม่รู้ version หรือ token เก่ากว่า (role ถูกเปลี่ยนหลัง login) → ใช้ทางเดียวกับ get_auth_context
+    """
+    payload = decode_token(token)
+    return _claims_context(payload) or _resolve_context(db, payload)
+
+
+# ----- async (DB_ASYNC=1) -----
+async def get_auth_context_async(db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)) -> AuthContext:
+    return await _resolve_context_async(db, decode_token(token))
+
+
+async def get_claims_context_async(db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)) -> AuthContext:
+    payload = decode_token(token)
+    return _claims_context(payload) or await _resolve_context_async(db, payload)
+
+
+def get_branch_roles(db: Session, user_id: int) -> dict[int, BranchRole]:
+    ctx = auth_contexts.get(user_id) or load_auth_context(db, user_id=user_id)
+    return ctx.branch_roles if ctx else {}
+
 
 def require_branch_member(branch_id: int, min_role: Optional[BranchRole] = None):
     """
@@ -22,21 +207,16 @@ def require_branch_member(branch_id: int, min_role: Optional[BranchRole] = None)
         if user.global_role == GlobalRole.OWNER:
             return user
 
-        # หา role ของ user ในสาขานี้
-        ur = db.query(UserBranchRole).filter(
-            UserBranchRole.user_id == user.id,
-            UserBranchRole.branch_id == branch_id
-        ).first()
+        # หา role ของ user ในสาขานี้ (ผ่าน cache ของ AuthContext)
+        role = get_branch_roles(db, user.id).get(branch_id)
 
-        if not ur:
+        if role is None:
             raise HTTPException(status_code=403, detail="Not a member of this branch")
 
         if min_role is None:
             return user
 
-        # เทียบลำดับสิทธิ์: MANAGER > STAFF
-        order = {BranchRole.MANAGER: 2, BranchRole.STAFF: 1}
-        if order[ur.role] < order[min_role]:
+        if ROLE_ORDER[role] < ROLE_ORDER[min_role]:
             raise HTTPException(status_code=403, detail="Insufficient branch role")
         return user
     return wrapper
@@ -0,0 +1,229 @@
+# response_cache.py
+"""
+Cache ผลลัพธ์ GET /products/ (JSON ที่ serialize แล้ว) ตาม (ขอบเขตสาขา, filter, หน้า)
+
+- ล้างแบบ generation: ทุกขอบเขต (สาขา / "all") มีเลข generation อยู่ใน key
+  เมื่อสินค้าในสาขาเปลี่ยน (cache.products_changed) → bump generation ของสาขานั้นและ "all"
+  entry เก่าจะไม่ถูกอ่านอีกและหลุดออกไปเองตาม LRU / TTL
+- ETag = hash ของ body, Last-Modified = max(updated_at/created_at) ของแถวใน response
+  client ส่ง If-None-Match มา และยังตรงกัน → 304 (ไม่ต้องส่ง body ซ้ำ)
+- backend: memory (ต่อโปรเซส, ค่าเริ่มต้น) / redis (ใช้ร่วมกันหลาย worker) / none (ปิด cache)
+  backend memory: worker อื่นที่เขียนข้อมูลจะเห็นผลในโปรเซสนี้ช้าสุดไม่เกิน RESPONSE_CACHE_TTL_SECONDS
+- serialize ตรงจาก row tuple (crud.product_columns) ด้วย orjson — ไม่ผ่าน ORM object / pydantic
+  ได้ JSON หน้าตาเดียวกับ schemas.Product (ไม่มี orjson = ใช้ json ของ stdlib แทน)
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from operator import itemgetter
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+from cache import TTLCache, on_products_changed
+from image_storage import thumbnail_url
+
+try:   # optional: เร็วกว่า json ของ stdlib หลายเท่า (ไม่มี = ใช้ json แทน)
+    import orjson
+except ImportError:
+    orjson = None
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")   # memory | redis | none
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+ALL_BRANCHES = "all"
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    body: bytes
+    etag: str
+    last_modified: Optional[str] = None
+
+
+# ---------- Backends ----------
+class MemoryBackend:
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        return self._entries.get(key)
+
+    def set(self, key: str, value: CachedResponse) -> None:
+        self._entries.set(key, value)
+
+    def generation(self, scope: str) -> int:
+        return self._generations.get(scope, 0)
+
+    def bump(self, scope: str) -> None:
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class RedisBackend:
+    """interface เดียวกับ MemoryBackend — ต้องติดตั้ง redis (pip install redis)"""
+    PREFIX = "inventory:products:"
+
+    def __init__(self, url: str, ttl: float):
+        import redis   # optional dependency: import เฉพาะตอนเลือกใช้
+
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = max(int(ttl), 1)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        raw = self._redis.get(self.PREFIX + key)
+        if raw is None:
+            return None
+        meta, _, body = raw.partition(b"\n")
+        return CachedResponse(body=body, **json.loads(meta))
+
+    def set(self, key: str, value: CachedResponse) -> None:
+        meta = json.dumps({"etag": value.etag, "last_modified": value.last_modified}).encode()
+        self._redis.set(self.PREFIX + key, meta + b"\n" + value.body, ex=self._ttl)
+
+    def generation(self, scope: str) -> int:
+        return int(self._redis.get(f"{self.PREFIX}gen:{scope}") or 0)
+
+    def bump(self, scope: str) -> None:
+        self._redis.incr(f"{self.PREFIX}gen:{scope}")
+
+    def clear(self) -> None:
+        for key in self._redis.scan_iter(match=self.PREFIX + "*"):
+            self._redis.delete(key)
+
+
+def _make_backend():
+    if RESPONSE_CACHE_BACKEND == "none":
+        return None
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend(REDIS_URL, RESPONSE_CACHE_TTL_SECONDS)
+    if RESPONSE_CACHE_BACKEND == "memory":
+        return MemoryBackend(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS)
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {RESPONSE_CACHE_BACKEND}")
+
+
+backend = _make_backend()
+
+
+@on_products_changed
+def invalidate(branch_ids) -> None:
+    if backend is None:
+        return
+    for branch_id in branch_ids:
+        backend.bump(str(branch_id))
+    backend.bump(ALL_BRANCHES)   # list แบบไม่ระบุสาขา (Owner) เห็นทุกสาขา
+
+
+# ---------- Key / entry ----------
+def scope_of(branch_id: Optional[int]) -> str:
+    return ALL_BRANCHES if branch_id is None else str(branch_id)
+
+
+def scopes_of(branch_ids) -> tuple[str, ...]:
+    """หลายสาขาในหน้าเดียว (โหมด mine): entry หมดอายุเมื่อสาขาใดสาขาหนึ่งเปลี่ยน"""
+    return tuple(str(b) for b in sorted(branch_ids))
+
+
+def cache_key(scope: str | tuple[str, ...], **params) -> Optional[str]:
+    """
+    อ่าน generation ก่อน query: ถ้ามีการเขียนระหว่าง query, entry ที่ได้จะอยู่ใต้ generation เก่า
+    (ไม่มีใครอ่านถึง) — ไม่มีทางเสิร์ฟข้อมูลเก่าหลัง invalidate
+    """
+    if backend is None:
+        return None
+    scopes = (scope,) if isinstance(scope, str) else scope
+    generations = ",".join(f"{s}:{backend.generation(s)}" for s in scopes)
+    parts = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return f"{generations}:{parts}"
+
+
+def _last_modified(rows) -> Optional[str]:
+    stamps = [ts for ts in (row.updated_at or row.created_at for row in rows) if ts is not None]
+    if not stamps:
+        return None
+    latest = max(stamps)
+    if latest.tzinfo is None:   # SQLite เก็บเวลาแบบไม่มี timezone (เป็น UTC)
+        latest = latest.replace(tzinfo=timezone.utc)
+    return format_datetime(latest, usegmt=True)
+
+
+# ---------- Serialize ----------
+def _json_default(value):
+    if isinstance(value, datetime):
+        # รูปแบบเดียวกับ pydantic / orjson (OPT_UTC_Z): UTC ลงท้ายด้วย Z
+        return value.isoformat().replace("+00:00", "Z")
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_UTC_Z)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode()
+
+
+def lean_items(rows, fields: tuple[str, ...]) -> list[dict]:
+    """
+    row tuple → dict เฉพาะ fields ที่ขอ (thumbnail_url คิดจาก image_url)
+    rows มาจาก crud.product_columns(fields) ซึ่งมีคอลัมน์เกินมาได้ (คีย์เรียง, created_at/updated_at)
+    """
+    if not rows:
+        return []
+    names = [f for f in fields if f != "thumbnail_url"]
+    positions = [rows[0]._fields.index(f) for f in names]
+    pick = itemgetter(*positions) if len(positions) > 1 else (lambda row: tuple(row[i] for i in positions))
+    if "thumbnail_url" not in fields:
+        return [dict(zip(names, pick(row))) for row in rows]
+
+    image = rows[0]._fields.index("image_url")
+    return [{**dict(zip(names, pick(row))), "thumbnail_url": thumbnail_url(row[image])} for row in rows]
+
+
+def build_entry(data: Any, fields: tuple[str, ...]) -> CachedResponse:
+    """serialize ครั้งเดียวตอน cache miss"""
+    rows = data["items"] if isinstance(data, dict) else data
+    items = lean_items(rows, fields)
+    payload = {**data, "items": items} if isinstance(data, dict) else items
+    body = dumps(payload)
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return CachedResponse(body=body, etag=etag, last_modified=_last_modified(rows))
+
+
+def lookup(key: Optional[str]) -> Optional[CachedResponse]:
+    return backend.get(key) if key is not None else None
+
+
+def store(key: Optional[str], data: Any, fields: tuple[str, ...]) -> CachedResponse:
+    entry = build_entry(data, fields)
+    if key is not None:
+        backend.set(key, entry)
+    return entry
+
+
+def respond(request: Request, entry: CachedResponse, hit: bool) -> Response:
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": "private, no-cache",   # client เก็บได้ แต่ต้อง revalidate ทุกครั้ง
+        "X-Cache": "HIT" if hit else "MISS",
+    }
+    if entry.last_modified:
+        headers["Last-Modified"] = entry.last_modified
+
+    # ใช้ If-None-Match อย่างเดียว: การลบสินค้าไม่ขยับ updated_at, If-Modified-Since จึงเชื่อไม่ได้
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or entry.etag in {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
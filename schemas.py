@@ -1,7 +1,10 @@
-from pydantic import BaseModel , Field, EmailStr, field_validator
+from pydantic import BaseModel , Field, EmailStr, field_validator, computed_field
 from typing import Optional , Literal , List
+from datetime import datetime
 # schemas.py
 from models import UserGlobalRole as GlobalRole, BranchRoleEnum as BranchRole
+from image_storage import thumbnail_url
+from notification_dispatcher import LOW_STOCK_THRESHOLD
 
 
 class BranchBase(BaseModel):
@@ -27,6 +30,7 @@ class ProductBase(BaseModel):
     image_url: Optional[str] = None
     branch_id: int      # ต้องส่งมาเสมอ
     unit: Optional[str] = None 
+    reorder_threshold: int = Field(LOW_STOCK_THRESHOLD, ge=0)   # quantity <= ค่านี้ = ใกล้หมด
 
 class ProductCreate(ProductBase): pass
 
@@ -38,9 +42,128 @@ class ProductUpdate(BaseModel):
     image_url: Optional[str] = None
     branch_id: Optional[int] = None
     unit: Optional[str] = None 
+    reorder_threshold: Optional[int] = Field(None, ge=0)
 
 class Product(ProductBase):
     id: int
+    version: int = 0
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    model_config = {"from_attributes": True}
+
+    @computed_field
+    @property
+    def thumbnail_url(self) -> Optional[str]:
+        # รูปย่อสำหรับหน้า list (ดู image_storage.thumbnail_url)
+        return thumbnail_url(self.image_url)
+
+# ---------- Multi-get ----------
+class ProductBatch(BaseModel):
+    items: List[Product]        # ตามลำดับ ids ที่ขอ
+    missing: List[int]          # ไม่มีสินค้า id นี้
+    forbidden: List[int]        # มีอยู่แต่อยู่ในสาขาที่ไม่ได้สังกัด
+
+# ---------- Nearby stock ----------
+class BranchStock(BaseModel):
+    branch_id: int
+    branch_name: str
+    address: Optional[str] = None
+    latitude: float
+    longitude: float
+    distance_km: float
+    quantity: int           # รวมทุกสินค้าที่ตรงชื่อ / หมวด (เฉพาะที่ quantity > 0)
+    product_count: int
+
+# ---------- Delta sync ----------
+class ProductChanges(BaseModel):
+    upserted: List[Product]         # เพิ่มใหม่ / แก้ไข หลัง token เดิม
+    deleted: List[int]              # product_id ที่ต้องลบออกจากเครื่อง
+    next_token: str                 # ส่งกลับมาเป็น since ในครั้งถัดไป
+    has_more: bool                  # True = เรียกต่อทันทีด้วย next_token
+
+# ---------- Inventory analytics ----------
+class InventoryTotals(BaseModel):
+    product_count: int
+    total_quantity: int
+    total_value: float              # sum(price * quantity)
+    low_stock_count: int
+    out_of_stock_count: int
+    model_config = {"from_attributes": True}
+
+class BranchInventory(InventoryTotals):
+    branch_id: int
+    branch_name: str
+
+class CategoryInventory(InventoryTotals):
+    category: Optional[str] = None
+
+    @field_validator("category")
+    @classmethod
+    def _blank_to_none(cls, v):
+        # inventory_summary เก็บ "" แทนสินค้าที่ไม่มีหมวด
+        return v or None
+
+# ---------- Stock adjustment (delta) ----------
+class StockAdjustment(BaseModel):
+    delta: int                                  # บวก = รับเข้า, ลบ = ตัดออก
+    expected_version: Optional[int] = None      # ถ้าส่งมา ต้องตรงกับ version ปัจจุบัน
+    reason: str = Field("adjust", min_length=1, max_length=32)   # บันทึกลง stock_movements เช่น sale / restock / damage
+
+class StockAdjustmentItem(StockAdjustment):
+    product_id: int
+
+class StockLevel(BaseModel):
+    id: int
+    name: str
+    branch_id: int
+    quantity: int
+    version: int
+    model_config = {"from_attributes": True}
+
+# ---------- Stock movement ledger ----------
+class StockMovement(BaseModel):
+    id: int
+    product_id: int
+    branch_id: int
+    user_id: Optional[int] = None
+    delta: int
+    quantity_after: int
+    reason: str
+    created_at: datetime
+    model_config = {"from_attributes": True}
+
+# ---------- Bulk upsert ----------
+class BulkRowError(BaseModel):
+    index: int          # ลำดับแถวใน array / บรรทัดใน NDJSON (เริ่มที่ 0)
+    error: str
+
+class BulkUpsertResult(BaseModel):
+    received: int
+    upserted: int
+    errors: List[BulkRowError] = []
+
+# ---------- CSV import (งานเบื้องหลัง) ----------
+class ImportRowError(BaseModel):
+    line: int           # เลขบรรทัดในไฟล์ (header = บรรทัด 1)
+    error: str
+
+class ImportJob(BaseModel):
+    id: str
+    status: Literal["queued", "running", "done", "failed"]
+    filename: Optional[str] = None
+    size_bytes: int
+    bytes_read: int
+    progress: float     # 0.0 - 1.0 (ตามจำนวน byte ที่อ่านแล้ว)
+    rows_read: int
+    inserted: int
+    updated: int
+    unchanged: int
+    failed: int
+    errors_truncated: bool = False   # error เกิน IMPORT_MAX_ERRORS → เก็บรายละเอียดไว้เฉพาะช่วงแรก
+    message: Optional[str] = None    # สาเหตุเมื่อ status = failed
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
     model_config = {"from_attributes": True}
 
 
@@ -0,0 +1,149 @@
+# search_index.py
+"""
+Index ค้นหาชื่อสินค้าในหน่วยความจำ — ใช้แทน pg_trgm เมื่อไม่ได้ใช้ PostgreSQL (เช่น SQLite ตอน test)
+คิดคะแนนใกล้เคียง word_similarity() ของ pg_trgm: เทียบคำค้นกับช่วงคำที่ติดกันในชื่อสินค้า
+(ชื่อสินค้ายาวกว่าคำค้นมาก similarity() ทั้งสตริงจึงได้คะแนนต่ำเกินไป)
+"""
+import re
+import threading
+from bisect import bisect_left
+
+from sqlalchemy import func, select
+
+import models
+from cache import on_products_changed
+
+# ค่าเดียวกับ pg_trgm.word_similarity_threshold
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def trigrams(text: str) -> set[str]:
+    """แยก trigram แบบ pg_trgm: ตัวพิมพ์เล็ก, เติมช่องว่าง 2 ตัวหน้า 1 ตัวหลังแต่ละคำ"""
+    result = set()
+    for word in _WORD.findall(text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def word_grams(text: str) -> list[set[str]]:
+    """trigram แยกตามคำ (trigram ของช่วงคำ = union ของ trigram แต่ละคำในช่วง)"""
+    return [trigrams(word) for word in _WORD.findall(text.lower())]
+
+
+def word_similarity(query: set[str], query_words: int, name_words: list[set[str]]) -> float:
+    """คะแนนสูงสุดของคำค้นเทียบกับทุกช่วงคำติดกันในชื่อ (ยาวเท่าจำนวนคำของคำค้น ±1)"""
+    best = 0.0
+    for size in {max(query_words - 1, 1), query_words, query_words + 1}:
+        for i in range(max(len(name_words) - size + 1, 1)):
+            best = max(best, similarity(query, set().union(*name_words[i:i + size])))
+    return best
+
+
+class TrigramIndex:
+    def __init__(self):
+        self._docs: dict[int, tuple[str, int, str | None, list[set[str]]]] = {}   # id -> (name, branch_id, category, trigram รายคำ)
+        self._postings: dict[str, set[int]] = {}
+        self._prefix: list[tuple[str, int]] = []                            # (lower(name), id) เรียงไว้สำหรับ autocomplete
+
+    @classmethod
+    def build(cls, rows) -> "TrigramIndex":
+        index = cls()
+        for product_id, name, branch_id, category in rows:
+            words = word_grams(name)
+            index._docs[product_id] = (name, branch_id, category, words)
+            for g in set().union(*words):
+                index._postings.setdefault(g, set()).add(product_id)
+            index._prefix.append((name.lower(), product_id))
+        index._prefix.sort()
+        return index
+
+    def _visible(self, product_id: int, branch_ids, category) -> bool:
+        _, branch_id, cat, _ = self._docs[product_id]
+        return (branch_ids is None or branch_id in branch_ids) and (category is None or cat == category)
+
+    def search(self, q: str, branch_ids=None, category=None, limit: int = 20) -> list[tuple[int, float]]:
+        """คืน [(product_id, score)] เรียงคะแนนมาก → น้อย (ผ่าน threshold หรือมีคำค้นอยู่ในชื่อ)"""
+        query = trigrams(q)
+        query_words = max(len(_WORD.findall(q)), 1)
+        needle = q.lower()
+        shared: dict[int, int] = {}
+        for g in query:
+            for product_id in self._postings.get(g, ()):
+                shared[product_id] = shared.get(product_id, 0) + 1
+
+        # word_similarity ไม่มีทางเกิน |trigram ร่วม| / |trigram คำค้น| → ตัดตัวที่ไม่มีทางผ่านได้ก่อน
+        min_shared = WORD_SIMILARITY_THRESHOLD * len(query)
+        scored = []
+        for product_id, count in shared.items():
+            if not self._visible(product_id, branch_ids, category):
+                continue
+            name, _, _, words = self._docs[product_id]
+            contains = needle in name.lower()
+            if count < min_shared and not contains:
+                continue
+            score = word_similarity(query, query_words, words)
+            if score >= WORD_SIMILARITY_THRESHOLD or contains:
+                scored.append((product_id, score))
+        scored.sort(key=lambda x: (-x[1], x[0]))
+        return scored[:limit]
+
+    def autocomplete(self, prefix: str, branch_ids=None, limit: int = 10) -> list[str]:
+        prefix = prefix.lower()
+        names: list[str] = []
+        i = bisect_left(self._prefix, (prefix, -1))
+        while i < len(self._prefix) and len(names) < limit:
+            key, product_id = self._prefix[i]
+            if not key.startswith(prefix):
+                break
+            name = self._docs[product_id][0]
+            if self._visible(product_id, branch_ids, None) and name not in names:
+                names.append(name)
+            i += 1
+        return names
+
+
+_index: TrigramIndex | None = None
+_signature: tuple | None = None     # ลายเซ็นของ products ตอนสร้าง _index
+_lock = threading.Lock()
+
+
+def signature_statement():
+    """
+    ลายเซ็นของตาราง products (aggregate แถวเดียว) — อ่านจากฐานข้อมูลจึงเห็นการเขียนจากทุก worker process
+    ไม่ใช่แค่ products_changed ใน process ตัวเอง (แบบเดียวกับ geo_index)
+    ทุกการแก้สินค้าบวก version → sum(version) เพิ่มเสมอ / เพิ่ม-ลบแถวเปลี่ยน count, max(id)
+    updated_at ของ SQLite ละเอียดแค่วินาที จึงใช้ประกอบเท่านั้น
+    """
+    P = models.Product
+    return select(func.count(), func.max(P.id), func.sum(P.version), func.max(func.coalesce(P.updated_at, P.created_at)))
+
+
+def get_index(db) -> TrigramIndex:
+    """
+    สร้าง index จากตาราง products ครั้งแรกที่ใช้ และเมื่อลายเซ็นไม่ตรงกับตอนสร้าง
+    อ่านลายเซ็นก่อนอ่านสินค้า แล้วตรวจ + สร้าง + เก็บภายใต้ _lock (เหตุผลเดียวกับ geo_index.get_index)
+    """
+    global _index, _signature
+    signature = tuple(db.execute(signature_statement()).one())
+    with _lock:
+        if _index is None or _signature != signature:
+            P = models.Product
+            _index = TrigramIndex.build(db.execute(select(P.id, P.name, P.branch_id, P.category)).all())
+            _signature = signature
+        return _index
+
+
+@on_products_changed
+def invalidate(branch_ids=None) -> None:
+    global _index
+    with _lock:
+        _index = None
@@ -0,0 +1,72 @@
+"""
+POST /products/bulk กับสินค้าที่มีอยู่แล้ว: แถวที่ส่งมาไม่ครบต้องแก้เฉพาะฟิลด์ที่ส่ง
+
+    python -m pytest tests/
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)      # main.py mount โฟลเดอร์ static แบบ relative
+
+_db = tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False)
+os.environ["DATABASE_URL"] = "sqlite:///" + _db.name
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import models  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def client():
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.add(models.Branch(id=1, name="branch-1"))
+        db.commit()
+    import main
+    with TestClient(main.app) as client:
+        client.post("/auth/register", json={"username": "owner", "password": "pw", "global_role": "owner"})
+        token = client.post("/auth/login", json={"username": "owner", "password": "pw"}).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        yield client
+    engine.dispose()
+    os.unlink(_db.name)
+
+
+def test_partial_row_keeps_unsent_columns(client):
+    created = client.post("/products/", json={
+        "name": "cola", "price": 10, "quantity": 50, "branch_id": 1,
+        "category": "cat", "image_url": "http://img/cola.png", "unit": "can", "reorder_threshold": 20,
+    }).json()
+
+    r = client.post("/products/bulk", json=[{"name": "cola", "price": 12, "quantity": 40, "branch_id": 1}])
+    assert r.status_code == 200
+    assert r.json()["upserted"] == 1
+
+    product = client.get(f"/products/{created['id']}").json()
+    assert (product["price"], product["quantity"]) == (12, 40)
+    assert product["category"] == "cat"
+    assert product["image_url"] == "http://img/cola.png"
+    assert product["unit"] == "can"
+    assert product["reorder_threshold"] == 20
+    assert product["version"] == created["version"] + 1
+
+
+def test_mixed_rows_in_one_chunk(client):
+    client.post("/products/", json={"name": "tea", "price": 5, "quantity": 5, "branch_id": 1, "category": "drinks"})
+    r = client.post("/products/bulk", json=[
+        {"name": "tea", "price": 6, "quantity": 5, "branch_id": 1, "reorder_threshold": 2},     # แก้ threshold
+        {"name": "milk", "price": 3, "quantity": 1, "branch_id": 1},                            # แถวใหม่
+        {"name": "tea2", "price": 1, "quantity": 1, "branch_id": 1, "category": None},          # ส่ง null มาตรง ๆ
+    ])
+    assert r.json() == {"received": 3, "upserted": 3, "errors": []}
+
+    by_name = {p["name"]: p for p in client.get("/products/?branch_id=1&limit=100").json()}
+    assert by_name["tea"]["category"] == "drinks"
+    assert by_name["tea"]["reorder_threshold"] == 2
+    assert by_name["milk"]["reorder_threshold"] == models.LOW_STOCK_THRESHOLD